@@ -0,0 +1,128 @@
+# benchmark.py
+
+import argparse
+import asyncio
+import sys
+import time
+import numpy as np
+from config import Config
+from embedding_model import EmbeddingModel, load_sentence_transformer
+
+SAMPLE_SENTENCES = [
+    "Vector databases store embeddings for similarity search.",
+    "def chunk_text(text, size): return [text[i:i + size] for i in range(0, len(text), size)]",
+    "Meeting notes: discussed the migration plan and the rollout schedule for next quarter.",
+    "The quick brown fox jumps over the lazy dog.",
+    "Error: connection reset by peer while uploading batch 12 of 40.",
+    "Obsidian templates add front matter with tags, dates and the project name.",
+]
+
+def sample_texts(count: int) -> list:
+    """
+    Builds distinct benchmark texts so no caching layer can short-circuit the work.
+    """
+    return [f"{SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)]} (sample {i})" for i in range(count)]
+
+async def time_embeddings(model: EmbeddingModel, texts: list) -> float:
+    """
+    Embeds all texts as concurrent generate_embedding calls and returns texts per second.
+    """
+    await model.generate_embedding("warm up", {})
+    start = time.perf_counter()
+    await asyncio.gather(*(model.generate_embedding(text, {}) for text in texts))
+    return len(texts) / (time.perf_counter() - start)
+
+async def benchmark_batching(config: Config, count: int) -> None:
+    """
+    Compares one encode call per text against micro-batched encoding.
+    """
+    texts = sample_texts(count)
+    config.embedding_cache_path = None
+    results = {}
+    for label, batch_size in (("single", 1), ("batched", config.embedding_batch_size)):
+        config.embedding_batch_size = batch_size
+        model = EmbeddingModel(config.model_name, config.device, config=config)
+        results[label] = await time_embeddings(model, texts)
+        print(f"{label:>8}: batch_size={batch_size:<4} {results[label]:10.1f} texts/s")
+    print(f" speedup: {results['batched'] / results['single']:.2f}x on {config.model_name} ({count} texts)")
+
+async def benchmark_pool(config: Config, count: int, worker_counts: list) -> None:
+    """
+    Compares in-process encoding against process pools of several sizes.
+    """
+    texts = sample_texts(count)
+    config.embedding_cache_path = None
+    results = {}
+    for workers in [0] + worker_counts:
+        config.embedding_workers = workers
+        model = EmbeddingModel(config.model_name, config.device, config=config)
+        try:
+            if workers:
+                # Start the workers and load their models before timing.
+                model.encode_batch(sample_texts(workers * 8))
+            results[workers] = await time_embeddings(model, texts)
+        finally:
+            model.close()
+        label = f"{workers} workers" if workers else "in-process"
+        print(f"{label:>11}: {results[workers]:10.1f} texts/s ({results[workers] / results[0]:.2f}x)")
+    print(f"{config.model_name}, {count} texts, batch_size={config.embedding_batch_size}")
+
+def _unit_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def runtime_parity(config: Config, runtime: str, count: int, min_cosine: float) -> bool:
+    """
+    Checks a runtime against the float PyTorch model and compares their throughput.
+
+    Parity is measured two ways: the cosine between each text's float and runtime vectors,
+    and the largest change in any pairwise text-to-text cosine similarity, which is what
+    search ranking depends on.
+
+    Returns:
+        bool: True if every per-text cosine is at least min_cosine.
+    """
+    texts = sample_texts(count)
+    vectors = {}
+    for name in ("torch", runtime):
+        model = load_sentence_transformer(config.model_name, config.device, name)
+        model.encode(texts[:config.embedding_batch_size], batch_size=config.embedding_batch_size)
+        start = time.perf_counter()
+        vectors[name] = _unit_rows(model.encode(texts, batch_size=config.embedding_batch_size))
+        rate = count / (time.perf_counter() - start)
+        print(f"{name:>9}: {rate:10.1f} texts/s")
+    reference, candidate = vectors["torch"], vectors[runtime]
+    cosines = np.sum(reference * candidate, axis=1)
+    drift = np.abs(reference @ reference.T - candidate @ candidate.T).max()
+    passed = bool(cosines.min() >= min_cosine)
+    print(
+        f"   parity: min cosine {cosines.min():.5f}, mean {cosines.mean():.5f}, "
+        f"max pairwise similarity drift {drift:.5f} -> {'PASS' if passed else 'FAIL'} (threshold {min_cosine})"
+    )
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    batching = subparsers.add_parser("batching", help="Single vs micro-batched generate_embedding.")
+    batching.add_argument("--texts", type=int, default=1024)
+    pool = subparsers.add_parser("pool", help="In-process vs multiprocess embedding workers.")
+    pool.add_argument("--texts", type=int, default=4096)
+    pool.add_argument("--workers", default="1,2,4,8", help="Comma-separated worker counts.")
+    runtime = subparsers.add_parser("runtime", help="Parity and throughput of an ONNX or quantized runtime vs torch.")
+    runtime.add_argument("--runtime", choices=["onnx", "quantized"], default="quantized")
+    runtime.add_argument("--texts", type=int, default=512)
+    runtime.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+    config = Config.load_default()
+    if args.benchmark == "batching":
+        asyncio.run(benchmark_batching(config, args.texts))
+    elif args.benchmark == "pool":
+        asyncio.run(benchmark_pool(config, args.texts, [int(n) for n in args.workers.split(",")]))
+    elif args.benchmark == "runtime":
+        if not runtime_parity(config, args.runtime, args.texts, args.min_cosine):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
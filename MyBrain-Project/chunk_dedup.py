@@ -0,0 +1,113 @@
+# chunk_dedup.py
+
+import asyncio
+import functools
+import hashlib
+import re
+import numpy as np
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_chunk_text(text: str) -> str:
+    """
+    Normalizes chunk text for duplicate detection by collapsing whitespace runs.
+    """
+    return WHITESPACE.sub(" ", text).strip()
+
+def chunk_text_hash(text: str) -> str:
+    """
+    Returns the hash that identifies duplicate chunks.
+    """
+    return hashlib.sha256(normalize_chunk_text(text).encode("utf-8")).hexdigest()
+
+class ChunkDeduplicator:
+    def __init__(self, max_entries: int = 5000):
+        """
+        Initializes a run-scoped deduplicator that embeds each distinct embedding input once.
+
+        Chunks are keyed by the hash of the whitespace-normalized string that is actually
+        embedded (the chunk text with its file metadata), so a chunk repeated in a file with
+        different front matter is embedded on its own. The first occurrence is embedded, in one
+        batch with the other new texts of its call; later occurrences, including ones that
+        arrive while it is still in flight, reuse its vector.
+        The most recent max_entries vectors are kept in memory as float32 arrays; older repeats
+        fall through to the embedding cache.
+
+        Parameters:
+            max_entries (int): Maximum number of distinct chunks remembered.
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be greater than 0.")
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.total = 0
+        self.unique = 0
+
+    async def embed_many(self, texts: List[str], embed_batch: Callable[[List[str]], Awaitable[List[list]]]) -> List[list]:
+        """
+        Returns the embeddings for texts, calling embed_batch() once with the texts not seen before.
+
+        Parameters:
+            texts (List[str]): The exact inputs embed_batch() embeds, e.g. EmbeddingProvider.build_context().
+            embed_batch (Callable[[List[str]], Awaitable[List[list]]]): Embeds a list of texts.
+
+        Returns:
+            List[list]: One vector per text, each a new list.
+
+        Raises:
+            Whatever embed_batch() raised, also for texts another caller is waiting on.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        pending: Dict[str, Tuple[str, asyncio.Future]] = {}
+        for text in texts:
+            key = chunk_text_hash(text)
+            self.total += 1
+            future = self.entries.get(key)
+            if future is None:
+                self.unique += 1
+                future = loop.create_future()
+                future.add_done_callback(functools.partial(self._forget_failure, key))
+                self.entries[key] = future
+                pending[key] = (text, future)
+            else:
+                self.entries.move_to_end(key)
+            futures.append(future)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if pending:
+            batch = list(pending.values())
+            try:
+                vectors = await embed_batch([text for text, _ in batch])
+            except BaseException as e:
+                for _, future in batch:
+                    if future.done():
+                        continue
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+                raise
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    # A float32 array is about a sixth of the size of a list of Python floats.
+                    future.set_result(np.asarray(vector, dtype=np.float32))
+        # Shield so a caller's timeout does not cancel the embedding other callers await.
+        return [(await asyncio.shield(future)).tolist() for future in futures]
+
+    def _forget_failure(self, key: str, future: asyncio.Future) -> None:
+        # Retrieving the exception here also keeps unawaited failures from being reported as lost.
+        if (future.cancelled() or future.exception() is not None) and self.entries.get(key) is future:
+            del self.entries[key]
+
+    def report(self) -> dict:
+        """
+        Summarizes how many chunks were seen and how many needed embedding in this run.
+        """
+        return {
+            "chunks": self.total,
+            "unique": self.unique,
+            "dedup_ratio": round(1 - self.unique / self.total, 3) if self.total else 0.0,
+        }
@@ -1,52 +1,84 @@
 import asyncio
 import logging
-from typing import Optional, Dict
+from typing import Dict, List, Optional, Tuple
+from chunk_record import ChunkRecord
 
-async def process_chunk_limited(
-    chunk_data: Dict,
+async def process_chunk_batch(
+    records: List[Tuple[int, ChunkRecord]],
     semaphore: asyncio.Semaphore,
-    llm_client,
+    embedder,
     file_path: str,
-    chunk_num: int,
     total_chunks: int,
-    timeout: int = 10  # Timeout in seconds
-) -> Optional[Dict]:
+    context_metadata: Optional[dict] = None,
+    timeout: int = 60,  # Timeout in seconds
+    deduplicator=None,
+    store_text: bool = False
+) -> List[Optional[Dict]]:
     """
-    Process a single chunk of content with metadata, concurrency limit, and timeout.
+    Embed a batch of chunks from one file with a single embed_batch call, under a concurrency limit and timeout.
+
+    The semaphore is held per batch, so Config.embedding_concurrency bounds the batches in
+    flight rather than single texts. A single-chunk batch skips it: the provider hands single
+    texts to its micro-batcher, which coalesces them across files.
 
     Args:
-        chunk_data (Dict): Contains chunk content, type (text/code), and metadata.
-        semaphore (asyncio.Semaphore): Semaphore to limit concurrency.
-        llm_client: The LLM client for processing.
+        records (List[Tuple[int, ChunkRecord]]): (chunk number, chunk) pairs, all from file_path.
+        semaphore (asyncio.Semaphore): Semaphore to limit concurrent embedding calls.
+        embedder: The EmbeddingProvider (or anything with build_context(text, metadata) and embed_batch(texts)).
         file_path (str): Path to the file being processed.
-        chunk_num (int): The current chunk number.
         total_chunks (int): Total number of chunks.
-        timeout (int): Maximum time to wait for LLM response.
+        context_metadata (dict, optional): The metadata embedded with the chunks, when it is
+            trimmed from the file metadata; defaults to each chunk's file_metadata.
+        timeout (int): Maximum time to wait for the batch's embeddings.
+        deduplicator (ChunkDeduplicator, optional): Embeds each distinct chunk text and file
+            metadata pair only once; duplicates reuse the vector and leave the batch.
+        store_text (bool): Adds the chunk text to its metadata, for rerankers and answer citations.
 
     Returns:
-        Optional[Dict]: Processed result including embeddings or None if it fails.
+        List[Optional[Dict]]: One result per record with its chunk_num, embedding and metadata,
+        or None for every record if the batch failed. Each metadata is a new dict built for
+        its chunk; the file-level metadata is never modified.
 
     Logs:
-        - Info: When chunk processing starts and completes.
-        - Error: If chunk processing fails.
+        - Info: When a batch starts and completes.
+        - Error: If the batch fails.
     """
-    async with semaphore:
-        logging.info(f"Processing chunk {chunk_num}/{total_chunks} for file: {file_path}")
-        try:
-            chunk = chunk_data["chunk"]
-            metadata = chunk_data["metadata"]
-            chunk_type = chunk_data["type"]
-
-            # Add chunk type to metadata
-            metadata["chunk_type"] = chunk_type
-
-            # Wrap the LLM call in a timeout
-            response = await asyncio.wait_for(llm_client.generate_embedding(chunk, metadata), timeout=timeout)
-            logging.info(f"Successfully processed chunk {chunk_num}/{total_chunks} for file: {file_path}")
-            return {"chunk_num": chunk_num, "embedding": response, "metadata": metadata}
-        except asyncio.TimeoutError:
-            logging.error(f"Timeout processing chunk {chunk_num}/{total_chunks} for file: {file_path}")
-            return None
-        except Exception as e:
-            logging.error(f"Error processing chunk {chunk_num}/{total_chunks} for file: {file_path} - {e}")
-            return None
\ No newline at end of file
+    if not records:
+        return []
+    first, last = records[0][0], records[-1][0]
+    contexts = [
+        embedder.build_context(
+            chunk_data.text, chunk_data.file_metadata if context_metadata is None else context_metadata
+        )
+        for _, chunk_data in records
+    ]
+
+    async def embed(texts: List[str]) -> List[list]:
+        logging.info(f"Embedding {len(texts)} of chunks {first}-{last}/{total_chunks} for file: {file_path}")
+        if len(texts) == 1:
+            return await asyncio.wait_for(embedder.embed_batch(texts), timeout=timeout)
+        async with semaphore:
+            # Wrap the embedding call in a timeout
+            return await asyncio.wait_for(embedder.embed_batch(texts), timeout=timeout)
+
+    try:
+        if deduplicator is not None:
+            # Keyed on the embedded input, so chunks only share a vector when it is really the same.
+            vectors = await deduplicator.embed_many(contexts, embed)
+        else:
+            vectors = await embed(contexts)
+    except asyncio.TimeoutError:
+        logging.error(f"Timeout embedding chunks {first}-{last}/{total_chunks} for file: {file_path}")
+        return [None] * len(records)
+    except Exception as e:
+        logging.error(f"Error embedding chunks {first}-{last}/{total_chunks} for file: {file_path} - {e}")
+        return [None] * len(records)
+
+    results = []
+    for (chunk_num, chunk_data), vector in zip(records, vectors):
+        metadata = chunk_data.to_metadata(file_path=str(file_path))
+        if store_text:
+            metadata["text"] = chunk_data.text
+        results.append({"chunk_num": chunk_num, "embedding": vector, "metadata": metadata})
+    logging.info(f"Successfully embedded chunks {first}-{last}/{total_chunks} for file: {file_path}")
+    return results
@@ -0,0 +1,139 @@
+# chunk_record.py
+
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Iterable, Iterator, List, Optional
+from chunk_dedup import chunk_text_hash
+
+# Decoded file texts kept by read_chunk_text, so the chunks of one file cost one read.
+FILE_TEXT_CACHE_SIZE = 64
+
+_file_text_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_file_text_lock = threading.Lock()
+
+class ChunkRecord:
+    __slots__ = ("text", "chunk_type", "file_metadata", "start", "end", "heading_path", "tokens", "_content_hash")
+
+    def __init__(self, text: str, chunk_type: str, file_metadata: dict, start: int = 0, end: int = 0,
+                 heading_path: Optional[List[str]] = None, tokens: Optional[int] = None):
+        """
+        Initializes a compact chunk record.
+
+        The file-level metadata dict is referenced, never copied or modified, so every chunk of a
+        file shares one dict. Per-chunk fields (type, offsets, heading path, token count, hash)
+        live on the record and are merged into a fresh dict only by to_metadata().
+
+        Parameters:
+            text (str): The chunk text.
+            chunk_type (str): "text" or "code".
+            file_metadata (dict): The file's front matter, shared by all of its chunks.
+            start (int): Character offset of the chunk in the file's text.
+            end (int): Character offset just past the chunk.
+            heading_path (List[str], optional): Headings above the chunk, outermost first.
+            tokens (int, optional): Token count, when the chunker measured it.
+        """
+        self.text = text
+        self.chunk_type = chunk_type
+        self.file_metadata = file_metadata
+        self.start = start
+        self.end = end
+        self.heading_path = heading_path
+        self.tokens = tokens
+        self._content_hash: Optional[str] = None
+
+    @property
+    def content_hash(self) -> str:
+        """
+        Hash of the whitespace-normalized text, shared by duplicate chunks.
+        """
+        if self._content_hash is None:
+            self._content_hash = chunk_text_hash(self.text)
+        return self._content_hash
+
+    def to_metadata(self, **extra) -> dict:
+        """
+        Builds the metadata stored with this chunk's vector as a new dict.
+        """
+        metadata = dict(self.file_metadata)
+        metadata["chunk_type"] = self.chunk_type
+        metadata["start"] = self.start
+        metadata["end"] = self.end
+        if self.heading_path:
+            metadata["heading_path"] = list(self.heading_path)
+        metadata.update(extra)
+        return metadata
+
+    def __repr__(self) -> str:
+        return f"ChunkRecord(type={self.chunk_type!r}, start={self.start}, end={self.end}, text={self.text[:40]!r})"
+
+class SourceWindow:
+    def __init__(self, lines: Iterable[str], start_offset: int = 0):
+        """
+        Passes a line stream through while keeping the lines no chunk has consumed yet, so a
+        streaming chunker can take a chunk's exact source text by its offsets.
+
+        Parameters:
+            lines (Iterable[str]): The file's lines, with their line endings.
+            start_offset (int): Character offset of the first line in the file's text.
+        """
+        self.lines = lines
+        self.start_offset = start_offset
+        self.pending: "deque[tuple]" = deque()
+
+    def __iter__(self) -> Iterator[str]:
+        offset = self.start_offset
+        for line in self.lines:
+            self.pending.append((offset, line))
+            offset += len(line)
+            yield line
+
+    def take(self, start: int, end: int) -> str:
+        """
+        Returns the source text from start to end and forgets the lines before end, so chunks
+        must be taken in order.
+        """
+        parts = []
+        for offset, line in self.pending:
+            if offset >= end:
+                break
+            if offset + len(line) > start:
+                parts.append(line[max(0, start - offset):end - offset])
+        while self.pending and self.pending[0][0] + len(self.pending[0][1]) <= end:
+            self.pending.popleft()
+        return "".join(parts)
+
+def read_chunk_text(metadata: Optional[dict]) -> Optional[str]:
+    """
+    Returns the text of the chunk a vector's metadata describes.
+
+    Uses the stored "text" field when the index was built with Config.store_chunk_text, and
+    otherwise reads characters start..end of file_path, reusing recently read files until
+    they change on disk. Returns None when neither is available.
+    """
+    if not metadata:
+        return None
+    if metadata.get("text") is not None:
+        return metadata["text"]
+    file_path = metadata.get("file_path")
+    if not file_path or "start" not in metadata or "end" not in metadata:
+        return None
+    try:
+        stat = os.stat(file_path)
+        key = (file_path, stat.st_mtime_ns, stat.st_size)
+        with _file_text_lock:
+            text = _file_text_cache.get(key)
+            if text is not None:
+                _file_text_cache.move_to_end(key)
+        if text is None:
+            with open(file_path, "rb") as file:
+                text = file.read().decode("utf-8")
+            with _file_text_lock:
+                _file_text_cache[key] = text
+                while len(_file_text_cache) > FILE_TEXT_CACHE_SIZE:
+                    _file_text_cache.popitem(last=False)
+    except (OSError, UnicodeDecodeError) as e:
+        logging.warning(f"Could not read chunk text from {file_path}: {e}")
+        return None
+    return text[int(metadata["start"]):int(metadata["end"])].strip()
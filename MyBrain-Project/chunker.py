@@ -1,21 +1,32 @@
 # chunker.py
 
 import logging
-from typing import Generator, Dict
+from pathlib import Path
+from typing import Generator, Iterable, Iterator, List, Optional
 import re
+from chunk_record import ChunkRecord
+
+# Lines longer than this are read from files in pieces, so one huge line cannot exhaust memory.
+MAX_LINE_READ = 64 * 1024
 
 def validate_chunk_params(content: str, chunk_size: int, overlap: int):
     """
     Validates the parameters for chunking content.
     """
+    validate_window_params(chunk_size, overlap)
+    if len(content) == 0:
+        raise ValueError("Content cannot be empty.")
+
+def validate_window_params(chunk_size: int, overlap: int):
+    """
+    Validates the chunk size and overlap shared by every chunking strategy.
+    """
     if chunk_size <= 0:
         raise ValueError("chunk_size must be greater than 0.")
     if overlap < 0:
         raise ValueError("overlap must be non-negative.")
     if chunk_size <= overlap:
         raise ValueError("chunk_size must be greater than overlap.")
-    if len(content) == 0:
-        raise ValueError("Content cannot be empty.")
 
 def extract_code_blocks(content: str) -> list:
     """
@@ -25,31 +36,156 @@ def extract_code_blocks(content: str) -> list:
     matches = re.finditer(code_pattern, content, re.DOTALL)
     return [(match.start(), match.end(), match.group()) for match in matches]
 
-def chunk_content_with_metadata(content: str, metadata: dict, chunk_size: int, overlap: int = 0) -> Generator[Dict, None, None]:
+def iter_lines(text: str, start: int = 0) -> Generator[str, None, None]:
+    """
+    Yields the lines of text from offset start, keeping line endings, without copying the whole string.
+    """
+    length = len(text)
+    while start < length:
+        end = text.find("\n", start)
+        end = length if end == -1 else end + 1
+        yield text[start:end]
+        start = end
+
+def iter_file_lines(file_path: Path, start: int = 0) -> Generator[str, None, None]:
+    """
+    Yields the lines of a UTF-8 file from character offset start, reading it incrementally.
+    Lines longer than MAX_LINE_READ are yielded in pieces.
+    """
+    with open(file_path, "r", encoding="utf-8") as file:
+        if start:
+            file.read(start)
+        while True:
+            line = file.readline(MAX_LINE_READ)
+            if not line:
+                return
+            yield line
+
+class ChunkStream:
+    def __init__(self, lines: Iterable[str], metadata: dict, chunk_size: int, overlap: int = 0, start_offset: int = 0):
+        """
+        Chunks a stream of lines in one linear pass, keeping fenced code blocks intact.
+
+        A small state machine tracks whether it is inside a ``` fence instead of running a
+        regex over the whole document. Text outside fences is cut into windows of chunk_size
+        characters overlapping by overlap; only about one window of text is held at a time
+        (a code block is held until its closing fence). Each chunk carries its absolute
+        character offsets, start_offset being the offset of the first line.
+
+        Iterate the stream to get the chunks; total is the number of chunks yielded so far,
+        and complete tells whether that is the final count.
+        """
+        validate_window_params(chunk_size, overlap)
+        self.lines = lines
+        self.metadata = metadata
+        self.chunk_size = chunk_size
+        self.step = chunk_size - overlap
+        self.start_offset = start_offset
+        self.total = 0
+        self.complete = False
+
+    def _chunk(self, text: str, chunk_type: str, start: int) -> Optional[ChunkRecord]:
+        stripped = text.strip()
+        if not stripped:
+            return None
+        chunk_start = start + len(text) - len(text.lstrip())
+        self.total += 1
+        return ChunkRecord(stripped, chunk_type, self.metadata, chunk_start, chunk_start + len(stripped))
+
+    def __iter__(self) -> Iterator[ChunkRecord]:
+        offset = self.start_offset
+        pieces: List[str] = []
+        pieces_length = 0
+        text_start = offset
+        code_pieces: Optional[List[str]] = None
+        code_start = offset
+        at_line_start = True
+
+        def flush_text(final: bool):
+            nonlocal pieces, pieces_length, text_start
+            buffer = "".join(pieces)
+            # Emit every full window; on the final flush also the trailing partial windows,
+            # matching range(0, len(text), chunk_size - overlap) over the whole segment.
+            # Windows are sliced at a moving index and the consumed prefix is dropped once,
+            # so a long line costs linear time rather than a copy of the rest per window.
+            position = 0
+            while len(buffer) - position >= self.chunk_size or (final and position < len(buffer)):
+                chunk = self._chunk(buffer[position:position + self.chunk_size], "text", text_start)
+                if chunk:
+                    yield chunk
+                position += self.step
+                text_start += self.step
+            buffer = buffer[position:]
+            pieces = [buffer] if buffer else []
+            pieces_length = len(buffer)
+
+        for line in self.lines:
+            is_fence = at_line_start and line.lstrip().startswith("```")
+            at_line_start = line.endswith("\n")
+            if code_pieces is not None:
+                if is_fence:
+                    # The block ends at the closing backticks; the rest of the line is text.
+                    fence_end = line.index("```") + 3
+                    code_pieces.append(line[:fence_end])
+                    chunk = self._chunk("".join(code_pieces), "code", code_start)
+                    if chunk:
+                        yield chunk
+                    code_pieces = None
+                    pieces = [line[fence_end:]]
+                    pieces_length = len(pieces[0])
+                    text_start = offset + fence_end
+                else:
+                    code_pieces.append(line)
+            elif is_fence:
+                # Indentation before the opening backticks belongs to the preceding text.
+                fence_start = line.index("```")
+                pieces.append(line[:fence_start])
+                yield from flush_text(final=True)
+                code_pieces = [line[fence_start:]]
+                code_start = offset + fence_start
+            else:
+                pieces.append(line)
+                pieces_length += len(line)
+                if pieces_length >= self.chunk_size:
+                    yield from flush_text(final=False)
+            offset += len(line)
+
+        if code_pieces is not None:
+            # An unclosed fence is not a code block; chunk it as ordinary text.
+            pieces.extend(code_pieces)
+            text_start = code_start
+        yield from flush_text(final=True)
+        self.complete = True
+        logging.info(f"Generated {self.total} chunks for file.")
+
+def chunk_content_with_metadata(content: str, metadata: dict, chunk_size: int, overlap: int = 0) -> Generator[ChunkRecord, None, None]:
     """
     Chunks the content into smaller parts while keeping code blocks intact, providing metadata for each chunk.
     """
     validate_chunk_params(content, chunk_size, overlap)
-    code_blocks = extract_code_blocks(content)
-    code_blocks.sort(key=lambda x: x[0])
-    previous_end = 0
-
-    def chunk_text(text: str, chunk_size: int, overlap: int, metadata: dict) -> Generator[Dict, None, None]:
-        for i in range(0, len(text), chunk_size - overlap):
-            chunk = text[i:i + chunk_size].strip()
-            if chunk:
-                yield {"chunk": chunk, "type": "text", "metadata": metadata}
-
-    for code_block in code_blocks:
-        start, end, code = code_block
-        text_before = content[previous_end:start]
-        for text_chunk in chunk_text(text_before, chunk_size, overlap, metadata):
-            yield text_chunk
-        yield {"chunk": code.strip(), "type": "code", "metadata": metadata}
-        previous_end = end
-
-    remaining_text = content[previous_end:]
-    for text_chunk in chunk_text(remaining_text, chunk_size, overlap, metadata):
-        yield text_chunk
-
-    logging.info(f"Generated chunks for file.")
\ No newline at end of file
+    yield from ChunkStream(iter_lines(content), metadata, chunk_size, overlap)
+
+def count_chunks(lines: Iterable[str], chunk_size: int, overlap: int = 0) -> int:
+    """
+    Counts the chunks a line stream produces without keeping any of them.
+    """
+    stream = ChunkStream(lines, {}, chunk_size, overlap)
+    for _ in stream:
+        pass
+    return stream.total
+
+def chunk_document(document, chunk_size: int, overlap: int = 0) -> ChunkStream:
+    """
+    Chunks the body of a ParsedDocument using its already-parsed front matter as metadata.
+    Offsets are absolute positions in the document's text.
+    """
+    return ChunkStream(
+        iter_lines(document.text, document.body_offset), document.metadata or {},
+        chunk_size, overlap, start_offset=document.body_offset
+    )
+
+def stream_file_chunks(file_path: Path, metadata: dict, chunk_size: int, overlap: int = 0, start: int = 0) -> ChunkStream:
+    """
+    Chunks a file straight from disk, from character offset start (e.g. a body offset), in bounded memory.
+    """
+    return ChunkStream(iter_file_lines(file_path, start), metadata, chunk_size, overlap, start_offset=start)
@@ -0,0 +1,117 @@
+# chunker_check.py
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+from config import Config
+from document import ParsedDocument
+from file_processor import DocumentProcessor
+from chunk_record import read_chunk_text
+from metadata_handler import extract_metadata
+
+MAX_TOKENS = 128
+OVERSIZED_FRONT_MATTER = (
+    "---\n"
+    "title: A note whose front matter is longer than the model input\n"
+    "tags: [" + ", ".join(f"tag{i}" for i in range(150)) + "]\n"
+    "summary: " + " ".join(f"word{i}" for i in range(150)) + "\n"
+    "---\n"
+)
+IRREGULAR_BODY = (
+    "# Heading\n\n\n"
+    "A first paragraph.  It has two   sentences.\n"
+    "And a second line.\n   \n\n"
+    + " ".join(f"run{i}\n  on" if i % 7 == 0 else f"word{i}" for i in range(400)) + "\n\n"
+    "```python\n" + "".join(f"line_{i} = {i}\n" for i in range(120)) + "```\n\n"
+    "## Tail\n\tIndented   closing text.\n"
+)
+BODY = "\n\n".join(
+    f"Paragraph {i} talks about embeddings, chunk budgets and how notes are split before indexing."
+    for i in range(12)
+)
+
+def check(name: str, passed: bool, detail: str = "") -> bool:
+    print(f"{'PASS' if passed else 'FAIL'}: {name}" + (f" ({detail})" if detail else ""))
+    return passed
+
+def make_processor(directory: Path, strategy: str) -> DocumentProcessor:
+    config = Config()
+    config.embedding_provider = "dummy"
+    config.vector_backend = "local"
+    config.chunk_strategy = strategy
+    config.chunk_max_tokens = MAX_TOKENS
+    config.local_index_path = directory / "index"
+    config.lexical_index_path = directory / "lexical"
+    config.manifest_path = directory / "manifest.json"
+    config.embedding_cache_path = None
+    return DocumentProcessor(config)
+
+def check_oversized_front_matter(directory: Path, strategy: str) -> bool:
+    """
+    A note whose front matter alone exceeds the model input still gets at least half of the
+    input for its text, and its embedded prefix fits in the rest.
+    """
+    note = directory / f"oversized_{strategy}.md"
+    note.write_text(OVERSIZED_FRONT_MATTER + BODY, encoding="utf-8")
+    processor = make_processor(directory, strategy)
+    document = ParsedDocument(note)
+    document.load()
+    metadata = extract_metadata(document)
+    context_metadata = processor.context_metadata(metadata)
+    budget = processor._token_budget(context_metadata)
+    chunks = list(processor.chunk(document, metadata, context_metadata))
+    results = [
+        check(f"{strategy}: budget keeps half the input", budget >= MAX_TOKENS // 2, f"budget {budget}"),
+        check(
+            f"{strategy}: oversized note packs paragraphs", len(chunks) <= 6,
+            f"{len(chunks)} chunks, {sum(len(chunk.text.split()) for chunk in chunks) / len(chunks):.0f} words each",
+        ),
+        check(
+            f"{strategy}: embedded prefix fits", processor._prefix_tokens(context_metadata) + budget <= MAX_TOKENS,
+            f"{len(context_metadata)}/{len(metadata)} fields embedded",
+        ),
+        check(f"{strategy}: stored metadata is untouched", all(chunk.file_metadata is metadata for chunk in chunks)),
+    ]
+    asyncio.run(processor.close())
+    return all(results)
+
+def check_exact_slices(directory: Path, strategy: str) -> bool:
+    """
+    Every chunk's text is its stripped source slice, also where oversized paragraphs and code
+    were split and where blocks are separated by irregular whitespace, so the text read back
+    from disk for reranking and answers is the text that was embedded.
+    """
+    note = directory / f"irregular_{strategy}.md"
+    note.write_text(IRREGULAR_BODY, encoding="utf-8", newline="")
+    processor = make_processor(directory, strategy)
+    document = ParsedDocument(note)
+    document.load()
+    source = document.text
+    chunks = list(processor.chunk(document, {}))
+    mismatched = [chunk for chunk in chunks if chunk.text != source[chunk.start:chunk.end].strip()]
+    unread = [chunk for chunk in chunks if read_chunk_text(chunk.to_metadata(file_path=str(note))) != chunk.text]
+    asyncio.run(processor.close())
+    return all([
+        check(f"{strategy}: chunk text is the source slice", not mismatched, f"{len(mismatched)}/{len(chunks)} differ"),
+        check(f"{strategy}: read_chunk_text returns the chunk text", not unread, f"{len(unread)}/{len(chunks)} differ"),
+    ])
+
+def run_checks() -> bool:
+    """
+    Runs the chunking checks in a temporary directory.
+
+    Returns:
+        bool: True when every check passed.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        return all(
+            [check_oversized_front_matter(directory, strategy) for strategy in ("tokens", "markdown")]
+            + [check_exact_slices(directory, strategy) for strategy in ("tokens", "markdown")]
+        )
+
+# Checks chunk budgets and offsets with the dummy embedding provider; needs no model download.
+if __name__ == "__main__":
+    if not run_checks():
+        sys.exit(1)
@@ -8,17 +8,99 @@ class Config:
         """
         Initializes the configuration settings.
         """
+        # Which backend embeds chunks and queries: sentence-transformers, ollama or dummy.
+        self.embedding_provider = os.getenv("EMBEDDING_PROVIDER", "sentence-transformers")
         self.model_name = os.getenv("MODEL_NAME", "all-MiniLM-L6-v2")
+        self.dummy_embedding_dimension = int(os.getenv("DUMMY_EMBEDDING_DIMENSION", "384"))
         self.device = os.getenv("DEVICE", "cpu")
+        # Inference runtime for the SentenceTransformer: torch, onnx or quantized (int8, cpu only).
+        self.embedding_runtime = os.getenv("EMBEDDING_RUNTIME", "torch")
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+        self.embedding_batch_wait_ms = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+        # 0 encodes in this process; N > 0 uses N worker processes, each with
+        # EMBEDDING_WORKER_THREADS torch threads (0 splits the CPUs evenly between workers).
+        self.embedding_workers = int(os.getenv("EMBEDDING_WORKERS", "0"))
+        self.embedding_worker_threads = int(os.getenv("EMBEDDING_WORKER_THREADS", "0"))
+        # An empty EMBEDDING_CACHE_PATH disables the persistent embedding cache.
+        cache_path = os.getenv("EMBEDDING_CACHE_PATH", ".mybrain_embedding_cache.sqlite3")
+        self.embedding_cache_path = Path(cache_path) if cache_path else None
+        self.embedding_cache_max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+        self.chunk_strategy = os.getenv("CHUNK_STRATEGY", "chars")
+        self.chunk_size = int(os.getenv("CHUNK_SIZE", "500"))
+        self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "50"))
+        # 0 means use the embedding model's max_seq_length.
+        self.chunk_max_tokens = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+        self.dedup_chunks = os.getenv("DEDUP_CHUNKS", "true").lower() in ("1", "true", "yes")
+        self.dedup_max_entries = int(os.getenv("DEDUP_MAX_ENTRIES", "5000"))
         self.ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+        self.ollama_model = os.getenv("OLLAMA_MODEL", "llama3")
+        self.ollama_embedding_model = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+        self.ollama_embed_batch_size = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32"))
+        self.ollama_pool_size = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+        self.ollama_keepalive_seconds = float(os.getenv("OLLAMA_KEEPALIVE_SECONDS", "30"))
+        # How long Ollama keeps the model loaded after a request, in Ollama's duration format.
+        self.ollama_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "5m")
+        self.ollama_timeout_seconds = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "120"))
+        self.ollama_connect_timeout_seconds = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", "5"))
+        self.ollama_max_retries = int(os.getenv("OLLAMA_MAX_RETRIES", "3"))
+        self.ollama_backoff_seconds = float(os.getenv("OLLAMA_BACKOFF_SECONDS", "0.5"))
         self.repo_url = os.getenv("REPO_URL", "https://github.com/knowmad411dev/MyBrain")
         self.repo_path = Path(os.getenv("REPO_PATH", "MyBrain"))
         self.allowed_extensions = os.getenv("ALLOWED_EXTENSIONS", ".txt,.md").split(',')
+        self.ignore_folders = os.getenv("IGNORE_FOLDERS", "Attachments,Templates,.obsidian,.git,.trash").split(',')
+        self.scan_workers = int(os.getenv("SCAN_WORKERS", "8"))
+        self.scan_queue_size = int(os.getenv("SCAN_QUEUE_SIZE", "256"))
+        self.ingest_workers = int(os.getenv("INGEST_WORKERS", "4"))
+        self.embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+        self.upsert_concurrency = int(os.getenv("UPSERT_CONCURRENCY", "2"))
+        self.upsert_batch_size = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+        self.upsert_max_bytes = int(os.getenv("UPSERT_MAX_BYTES", str(2 * 1024 * 1024)))
+        self.upsert_workers = int(os.getenv("UPSERT_WORKERS", "4"))
+        self.upsert_max_retries = int(os.getenv("UPSERT_MAX_RETRIES", "5"))
+        self.upsert_backoff_seconds = float(os.getenv("UPSERT_BACKOFF_SECONDS", "0.5"))
         self.log_format = os.getenv("LOG_FORMAT", "%(asctime)s - %(levelname)s - %(message)s")
         self.log_file = os.getenv("LOG_FILE", "app.log")
+        self.log_level = os.getenv("LOG_LEVEL", "INFO")
+        self.manifest_path = Path(os.getenv("MANIFEST_PATH", ".mybrain_manifest.json"))
         self.pinecone_api_key = os.getenv("PINECONE_API_KEY")
         self.pinecone_environment = os.getenv("PINECONE_ENVIRONMENT")
         self.pinecone_index_name = os.getenv("PINECONE_INDEX_NAME", "document-embeddings")
+        self.query_cache_size = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+        self.query_cache_ttl_seconds = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+        # Cached search results are also dropped when the local index changes; with Pinecone,
+        # writes by another process only show once they expire.
+        self.result_cache_ttl_seconds = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "30"))
+        self.vector_backend = os.getenv("VECTOR_BACKEND") or ("pinecone" if self.pinecone_api_key else "local")
+        self.local_index_path = Path(os.getenv("LOCAL_INDEX_PATH", ".mybrain_index"))
+        self.local_ann = os.getenv("LOCAL_ANN", "none")
+        self.local_ann_min_vectors = int(os.getenv("LOCAL_ANN_MIN_VECTORS", "20000"))
+        self.local_ann_nprobe = int(os.getenv("LOCAL_ANN_NPROBE", "8"))
+        # An empty LEXICAL_INDEX_PATH disables the BM25 index and hybrid search.
+        lexical_path = os.getenv("LEXICAL_INDEX_PATH", ".mybrain_lexical")
+        self.lexical_index_path = Path(lexical_path) if lexical_path else None
+        # "vector" for dense search only, "hybrid" to fuse BM25 and vector results.
+        self.search_mode = os.getenv("SEARCH_MODE", "vector")
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "50"))
+        self.hybrid_rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        # Cross-encoder reranking of the top RERANK_CANDIDATES results, skipped when the estimated
+        # scoring time would exceed RERANK_BUDGET_MS.
+        self.rerank = os.getenv("RERANK", "false").lower() in ("1", "true", "yes")
+        self.rerank_model = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.rerank_device = os.getenv("RERANK_DEVICE", "cpu")
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "30"))
+        self.rerank_batch_size = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+        self.rerank_budget_ms = float(os.getenv("RERANK_BUDGET_MS", "300"))
+        self.rerank_cache_size = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+        # Retrieval-augmented answers: chunks retrieved per question and the token budget for them.
+        self.rag_top_k = int(os.getenv("RAG_TOP_K", "8"))
+        self.rag_context_tokens = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))
+        # Watch mode: "auto" uses inotify on Linux and falls back to polling every WATCH_POLL_SECONDS.
+        self.watch_backend = os.getenv("WATCH_BACKEND", "auto")
+        self.watch_debounce_ms = float(os.getenv("WATCH_DEBOUNCE_MS", "300"))
+        self.watch_poll_seconds = float(os.getenv("WATCH_POLL_SECONDS", "1"))
+        self.watch_save_interval_seconds = float(os.getenv("WATCH_SAVE_INTERVAL_SECONDS", "5"))
+        # Stores each chunk's text in its vector metadata; otherwise it is read back from the file.
+        self.store_chunk_text = os.getenv("STORE_CHUNK_TEXT", "false").lower() in ("1", "true", "yes")
 
     @staticmethod
     def load_default():
@@ -32,14 +114,79 @@ class Config:
         Validates the configuration settings.
         """
         required_attrs = [
-            "model_name", "device", "ollama_url", "repo_url", "repo_path", 
-            "allowed_extensions", "log_format", "log_file",
-            "pinecone_api_key", "pinecone_environment", "pinecone_index_name"
+            "embedding_provider", "model_name", "dummy_embedding_dimension", "device", "embedding_runtime",
+            "embedding_batch_size", "embedding_batch_wait_ms", "embedding_workers", "embedding_worker_threads",
+            "embedding_cache_path", "embedding_cache_max_entries", "chunk_strategy", "chunk_size",
+            "chunk_overlap", "chunk_max_tokens", "dedup_chunks", "dedup_max_entries", "ollama_url",
+            "ollama_model", "ollama_embedding_model", "ollama_embed_batch_size", "ollama_pool_size",
+            "ollama_keepalive_seconds", "ollama_keep_alive", "ollama_timeout_seconds",
+            "ollama_connect_timeout_seconds", "ollama_max_retries", "ollama_backoff_seconds", "repo_url", "repo_path", 
+            "allowed_extensions", "ignore_folders", "scan_workers", "scan_queue_size",
+            "ingest_workers", "embedding_concurrency", "upsert_concurrency",
+            "upsert_batch_size", "upsert_max_bytes", "upsert_workers", "upsert_max_retries",
+            "upsert_backoff_seconds", "log_format", "log_file", "log_level", "manifest_path",
+            "pinecone_api_key", "pinecone_environment", "pinecone_index_name",
+            "query_cache_size", "query_cache_ttl_seconds", "result_cache_ttl_seconds", "vector_backend", "local_index_path",
+            "local_ann", "local_ann_min_vectors", "local_ann_nprobe", "lexical_index_path", "search_mode",
+            "hybrid_candidates", "hybrid_rrf_k", "rerank", "rerank_model", "rerank_device",
+            "rerank_candidates", "rerank_batch_size", "rerank_budget_ms", "rerank_cache_size", "store_chunk_text",
+            "rag_top_k", "rag_context_tokens", "watch_backend", "watch_debounce_ms", "watch_poll_seconds",
+            "watch_save_interval_seconds"
         ]
         for attr in required_attrs:
             if not hasattr(self, attr):
                 raise ValueError(f"Missing required configuration: {attr}")
-        if not self.pinecone_api_key:
-            raise ValueError("Missing PINECONE_API_KEY in environment variables")
-        if not self.pinecone_environment:
-            raise ValueError("Missing PINECONE_ENVIRONMENT in environment variables")
\ No newline at end of file
+        if self.embedding_batch_wait_ms < 0:
+            raise ValueError("embedding_batch_wait_ms must be non-negative.")
+        if self.embedding_workers < 0 or self.embedding_worker_threads < 0:
+            raise ValueError("embedding_workers and embedding_worker_threads must be non-negative.")
+        if self.embedding_provider not in ("sentence-transformers", "ollama", "dummy"):
+            raise ValueError(f"Unsupported EMBEDDING_PROVIDER: {self.embedding_provider}")
+        if self.embedding_runtime not in ("torch", "onnx", "quantized"):
+            raise ValueError(f"Unsupported EMBEDDING_RUNTIME: {self.embedding_runtime}")
+        if self.embedding_runtime == "quantized" and self.device != "cpu":
+            raise ValueError("EMBEDDING_RUNTIME=quantized requires DEVICE=cpu.")
+        if self.chunk_strategy not in ("chars", "tokens", "markdown"):
+            raise ValueError(f"Unsupported CHUNK_STRATEGY: {self.chunk_strategy}")
+        if self.chunk_overlap < 0 or self.chunk_size <= self.chunk_overlap:
+            raise ValueError("chunk_size must be greater than chunk_overlap, which must be non-negative.")
+        if self.chunk_max_tokens < 0:
+            raise ValueError("chunk_max_tokens must be non-negative.")
+        if self.query_cache_size < 0 or self.query_cache_ttl_seconds <= 0 or self.result_cache_ttl_seconds <= 0:
+            raise ValueError("query_cache_size must be non-negative and the cache TTLs greater than 0.")
+        if self.watch_backend not in ("auto", "inotify", "poll"):
+            raise ValueError(f"Unsupported WATCH_BACKEND: {self.watch_backend}")
+        if self.watch_debounce_ms < 0 or self.watch_poll_seconds <= 0 or self.watch_save_interval_seconds < 0:
+            raise ValueError(
+                "watch_debounce_ms and watch_save_interval_seconds must be non-negative and watch_poll_seconds greater than 0."
+            )
+        if self.rerank_budget_ms <= 0 or self.rerank_cache_size < 0:
+            raise ValueError("rerank_budget_ms must be greater than 0 and rerank_cache_size non-negative.")
+        if self.upsert_max_retries < 0 or self.upsert_backoff_seconds < 0:
+            raise ValueError("upsert_max_retries and upsert_backoff_seconds must be non-negative.")
+        if self.ollama_max_retries < 0 or self.ollama_backoff_seconds < 0 or self.ollama_keepalive_seconds < 0:
+            raise ValueError("ollama_max_retries, ollama_backoff_seconds and ollama_keepalive_seconds must be non-negative.")
+        positive_attrs = [
+            "embedding_batch_size", "dummy_embedding_dimension", "embedding_cache_max_entries",
+            "dedup_max_entries", "scan_workers", "scan_queue_size",
+            "ingest_workers", "embedding_concurrency", "upsert_concurrency", "local_ann_nprobe",
+            "upsert_batch_size", "upsert_max_bytes", "upsert_workers", "ollama_embed_batch_size", "ollama_pool_size",
+            "ollama_timeout_seconds", "ollama_connect_timeout_seconds", "hybrid_candidates", "hybrid_rrf_k",
+            "rerank_candidates", "rerank_batch_size", "rag_top_k", "rag_context_tokens"
+        ]
+        for attr in positive_attrs:
+            if getattr(self, attr) <= 0:
+                raise ValueError(f"{attr} must be greater than 0.")
+        if self.vector_backend not in ("pinecone", "local"):
+            raise ValueError(f"Unsupported VECTOR_BACKEND: {self.vector_backend}")
+        if self.local_ann not in ("none", "ivf"):
+            raise ValueError(f"Unsupported LOCAL_ANN: {self.local_ann}")
+        if self.search_mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unsupported SEARCH_MODE: {self.search_mode}")
+        if self.search_mode == "hybrid" and self.lexical_index_path is None:
+            raise ValueError("SEARCH_MODE=hybrid requires LEXICAL_INDEX_PATH.")
+        if self.vector_backend == "pinecone":
+            if not self.pinecone_api_key:
+                raise ValueError("Missing PINECONE_API_KEY in environment variables")
+            if not self.pinecone_environment:
+                raise ValueError("Missing PINECONE_ENVIRONMENT in environment variables")
\ No newline at end of file
@@ -0,0 +1,130 @@
+# document.py
+
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+from manifest import hash_content
+from metadata_handler import cache_front_matter, cached_front_matter, parse_front_matter, read_front_matter
+
+class ParsedDocument:
+    def __init__(self, path: Path, mtime: Optional[float] = None, size: Optional[int] = None):
+        """
+        Initializes a document that is read from disk at most once.
+
+        The scanner, metadata handler, chunker and processor all share the same instance,
+        so the raw bytes, decoded text and parsed front matter are produced a single time
+        per file and only when first needed.
+
+        Parameters:
+            path (Path): The path to the document.
+            mtime (float, optional): Modification time, if already known from a directory scan.
+            size (int, optional): File size in bytes, if already known from a directory scan.
+        """
+        self.path = Path(path)
+        self.mtime = mtime
+        self.size = size
+        # Set by the scanner from a peek at the first bytes, before the file is read.
+        self.front_matter_hint: Optional[bool] = None
+        self._raw: Optional[bytes] = None
+        self._text: Optional[str] = None
+        self._metadata: Optional[dict] = None
+        self._body_offset: Optional[int] = None
+        self._content_hash: Optional[str] = None
+
+    @classmethod
+    def from_path(cls, path: Path) -> "ParsedDocument":
+        """
+        Creates a document and reads it immediately.
+        """
+        document = cls(path)
+        document.load()
+        return document
+
+    def stat(self) -> None:
+        """
+        Fills in mtime and size without reading the file, for manifest checks.
+        """
+        if self.mtime is None or self.size is None:
+            stat = self.path.stat()
+            self.mtime, self.size = stat.st_mtime, stat.st_size
+
+    def load(self) -> None:
+        """
+        Reads the file's bytes in a single read, taking mtime and size from the open handle.
+        """
+        if self._raw is not None:
+            return
+        try:
+            with open(self.path, "rb") as file:
+                stat = os.fstat(file.fileno())
+                self._raw = file.read()
+            if self._body_offset is not None and (self.mtime, self.size) != (stat.st_mtime, stat.st_size):
+                # The front matter was parsed from an older version of the file.
+                self._metadata, self._body_offset = None, None
+            self.mtime, self.size = stat.st_mtime, stat.st_size
+        except FileNotFoundError:
+            logging.error(f"File not found: {self.path}. Please check the file path.")
+            raise
+        except IOError as e:
+            logging.error(f"Error reading file {self.path}: {e}. Ensure the file is accessible.")
+            raise
+
+    def _parse(self) -> None:
+        """
+        Parses the front matter once, reusing the process-wide cache for this (path, mtime, size).
+
+        If the file has not been read yet, only the front matter is read from disk.
+        """
+        if self._body_offset is not None:
+            return
+        if self._raw is None:
+            self.stat()
+            self._metadata, self._body_offset = read_front_matter(self.path, self.mtime, self.size)
+            return
+        cached = cached_front_matter(self.path, self.mtime, self.size)
+        if cached is None:
+            cached = parse_front_matter(self.text, self.path)
+            cache_front_matter((str(self.path), self.mtime, self.size), cached)
+        self._metadata, self._body_offset = cached
+
+    @property
+    def raw(self) -> bytes:
+        self.load()
+        return self._raw
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.raw.decode("utf-8")
+        return self._text
+
+    @property
+    def content_hash(self) -> str:
+        if self._content_hash is None:
+            self._content_hash = hash_content(self.raw)
+        return self._content_hash
+
+    @property
+    def metadata(self) -> Optional[dict]:
+        """
+        The parsed YAML front matter, or None when the file has none.
+        """
+        self._parse()
+        return self._metadata
+
+    @property
+    def body_offset(self) -> int:
+        """
+        Character offset in text where the body starts (0 when there is no front matter).
+        """
+        self._parse()
+        return self._body_offset
+
+    @property
+    def body(self) -> str:
+        return self.text[self.body_offset:]
+
+    @property
+    def has_front_matter(self) -> bool:
+        return self.body_offset > 0
@@ -0,0 +1,81 @@
+# embedding_batcher.py
+
+import asyncio
+import inspect
+import logging
+from typing import Callable, List, Optional, Tuple
+
+class EmbeddingBatcher:
+    def __init__(self, encode_batch: Callable[[List[str]], List[List[float]]], batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Initializes a micro-batcher that groups concurrent embedding requests.
+
+        Requests are collected until batch_size texts are pending or max_wait_ms has passed
+        since the first one arrived, then encoded with a single encode_batch call: a blocking
+        function runs on the default executor and a coroutine function (e.g. an HTTP client)
+        is awaited. Each caller's future is resolved with its own vector.
+
+        Parameters:
+            encode_batch (Callable): Function or coroutine function mapping a list of texts to a list of vectors.
+            batch_size (int): Maximum number of texts per encode call.
+            max_wait_ms (float): Maximum time to wait for a batch to fill, in milliseconds.
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be greater than 0.")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be non-negative.")
+        self.encode_batch = encode_batch
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, text: str) -> list:
+        """
+        Queues one text for the next batch and waits for its embedding.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """
+        Hands the pending requests to a background task that encodes them as one batch.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        texts = [text for text, _ in batch]
+        try:
+            if inspect.iscoroutinefunction(self.encode_batch):
+                vectors = await self.encode_batch(texts)
+            else:
+                vectors = await loop.run_in_executor(None, self.encode_batch, texts)
+        except Exception as e:
+            logging.error(f"Error encoding batch of {len(texts)} texts: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(texts)
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
@@ -0,0 +1,117 @@
+# embedding_cache.py
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+# SQLite limits the number of bound parameters per statement.
+LOOKUP_BATCH = 500
+
+class EmbeddingCache:
+    def __init__(self, cache_path: Path, model_name: str, max_entries: int = 500000):
+        """
+        Initializes a disk-backed embedding cache keyed by (model name, text hash).
+
+        Vectors are stored as float32 blobs in SQLite. When the cache grows past max_entries
+        the least recently used entries are evicted, and the whole cache is cleared when it
+        was built with a different model.
+
+        Parameters:
+            cache_path (Path): The SQLite database file.
+            model_name (str): The model the cached vectors must come from.
+            max_entries (int): Maximum number of cached vectors.
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be greater than 0.")
+        self.cache_path = Path(cache_path)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(str(self.cache_path), check_same_thread=False)
+        with self._lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'model_name'").fetchone()
+            if row is None or row[0] != model_name:
+                if row is not None:
+                    logging.info(f"Embedding model changed from '{row[0]}' to '{model_name}', clearing embedding cache.")
+                self.connection.execute("DELETE FROM embeddings")
+                self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model_name', ?)", (model_name,))
+            self._count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logging.info(f"Embedding cache at {self.cache_path} holds {self._count} vectors for '{model_name}'.")
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[list]]:
+        """
+        Looks up several texts at once, returning a vector or None for each.
+        """
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                with self.connection:
+                    self.connection.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                    )
+        results = []
+        for key in keys:
+            blob = found.get(key)
+            if blob is None:
+                results.append(None)
+            else:
+                vector = array("f")
+                vector.frombytes(blob)
+                results.append(vector.tolist())
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Stores vectors for several texts, evicting the least recently used entries if needed.
+        """
+        now = time.time()
+        rows = [(self._key(text), array("f", vector).tobytes(), now) for text, vector in zip(texts, vectors)]
+        with self._lock, self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._count += self.connection.total_changes - before
+            excess = self._count - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._count -= excess
+                logging.info(f"Evicted {excess} least recently used vectors from the embedding cache.")
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self.connection.close()
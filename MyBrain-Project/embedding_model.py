@@ -4,16 +4,70 @@ from sentence_transformers import SentenceTransformer
 import logging
 import torch
 import asyncio
+from typing import List, Optional
+from config import Config
+from embedding_batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache
+from embedding_provider import build_context
+
+RUNTIMES = ("torch", "onnx", "quantized")
+
+def load_sentence_transformer(model_name: str, device: str, runtime: str = "torch") -> SentenceTransformer:
+    """
+    Loads a SentenceTransformer for the given inference runtime.
+
+    "torch" is the float PyTorch model. "onnx" runs an ONNX export through onnxruntime
+    (sentence-transformers >= 3.2 with its onnx extra; the model is exported on first load).
+    "quantized" applies torch dynamic int8 quantization to the Linear layers, CPU only.
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unsupported embedding runtime: {runtime}")
+    if runtime == "onnx":
+        try:
+            return SentenceTransformer(model_name, device=device, backend="onnx")
+        except TypeError as e:
+            raise ImportError(
+                "The onnx runtime needs sentence-transformers >= 3.2; install 'sentence-transformers[onnx]'."
+            ) from e
+    model = SentenceTransformer(model_name, device=device)
+    if runtime == "quantized":
+        if device != "cpu":
+            raise ValueError("The quantized runtime only runs on the cpu device.")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
 
 class EmbeddingModel:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", device: str = None):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", device: str = None, config: Optional[Config] = None):
         """
         Initializes the embedding model with lazy loading.
+
+        Concurrent generate_embedding calls are micro-batched into a single encode call,
+        controlled by Config.embedding_batch_size and Config.embedding_batch_wait_ms.
+        A batch size of 1 disables batching. When Config.embedding_cache_path is set, vectors
+        are looked up in a persistent EmbeddingCache before anything is encoded. When
+        Config.embedding_workers is positive, encoding runs in an EmbeddingProcessPool of that
+        many worker processes, started on first use, instead of in this process.
+        Config.embedding_runtime selects float PyTorch, ONNX or int8-quantized inference.
         """
+        self.config = config or Config.load_default()
         self.model_name = model_name
+        self.runtime = self.config.embedding_runtime
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.model = None  # Lazy loading
-        logging.info(f"EmbeddingModel initialized with model '{self.model_name}' on device '{self.device}'.")
+        self.pool = None
+        self.batcher = None
+        self.cache = None
+        if self.config.embedding_cache_path:
+            # Other runtimes produce slightly different vectors, so they get their own cache fingerprint.
+            cache_key = self.model_name if self.runtime == "torch" else f"{self.model_name}@{self.runtime}"
+            self.cache = EmbeddingCache(
+                self.config.embedding_cache_path, cache_key, self.config.embedding_cache_max_entries
+            )
+        if self.config.embedding_batch_size > 1:
+            self.batcher = EmbeddingBatcher(
+                self.encode_batch, self.config.embedding_batch_size, self.config.embedding_batch_wait_ms
+            )
+        logging.info(f"EmbeddingModel initialized with model '{self.model_name}' on device '{self.device}' ({self.runtime} runtime).")
 
     def load_model(self):
         """
@@ -21,16 +75,104 @@ class EmbeddingModel:
         """
         if self.model is None:
             logging.info("Loading SentenceTransformer model...")
-            self.model = SentenceTransformer(self.model_name, device=self.device)
+            self.model = load_sentence_transformer(self.model_name, self.device, self.runtime)
             logging.info("Model loaded successfully.")
 
+    def _get_pool(self):
+        """
+        Starts the worker process pool on first use.
+        """
+        if self.pool is None:
+            from embedding_pool import EmbeddingProcessPool
+            self.pool = EmbeddingProcessPool(
+                self.model_name, self.device, self.config.embedding_workers, self.config.embedding_worker_threads,
+                runtime=self.runtime
+            )
+        return self.pool
+
+    @property
+    def dimension(self) -> int:
+        """
+        The length of the vectors the model produces.
+        """
+        if self.config.embedding_workers > 0:
+            return self._get_pool().dimension
+        self.load_model()
+        return self.model.get_sentence_embedding_dimension()
+
+    def get_tokenizer(self):
+        """
+        Returns the model's tokenizer, loading the model if needed.
+        """
+        self.load_model()
+        return getattr(self.model, "tokenizer", None)
+
+    @property
+    def max_seq_length(self) -> int:
+        """
+        The maximum number of tokens the model embeds; longer inputs are truncated.
+        """
+        self.load_model()
+        return self.model.max_seq_length
+
+    @staticmethod
+    def build_context(text: str, metadata: dict) -> str:
+        """
+        Builds the string that is actually embedded for a text and its metadata.
+        """
+        return build_context(text, metadata)
+
+    def encode_batch(self, texts: List[str]) -> List[list]:
+        """
+        Encodes a list of texts with one blocking model.encode call, skipping cached texts.
+        """
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._encode(texts)
+        results = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            vectors = self._encode(missing_texts)
+            self.cache.put_many(missing_texts, vectors)
+            for i, vector in zip(missing, vectors):
+                results[i] = vector
+        return results
+
+    def _encode(self, texts: List[str]) -> List[list]:
+        if self.config.embedding_workers > 0:
+            return self._get_pool().encode(texts).tolist()
+        self.load_model()
+        embeddings = self.model.encode(texts, batch_size=len(texts))
+        return embeddings.tolist()
+
     async def generate_embedding(self, text: str, metadata: dict) -> list:
         """
         Generates an embedding for the given text and metadata.
         """
-        self.load_model()
-        metadata_str = ", ".join(f"{k}: {v}" for k, v in metadata.items())
-        context = f"Metadata: {metadata_str}. Content: {text}"
+        context = self.build_context(text, metadata)
+        if self.batcher is not None:
+            return await self.batcher.submit(context)
+        loop = asyncio.get_event_loop()
+        embeddings = await loop.run_in_executor(None, self.encode_batch, [context])
+        return embeddings[0]
+
+    async def generate_embeddings(self, texts: List[str], metadata: Optional[dict] = None) -> List[list]:
+        """
+        Generates embeddings for several texts sharing the same metadata in one encode call.
+        """
+        contexts = [self.build_context(text, metadata or {}) for text in texts]
         loop = asyncio.get_event_loop()
-        embedding = await loop.run_in_executor(None, self.model.encode, context)
-        return embedding.tolist()
\ No newline at end of file
+        return await loop.run_in_executor(None, self.encode_batch, contexts)
+
+    def close(self) -> None:
+        """
+        Stops the worker pool, if one was started, and closes the embedding cache.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
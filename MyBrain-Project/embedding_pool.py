@@ -0,0 +1,115 @@
+# embedding_pool.py
+
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional
+import numpy as np
+
+# Smallest slice of a batch worth sending to its own worker.
+MIN_ROWS_PER_WORKER = 8
+
+# The model loaded in this worker process by _init_worker.
+_worker_model = None
+
+def _init_worker(model_name: str, device: str, threads: int, runtime: str) -> None:
+    """
+    Runs once in each worker: pins torch's intra-op threads and loads the model.
+    """
+    global _worker_model
+    import torch
+    from embedding_model import load_sentence_transformer
+    if threads > 0 and hasattr(torch, "set_num_threads"):
+        torch.set_num_threads(threads)
+    _worker_model = load_sentence_transformer(model_name, device, runtime)
+
+def _worker_dimension() -> int:
+    return _worker_model.get_sentence_embedding_dimension()
+
+def _encode_into(shm_name: str, total_rows: int, dimension: int, row: int, texts: List[str]) -> int:
+    """
+    Encodes texts and writes the vectors into rows [row, row + len(texts)) of a shared block.
+
+    Only the row count travels back through the pipe; the vectors never get pickled.
+    """
+    block = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray((total_rows, dimension), dtype=np.float32, buffer=block.buf)
+        out[row:row + len(texts)] = _worker_model.encode(texts, batch_size=len(texts))
+        del out
+    finally:
+        block.close()
+    return len(texts)
+
+class EmbeddingProcessPool:
+    def __init__(self, model_name: str, device: str = "cpu", workers: int = 2, threads_per_worker: int = 0,
+                 runtime: str = "torch"):
+        """
+        Initializes a pool of worker processes that each hold their own copy of the model.
+
+        Workers are started with the "spawn" method, load the SentenceTransformer once, and
+        pin torch to threads_per_worker intra-op threads (0 splits the CPUs evenly) so the
+        workers do not oversubscribe the cores. A batch is split across the workers, which
+        write their vectors straight into one shared-memory float32 block.
+
+        Parameters:
+            model_name (str): The SentenceTransformer model to load in every worker.
+            device (str): The device the workers run the model on.
+            workers (int): Number of worker processes.
+            threads_per_worker (int): torch intra-op threads per worker; 0 means cpu_count // workers.
+            runtime (str): Inference runtime for the workers' models; see load_sentence_transformer.
+        """
+        if workers <= 0:
+            raise ValueError("workers must be greater than 0.")
+        self.model_name = model_name
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, device, self.threads_per_worker, runtime),
+        )
+        self._dimension: Optional[int] = None
+        logging.info(f"Embedding pool started with {workers} workers x {self.threads_per_worker} threads for '{model_name}'")
+
+    @property
+    def dimension(self) -> int:
+        """
+        The embedding dimension, asked of a worker once.
+        """
+        if self._dimension is None:
+            self._dimension = self.executor.submit(_worker_dimension).result()
+        return self._dimension
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encodes texts across the workers and returns a (len(texts), dimension) float32 array.
+        """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        dimension = self.dimension
+        rows = len(texts)
+        per_worker = max(MIN_ROWS_PER_WORKER, math.ceil(rows / self.workers))
+        block = shared_memory.SharedMemory(create=True, size=rows * dimension * 4)
+        try:
+            futures = [
+                self.executor.submit(_encode_into, block.name, rows, dimension, start, texts[start:start + per_worker])
+                for start in range(0, rows, per_worker)
+            ]
+            for future in futures:
+                future.result()
+            vectors = np.ndarray((rows, dimension), dtype=np.float32, buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+        return vectors
+
+    def close(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        self.executor.shutdown(wait=True)
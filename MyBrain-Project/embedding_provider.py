@@ -0,0 +1,218 @@
+# embedding_provider.py
+
+import asyncio
+import hashlib
+import logging
+import math
+import struct
+from typing import List, Optional
+from config import Config
+
+# Used as the token budget when a provider cannot report its model's limit.
+DEFAULT_MAX_SEQ_LENGTH = 512
+
+def build_context(text: str, metadata: Optional[dict]) -> str:
+    """
+    Builds the string that is actually embedded for a text and its metadata.
+    """
+    metadata_str = ", ".join(f"{k}: {v}" for k, v in (metadata or {}).items())
+    return f"Metadata: {metadata_str}. Content: {text}"
+
+class EmbeddingProvider:
+    name = "base"
+
+    def __init__(self, config: Config, model_name: str):
+        """
+        Base class for the embedding backends used by both indexing and search.
+
+        Subclasses implement embed_batch() and dimension; everything else is shared, so the
+        same text and metadata always produce the same input string whichever path embeds it.
+        """
+        self.config = config
+        self.model_name = model_name
+        self._dimension: Optional[int] = None
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the vector space: provider and model. Stored with the index and manifest.
+        """
+        return f"{self.name}:{self.model_name}"
+
+    @staticmethod
+    def build_context(text: str, metadata: Optional[dict]) -> str:
+        return build_context(text, metadata)
+
+    def load(self) -> None:
+        """
+        Loads the model if the provider has one to load. Blocking; call it off the event loop.
+        """
+
+    def get_tokenizer(self):
+        """
+        Returns the model's tokenizer, or None when token counts must be approximated.
+        """
+        return None
+
+    @property
+    def max_seq_length(self) -> int:
+        return DEFAULT_MAX_SEQ_LENGTH
+
+    async def get_dimension(self) -> int:
+        """
+        Returns the length of the vectors this provider produces, probing the model once if needed.
+        """
+        if self._dimension is None:
+            self._dimension = len((await self.embed_batch([""]))[0])
+        return self._dimension
+
+    async def embed_batch(self, texts: List[str]) -> List[list]:
+        """
+        Embeds already-built input strings, in as few model calls as the backend allows.
+        """
+        raise NotImplementedError
+
+    async def generate_embedding(self, text: str, metadata: Optional[dict]) -> list:
+        """
+        Generates an embedding for the given text and metadata.
+        """
+        return (await self.embed_batch([self.build_context(text, metadata)]))[0]
+
+    async def generate_embeddings(self, texts: List[str], metadata: Optional[dict] = None) -> List[list]:
+        """
+        Generates embeddings for several texts sharing the same metadata in one batch.
+        """
+        return await self.embed_batch([self.build_context(text, metadata) for text in texts])
+
+    async def close(self) -> None:
+        """
+        Releases any connections the provider holds.
+        """
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    name = "sentence-transformers"
+
+    def __init__(self, config: Config, embedding_model=None):
+        """
+        Embeds locally with a SentenceTransformer through EmbeddingModel, which adds micro-batching
+        and the persistent embedding cache.
+        """
+        super().__init__(config, config.model_name)
+        if embedding_model is None:
+            from embedding_model import EmbeddingModel
+            embedding_model = EmbeddingModel(config.model_name, config.device, config=config)
+        self.embedding_model = embedding_model
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Adds the runtime unless it is torch: ONNX and quantized vectors differ slightly from the
+        float model's, so an index must not mix them.
+        """
+        runtime = self.config.embedding_runtime
+        return super().fingerprint if runtime == "torch" else f"{super().fingerprint}@{runtime}"
+
+    def load(self) -> None:
+        self.embedding_model.load_model()
+
+    def get_tokenizer(self):
+        return self.embedding_model.get_tokenizer()
+
+    @property
+    def max_seq_length(self) -> int:
+        return self.embedding_model.max_seq_length
+
+    async def get_dimension(self) -> int:
+        if self._dimension is None:
+            loop = asyncio.get_running_loop()
+            self._dimension = await loop.run_in_executor(None, lambda: self.embedding_model.dimension)
+        return self._dimension
+
+    async def embed_batch(self, texts: List[str]) -> List[list]:
+        if len(texts) == 1 and self.embedding_model.batcher is not None:
+            # Single texts from concurrent callers are coalesced by the model's micro-batcher.
+            return [await self.embedding_model.batcher.submit(texts[0])]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.embedding_model.encode_batch, texts)
+
+    async def close(self) -> None:
+        self.embedding_model.close()
+
+class OllamaProvider(EmbeddingProvider):
+    name = "ollama"
+
+    def __init__(self, config: Config, llm_client=None):
+        """
+        Embeds with Ollama's /api/embed endpoint through LLMClient's pooled, batched HTTP client.
+        """
+        super().__init__(config, config.ollama_embedding_model)
+        if llm_client is None:
+            from llm_client import LLMClient
+            llm_client = LLMClient(config)
+        self.llm_client = llm_client
+
+    @property
+    def max_seq_length(self) -> int:
+        return self.config.chunk_max_tokens or DEFAULT_MAX_SEQ_LENGTH
+
+    async def embed_batch(self, texts: List[str]) -> List[list]:
+        if len(texts) == 1:
+            return [await self.llm_client.batcher.submit(texts[0])]
+        return await self.llm_client.embed_many(texts)
+
+    async def close(self) -> None:
+        await self.llm_client.close()
+
+class DummyProvider(EmbeddingProvider):
+    name = "dummy"
+
+    def __init__(self, config: Config):
+        """
+        Produces deterministic pseudo-random unit vectors from a hash of each text, with no model.
+
+        Identical texts get identical vectors, which is enough to exercise indexing and search
+        in tests and benchmarks; the vectors carry no meaning.
+        """
+        super().__init__(config, f"hash-{config.dummy_embedding_dimension}")
+        self._dimension = config.dummy_embedding_dimension
+
+    @staticmethod
+    def _vector(text: str, dimension: int) -> list:
+        values = []
+        counter = 0
+        while len(values) < dimension:
+            digest = hashlib.blake2b(f"{counter}:{text}".encode("utf-8"), digest_size=64).digest()
+            values.extend(value / 2147483648.0 for value in struct.unpack("<16i", digest))
+            counter += 1
+        values = values[:dimension]
+        norm = math.sqrt(sum(value * value for value in values)) or 1.0
+        return [value / norm for value in values]
+
+    async def embed_batch(self, texts: List[str]) -> List[list]:
+        return [self._vector(text, self._dimension) for text in texts]
+
+PROVIDERS = {
+    SentenceTransformerProvider.name: SentenceTransformerProvider,
+    OllamaProvider.name: OllamaProvider,
+    DummyProvider.name: DummyProvider,
+}
+
+def create_embedding_provider(config: Optional[Config] = None, llm_client=None, embedding_model=None) -> EmbeddingProvider:
+    """
+    Creates the provider selected by Config.embedding_provider.
+
+    Parameters:
+        config (Config, optional): Defaults to Config.load_default().
+        llm_client (LLMClient, optional): An existing client to share with the Ollama provider.
+        embedding_model (EmbeddingModel, optional): An existing model to share with the
+            SentenceTransformer provider.
+    """
+    config = config or Config.load_default()
+    if config.embedding_provider == OllamaProvider.name:
+        provider = OllamaProvider(config, llm_client)
+    elif config.embedding_provider == SentenceTransformerProvider.name:
+        provider = SentenceTransformerProvider(config, embedding_model)
+    else:
+        provider = PROVIDERS[config.embedding_provider](config)
+    logging.info(f"Using embedding provider '{provider.fingerprint}'")
+    return provider
@@ -1,15 +1,28 @@
 # file_processor.py
 
 import asyncio
+import functools
+import json
+import math
+from typing import Optional
 from pathlib import Path
-from file_handler import read_file
+from document import ParsedDocument
 from metadata_handler import extract_metadata
-from chunker import chunk_content_with_metadata
+from chunker import chunk_document, iter_lines
+from token_chunker import TokenChunkStream, TokenCounter
+from markdown_chunker import MarkdownChunkStream
 import logging
 from vector_store import VectorStore
 from llm_client import LLMClient
-from embedding_model import EmbeddingModel
-from chunk_processor import process_chunk_limited
+from embedding_provider import create_embedding_provider
+from chunk_processor import process_chunk_batch
+from chunk_dedup import ChunkDeduplicator
+from lexical_index import LexicalIndex
+from manifest import IndexManifest, hash_content
+
+# Share of the model's input always left to a chunk's own text. Front matter that would take
+# more is trimmed from the embedded prefix; it is still stored in full with every vector.
+MIN_CONTENT_SHARE = 0.5
 
 class DocumentProcessor:
     def __init__(self, config):
@@ -17,42 +30,353 @@ class DocumentProcessor:
         Initializes the DocumentProcessor with necessary components.
         """
         self.config = config
-        self.vector_store = VectorStore()
-        self.llm_client = LLMClient()
-        self.embedding_model = EmbeddingModel()
+        self.vector_store = VectorStore(config)
+        self.llm_client = LLMClient(config)
+        # Chunks are embedded with the same provider SearchService uses for queries.
+        self.embedding_provider = create_embedding_provider(config, llm_client=self.llm_client)
+        self.embedding_checked = False
+        self.token_counter = None
+        self.deduplicator = ChunkDeduplicator(config.dedup_max_entries) if config.dedup_chunks else None
+        self.manifest = IndexManifest(config.manifest_path, self.embedding_provider.fingerprint)
+        # BM25 index over the same chunks, for hybrid search.
+        # Files indexed before it existed are backfilled from their text, without re-embedding.
+        self.lexical_index = LexicalIndex(config.lexical_index_path) if config.lexical_index_path else None
+        # Shared by every file processed concurrently, so the budgets are global to the run.
+        self.embedding_semaphore = asyncio.Semaphore(config.embedding_concurrency)
+        self.upsert_semaphore = asyncio.Semaphore(config.upsert_concurrency)
+
+    async def _write(self, func, *args):
+        """
+        Runs a blocking vector-store write on the default executor within the shared write budget.
+        """
+        async with self.upsert_semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, func, *args)
+
+    async def check_embedding(self) -> None:
+        """
+        Verifies once that the vector store was built with this embedding provider and dimension.
+        """
+        if self.embedding_checked:
+            return
+        dimension = await self.embedding_provider.get_dimension()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, functools.partial(
+                self.vector_store.check_embedding, self.embedding_provider.fingerprint, dimension, writer=True
+            )
+        )
+        self.embedding_checked = True
+
+    def _max_tokens(self) -> int:
+        if self.token_counter is None:
+            self.token_counter = TokenCounter(self.embedding_provider.get_tokenizer())
+        return self.config.chunk_max_tokens or self.embedding_provider.max_seq_length
+
+    def _prefix_tokens(self, metadata: dict) -> int:
+        # Two special tokens ([CLS]/[SEP]) are added around every input.
+        return self.token_counter.count(self.embedding_provider.build_context("", metadata)) + 2
+
+    def context_metadata(self, metadata: dict) -> dict:
+        """
+        Returns the metadata embedded with each chunk of a file: its front matter, unless the
+        prefix would take more than 1 - MIN_CONTENT_SHARE of the model's input. Then fields are
+        kept in order while they fit, the first one that does not is cut to the words that
+        still fit, and fields with no room left are dropped.
+        """
+        max_tokens = self._max_tokens()
+        limit = max_tokens - math.ceil(max_tokens * MIN_CONTENT_SHARE)
+        if self._prefix_tokens(metadata) <= limit:
+            return metadata
+        fitted = {}
+        for key, value in metadata.items():
+            candidate = dict(fitted)
+            candidate[key] = value
+            if self._prefix_tokens(candidate) <= limit:
+                fitted = candidate
+                continue
+            words = str(value).split()
+            low, high = 0, len(words)
+            while low < high:
+                middle = (low + high + 1) // 2
+                candidate[key] = " ".join(words[:middle])
+                if self._prefix_tokens(candidate) <= limit:
+                    low = middle
+                else:
+                    high = middle - 1
+            if low:
+                candidate[key] = " ".join(words[:low])
+                fitted = candidate
+        logging.info(f"Front matter trimmed to {len(fitted)}/{len(metadata)} fields in the embedded prefix")
+        return fitted
+
+    def _token_budget(self, context_metadata: dict) -> int:
+        """
+        Returns the tokens available to a chunk: the model's max_seq_length (or
+        Config.chunk_max_tokens) minus the metadata prefix embedded with every chunk, which
+        context_metadata() keeps to at most half of it.
+        """
+        return max(1, self._max_tokens() - self._prefix_tokens(context_metadata))
+
+    def chunk(self, document, metadata: dict, context_metadata: Optional[dict] = None):
+        """
+        Chunks a document's body with the strategy selected by Config.chunk_strategy.
+
+        "chars" cuts windows of Config.chunk_size characters. "tokens" packs paragraphs and
+        sentences up to the token budget. "markdown" makes one chunk per heading section,
+        split recursively when a section exceeds the token budget. The budget is sized for
+        context_metadata (default: context_metadata(metadata)), the prefix actually embedded.
+        """
+        if self.config.chunk_strategy == "chars":
+            return chunk_document(document, chunk_size=self.config.chunk_size, overlap=self.config.chunk_overlap)
+        if context_metadata is None:
+            context_metadata = self.context_metadata(metadata)
+        budget = self._token_budget(context_metadata)
+        lines = iter_lines(document.text, document.body_offset)
+        if self.config.chunk_strategy == "markdown":
+            return MarkdownChunkStream(
+                lines, metadata, budget, self.token_counter.count_many, start_offset=document.body_offset
+            )
+        return TokenChunkStream(lines, metadata, self.token_counter, budget, start_offset=document.body_offset)
+
+    @staticmethod
+    def chunk_hash(chunk_data) -> str:
+        """
+        Fingerprints a ChunkRecord together with the metadata stored alongside its vector, as
+        "<embedding hash>:<metadata hash>" without building the per-vector dict.
+
+        The embedding hash covers what is embedded (the text and the file metadata); the
+        metadata hash covers the rest (type, offsets and heading path), which can change when a
+        chunk merely moves within its file.
+        """
+        embedded = json.dumps({"chunk": chunk_data.text, "metadata": chunk_data.file_metadata}, sort_keys=True, default=str)
+        placement = json.dumps(
+            {
+                "type": chunk_data.chunk_type, "start": chunk_data.start, "end": chunk_data.end,
+                "heading_path": chunk_data.heading_path,
+            },
+            sort_keys=True, default=str
+        )
+        return f"{hash_content(embedded.encode('utf-8'))}:{hash_content(placement.encode('utf-8'))}"
+
+    def chunk_id_prefix(self, file_path: Path) -> str:
+        """
+        Returns the part of a file's chunk ids that identifies the file: a hash of its path
+        relative to Config.repo_path (or of its absolute path if it lies outside the vault), so
+        notes with the same name in different folders never share ids.
+        """
+        path = Path(file_path).resolve()
+        try:
+            key = path.relative_to(Path(self.config.repo_path).resolve()).as_posix()
+        except ValueError:
+            key = path.as_posix()
+        return hash_content(key.encode("utf-8"))[:16]
+
+    def _chunk_metadata(self, chunk_data, file_path: Path) -> dict:
+        metadata = chunk_data.to_metadata(file_path=str(file_path))
+        if self.config.store_chunk_text:
+            metadata["text"] = chunk_data.text
+        return metadata
+
+    def _lexically_indexed(self, file_path: Path) -> bool:
+        """
+        False when the lexical index is enabled but lacks some of the file's chunks, e.g. on the
+        first run after it was turned on for a vault that was already indexed.
+        """
+        if self.lexical_index is None:
+            return True
+        # Chunks without a hash are embedded, and added to the lexical index, on the next run anyway.
+        chunks = self.manifest.get_chunk_hashes(file_path)
+        return self.lexical_index.contains(chunk_id for chunk_id, chunk_hash in chunks.items() if chunk_hash is not None)
 
-    async def validate_and_process_file(self, file_path: Path) -> dict:
+    async def validate_and_process_file(self, file_path) -> dict:
         """
         Validates and processes a file, generating embeddings and storing them in the vector store.
 
+        Files whose manifest entry still matches are skipped, only chunks whose content changed
+        are re-embedded, and vectors for chunks that no longer exist are deleted. The lexical
+        index is updated with the same chunks; a file it is missing is processed even if
+        unchanged, adding its unchanged chunks' text without re-embedding them. The file is read and its front matter parsed
+        once, through a shared ParsedDocument.
+
         Parameters:
-            file_path (Path): The path to the file to be processed.
+            file_path (Path | ParsedDocument): The file to be processed.
 
         Returns:
             dict: A dictionary indicating the status of the operation and details.
         """
+        document = file_path if isinstance(file_path, ParsedDocument) else ParsedDocument(file_path)
+        file_path = document.path
         try:
-            content = read_file(file_path)
-            metadata = extract_metadata(file_path)
-            chunk_generator = chunk_content_with_metadata(content, metadata, chunk_size=500, overlap=50)
-            semaphore = asyncio.Semaphore(5)
-            tasks = []
-            for chunk_data in chunk_generator:
-                task = process_chunk_limited(
-                    chunk_data, semaphore, self.llm_client, file_path, len(tasks) + 1, len(chunk_generator)
-                )
-                tasks.append(task)
-            results = await asyncio.gather(*tasks)
-            vectors = []
+            document.stat()
+            lexically_indexed = self._lexically_indexed(file_path)
+            if lexically_indexed and self.manifest.is_unchanged(file_path, document.mtime, document.size):
+                return {"status": "skipped", "file_path": str(file_path)}
+            document.load()
+            content_hash = document.content_hash
+            if lexically_indexed and self.manifest.is_unchanged(file_path, document.mtime, document.size, content_hash):
+                self.manifest.touch(file_path, document.mtime, document.size)
+                return {"status": "skipped", "file_path": str(file_path)}
+            await self.check_embedding()
+            metadata = extract_metadata(document) or {}
+            context_metadata = self.context_metadata(metadata)
+            previous_chunks = self.manifest.get_chunk_hashes(file_path)
+            # Chunk ids are <file>_<content hash>, with an ordinal only for repeated content, so
+            # inserting a paragraph does not change the ids of the chunks after it.
+            prefix = self.chunk_id_prefix(file_path)
+            current_chunks = {}
+            occurrences = {}
+            changed = []
+            moved = []
+            backfill = []
+            for chunk_num, chunk_data in enumerate(
+                self.chunk(document, metadata, context_metadata), start=1
+            ):
+                content = chunk_data.content_hash[:16]
+                occurrences[content] = occurrences.get(content, 0) + 1
+                chunk_id = f"{prefix}_{content}"
+                if occurrences[content] > 1:
+                    chunk_id += f"_{occurrences[content]}"
+                chunk_hash = self.chunk_hash(chunk_data)
+                current_chunks[chunk_id] = chunk_hash
+                previous_hash = previous_chunks.get(chunk_id)
+                if previous_hash and previous_hash.split(":")[0] == chunk_hash.split(":")[0]:
+                    if not lexically_indexed:
+                        backfill.append((chunk_id, chunk_data.text))
+                    if previous_hash != chunk_hash:
+                        moved.append((chunk_id, chunk_data))
+                else:
+                    changed.append((chunk_num, (chunk_id, chunk_data)))
             ids = []
-            metadata_list = []
-            for result in results:
-                if result:
-                    vectors.append(result['embedding'])
-                    ids.append(f"{file_path.stem}_{result['chunk_num']}")
-                    metadata_list.append(result['metadata'])
-            self.vector_store.upsert_vectors(vectors, ids, metadata_list)
-            return {"status": "success", "file_path": str(file_path)}
+            # Embed in batches of Config.embedding_batch_size so a huge file never has more than a
+            # batch of vectors in memory, while the shared budgets cap embedding calls and writes
+            # across all files.
+            window = self.config.embedding_batch_size
+            for start in range(0, len(changed), window):
+                records = dict(changed[start:start + window])
+                results = await process_chunk_batch(
+                    [(chunk_num, chunk_data) for chunk_num, (_, chunk_data) in records.items()],
+                    self.embedding_semaphore, self.embedding_provider, file_path, len(current_chunks),
+                    context_metadata=context_metadata, deduplicator=self.deduplicator,
+                    store_text=self.config.store_chunk_text
+                )
+                vectors = []
+                window_ids = []
+                metadata_list = []
+                texts = []
+                for result in results:
+                    if result:
+                        chunk_id, chunk_data = records[result['chunk_num']]
+                        vectors.append(result['embedding'])
+                        window_ids.append(chunk_id)
+                        metadata_list.append(result['metadata'])
+                        texts.append(chunk_data.text)
+                if vectors:
+                    await self._write(self.vector_store.upsert_vectors, vectors, window_ids, metadata_list)
+                    if self.lexical_index is not None:
+                        await self._write(self.lexical_index.add, window_ids, texts)
+                ids.extend(window_ids)
+            if backfill:
+                await self._write(
+                    self.lexical_index.add, [chunk_id for chunk_id, _ in backfill], [text for _, text in backfill]
+                )
+            if moved:
+                # Same text and file metadata, so the stored vector is still right; only the
+                # offsets or heading path in its metadata changed.
+                await self._write(
+                    self.vector_store.update_metadata, [chunk_id for chunk_id, _ in moved],
+                    [self._chunk_metadata(chunk_data, file_path) for _, chunk_data in moved]
+                )
+            stale_ids = [chunk_id for chunk_id in previous_chunks if chunk_id not in current_chunks]
+            if stale_ids:
+                await self._write(self.vector_store.delete_vectors, stale_ids)
+                if self.lexical_index is not None:
+                    await self._write(self.lexical_index.delete, stale_ids)
+            # Chunks that failed to embed keep their id with no hash, like after a model change:
+            # the next run retries them, and deleting the file still deletes any older vector.
+            embedded = set(ids) | {chunk_id for chunk_id, _ in moved} | {
+                chunk_id for chunk_id, chunk_hash in current_chunks.items()
+                if previous_chunks.get(chunk_id) == chunk_hash
+            }
+            self.manifest.update(
+                file_path, document.mtime, document.size, content_hash,
+                {
+                    chunk_id: chunk_hash if chunk_id in embedded else None
+                    for chunk_id, chunk_hash in current_chunks.items()
+                }
+            )
+            logging.info(
+                f"Indexed {file_path}: {len(ids)}/{len(current_chunks)} chunks embedded, {len(moved)} moved, "
+                f"{len(backfill)} added to the lexical index, {len(stale_ids)} stale vectors deleted"
+            )
+            return {
+                "status": "success", "file_path": str(file_path),
+                "chunks_embedded": len(ids), "chunks_moved": len(moved), "chunks_deleted": len(stale_ids)
+            }
         except Exception as e:
             logging.error(f"Error processing file {file_path}: {e}")
-            return {"status": "error", "file_path": str(file_path), "error": str(e)}
\ No newline at end of file
+            return {"status": "error", "file_path": str(file_path), "error": str(e)}
+
+    async def consume(self, queue: asyncio.Queue) -> list:
+        """
+        Processes documents from a scanner queue until a None sentinel is received.
+
+        Several consumers can share one queue so files are processed concurrently.
+
+        Returns:
+            list: The result of every processed file.
+        """
+        results = []
+        while True:
+            document = await queue.get()
+            try:
+                if document is None:
+                    return results
+                result = await self.validate_and_process_file(document)
+                logging.info(f"Processed file: {result}")
+                results.append(result)
+            finally:
+                queue.task_done()
+
+    def remove_file(self, file_path) -> int:
+        """
+        Deletes the vectors of a file that no longer exists and drops it from the manifest.
+
+        Returns:
+            int: The number of vectors deleted.
+        """
+        chunk_ids = self.manifest.remove(file_path)
+        self.vector_store.delete_vectors(chunk_ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(chunk_ids)
+        logging.info(f"Removed {len(chunk_ids)} vectors for deleted file: {file_path}")
+        return len(chunk_ids)
+
+    def prune_missing_files(self, seen_paths) -> int:
+        """
+        Removes every manifest file that was not seen in the latest scan.
+
+        Returns:
+            int: The number of files removed.
+        """
+        missing = self.manifest.missing_files(seen_paths)
+        for file_path in missing:
+            self.remove_file(file_path)
+        return len(missing)
+
+    def save_manifest(self) -> None:
+        """
+        Persists the vector store, the lexical index and the manifest so the next run can skip
+        what was indexed here.
+        """
+        self.vector_store.flush()
+        if self.lexical_index is not None:
+            self.lexical_index.flush()
+        self.manifest.save()
+
+    async def close(self) -> None:
+        """
+        Releases the LLM client's and embedding provider's pooled HTTP connections.
+        """
+        await self.embedding_provider.close()
+        await self.llm_client.close()
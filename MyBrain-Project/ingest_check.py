@@ -0,0 +1,96 @@
+# ingest_check.py
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+from config import Config
+from file_processor import DocumentProcessor
+
+EMBEDDING_CONCURRENCY = 2
+EMBEDDING_BATCH_SIZE = 16
+
+def check(name: str, passed: bool, detail: str = "") -> bool:
+    print(f"{'PASS' if passed else 'FAIL'}: {name}" + (f" ({detail})" if detail else ""))
+    return passed
+
+class RecordingProvider:
+    def __init__(self, provider):
+        """
+        Wraps an embedding provider and records the size of every embed_batch call.
+        """
+        self.provider = provider
+        self.batch_sizes = []
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+    async def embed_batch(self, texts):
+        self.batch_sizes.append(len(texts))
+        return await self.provider.embed_batch(texts)
+
+async def check_batching(directory: Path) -> bool:
+    """
+    Indexes notes with many chunks and checks that embedding calls carry more texts than
+    Config.embedding_concurrency, that is, the semaphore bounds batches, not single texts.
+    """
+    vault = directory / "vault"
+    vault.mkdir()
+    for i in range(4):
+        (vault / f"note{i}.md").write_text(
+            "\n\n".join(f"Note {i} paragraph {j} about batching embeddings." for j in range(40)), encoding="utf-8"
+        )
+    (vault / "copy.md").write_text((vault / "note0.md").read_text(encoding="utf-8"), encoding="utf-8")
+    config = Config()
+    config.repo_path = vault
+    config.embedding_provider = "dummy"
+    config.vector_backend = "local"
+    config.chunk_strategy = "chars"
+    config.chunk_size = 60
+    config.chunk_overlap = 0
+    config.embedding_concurrency = EMBEDDING_CONCURRENCY
+    config.embedding_batch_size = EMBEDDING_BATCH_SIZE
+    config.local_index_path = directory / "index"
+    config.lexical_index_path = directory / "lexical"
+    config.manifest_path = directory / "manifest.json"
+    config.embedding_cache_path = None
+    processor = DocumentProcessor(config)
+    provider = RecordingProvider(processor.embedding_provider)
+    processor.embedding_provider = provider
+    try:
+        notes = sorted(vault.glob("*.md"))
+        results = await asyncio.gather(*(processor.validate_and_process_file(note) for note in notes))
+    finally:
+        await processor.close()
+    embedded = sum(result.get("chunks_embedded", 0) for result in results)
+    texts = sum(provider.batch_sizes)
+    return all([
+        check("every file was indexed", all(result["status"] == "success" for result in results)),
+        check(
+            "batches exceed the concurrency limit", max(provider.batch_sizes) > EMBEDDING_CONCURRENCY,
+            f"largest batch {max(provider.batch_sizes)}, concurrency {EMBEDDING_CONCURRENCY}",
+        ),
+        check(
+            "batches respect the batch size", max(provider.batch_sizes) <= EMBEDDING_BATCH_SIZE,
+            f"{len(provider.batch_sizes)} calls",
+        ),
+        check(
+            "duplicate chunks are embedded once", texts == processor.deduplicator.unique < embedded,
+            f"{texts} texts embedded for {embedded} chunks; {processor.deduplicator.report()}",
+        ),
+    ])
+
+def run_checks() -> bool:
+    """
+    Runs the ingest checks in a temporary directory.
+
+    Returns:
+        bool: True when every check passed.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(check_batching(Path(directory)))
+
+# Checks embedding batching with the dummy embedding provider; needs no model download.
+if __name__ == "__main__":
+    if not run_checks():
+        sys.exit(1)
@@ -0,0 +1,385 @@
+# lexical_index.py
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+WORD = re.compile(r"[A-Za-z0-9_]+")
+SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+MAX_TF = np.iinfo(np.uint16).max
+# Times load() re-reads index.json when a segment it names was deleted while being opened.
+LOAD_ATTEMPTS = 3
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase terms, keeping identifiers whole and also indexing their parts.
+
+    "process_chunk_limited" yields the full identifier plus "process", "chunk" and "limited";
+    "VectorStore" yields "vectorstore", "vector" and "store". Exact identifiers therefore score
+    highest while partial matches still hit.
+    """
+    terms = []
+    for match in WORD.finditer(text):
+        word = match.group()
+        terms.append(word.lower())
+        parts = [part.lower() for piece in word.split("_") for part in SUBWORD.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+def _write_json(path: Path, data) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+def _load_array(path: Path, dtype) -> np.ndarray:
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+class _Segment:
+    def __init__(self, directory: Path, name: str):
+        """
+        An immutable, memory-mapped run of postings: for every term a contiguous slice of
+        document numbers (uint32) and term frequencies (uint16).
+        """
+        self.name = name
+        with open(directory / f"{name}.terms.json", "r", encoding="utf-8") as file:
+            self.terms: Dict[str, List[int]] = json.load(file)
+        self.docs = _load_array(directory / f"{name}.docs.u32", np.uint32)
+        self.tfs = _load_array(directory / f"{name}.tfs.u16", np.uint16)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        start, count = entry
+        return self.docs[start:start + count], self.tfs[start:start + count]
+
+    @staticmethod
+    def write(directory: Path, name: str, postings: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+        terms = {}
+        docs, tfs = [], []
+        offset = 0
+        for term in sorted(postings):
+            term_docs, term_tfs = postings[term]
+            if not len(term_docs):
+                continue
+            terms[term] = [offset, len(term_docs)]
+            docs.append(np.asarray(term_docs, dtype=np.uint32))
+            tfs.append(np.asarray(term_tfs, dtype=np.uint16))
+            offset += len(term_docs)
+        (np.concatenate(docs) if docs else np.zeros(0, dtype=np.uint32)).tofile(directory / f"{name}.docs.u32")
+        (np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.uint16)).tofile(directory / f"{name}.tfs.u16")
+        _write_json(directory / f"{name}.terms.json", terms)
+
+    @staticmethod
+    def remove_files(directory: Path, name: str) -> None:
+        for suffix in (".terms.json", ".docs.u32", ".tfs.u16"):
+            try:
+                os.remove(directory / f"{name}{suffix}")
+            except FileNotFoundError:
+                pass
+
+class LexicalIndex:
+    def __init__(self, directory: Path, k1: float = 1.2, b: float = 0.75, max_segments: int = 8,
+                 buffer_docs: int = 5000):
+        """
+        Initializes an on-disk BM25 inverted index over chunk texts.
+
+        New chunks are tokenized into an in-memory buffer that is written out as an immutable,
+        memory-mapped segment on flush() or every buffer_docs chunks. Replaced and deleted
+        chunks are tombstoned rather than rewritten; once there are more than max_segments
+        segments, or a third of the documents are tombstones, all segments are merged into
+        one and document numbers are compacted. index.json is the single commit point and is
+        replaced atomically, so a crash leaves the previous generation intact. Segments a merge
+        replaces are deleted only at the following commit, so readers that loaded the previous
+        generation without taking any lock can still open them; a reader that loses that race
+        anyway reloads the newer generation.
+
+        Parameters:
+            directory (Path): Directory holding the index files; created if missing.
+            k1 (float): BM25 term-frequency saturation.
+            b (float): BM25 length normalization.
+            max_segments (int): Segment count that triggers a merge.
+            buffer_docs (int): Chunks buffered in memory before a segment is written.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.buffer_docs = buffer_docs
+        self.lock = threading.RLock()
+        self._reset()
+        self.load()
+
+    def _reset(self) -> None:
+        self.doc_ids: List[Optional[str]] = []
+        self.lengths = np.zeros(0, dtype=np.uint32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.id_to_doc: Dict[str, int] = {}
+        self.segments: List[_Segment] = []
+        self.next_segment = 0
+        self.retired: List[str] = []
+        self.generation = 0
+        self.total_length = 0
+        self.buffer: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.buffered_docs = 0
+        self.dirty = False
+        self.loaded_mtime: Optional[int] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.id_to_doc)
+
+    def contains(self, ids: Iterable[str]) -> bool:
+        """
+        True when every id is indexed. Lock-free, so it is cheap enough for the event loop.
+        """
+        id_to_doc = self.id_to_doc
+        return all(doc_id in id_to_doc for doc_id in ids)
+
+    def _index_path(self) -> Path:
+        return self.directory / "index.json"
+
+    def load(self) -> None:
+        """
+        Loads the committed generation from disk, discarding anything unflushed.
+        """
+        with self.lock:
+            self._reset()
+            index_path = self._index_path()
+            for attempt in range(LOAD_ATTEMPTS):
+                try:
+                    loaded_mtime = index_path.stat().st_mtime_ns
+                    with open(index_path, "r", encoding="utf-8") as file:
+                        data = json.load(file)
+                    segments = [_Segment(self.directory, name) for name in data["segments"]]
+                    break
+                except FileNotFoundError:
+                    if not index_path.exists():
+                        return
+                    # A writer committed twice while this generation was being opened.
+                    if attempt == LOAD_ATTEMPTS - 1:
+                        raise
+            self.loaded_mtime = loaded_mtime
+            self.generation = data["generation"]
+            self.next_segment = data["next_segment"]
+            self.retired = data.get("retired", [])
+            self.doc_ids = data["ids"]
+            self.lengths = np.asarray(data["lengths"], dtype=np.uint32)
+            self.alive = np.asarray([doc_id is not None for doc_id in self.doc_ids], dtype=bool)
+            self.id_to_doc = {doc_id: docno for docno, doc_id in enumerate(self.doc_ids) if doc_id is not None}
+            self.total_length = int(self.lengths[self.alive].sum()) if len(self.lengths) else 0
+            self.segments = segments
+            logging.info(f"Loaded lexical index {self.directory} with {self.size} chunks in {len(self.segments)} segments")
+
+    def refresh(self) -> None:
+        """
+        Reloads the index if another writer committed a newer generation and this instance
+        has no unflushed changes of its own.
+        """
+        with self.lock:
+            if self.dirty:
+                return
+            try:
+                mtime = self._index_path().stat().st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime != self.loaded_mtime:
+                self.load()
+
+    def _grow(self, docs_needed: int) -> None:
+        if docs_needed <= len(self.alive):
+            return
+        capacity = max(1024, len(self.alive))
+        while capacity < docs_needed:
+            capacity *= 2
+        self.alive = np.concatenate([self.alive, np.zeros(capacity - len(self.alive), dtype=bool)])
+        self.lengths = np.concatenate([self.lengths, np.zeros(capacity - len(self.lengths), dtype=np.uint32)])
+
+    def _tombstone(self, doc_id: str) -> bool:
+        docno = self.id_to_doc.pop(doc_id, None)
+        if docno is None:
+            return False
+        self.doc_ids[docno] = None
+        self.alive[docno] = False
+        self.total_length -= int(self.lengths[docno])
+        return True
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        """
+        Indexes chunk texts by id, replacing any earlier text with the same id.
+        """
+        with self.lock:
+            self._grow(len(self.doc_ids) + len(ids))
+            for doc_id, text in zip(ids, texts):
+                self._tombstone(doc_id)
+                terms = Counter(tokenize(text))
+                docno = len(self.doc_ids)
+                self.doc_ids.append(doc_id)
+                self.id_to_doc[doc_id] = docno
+                length = sum(terms.values())
+                self.lengths[docno] = length
+                self.alive[docno] = True
+                self.total_length += length
+                for term, tf in terms.items():
+                    docs, tfs = self.buffer.setdefault(term, ([], []))
+                    docs.append(docno)
+                    tfs.append(min(tf, MAX_TF))
+            self.buffered_docs += len(ids)
+            self.dirty = True
+            if self.buffered_docs >= self.buffer_docs:
+                self.flush()
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """
+        Tombstones chunks by id, returning how many existed.
+        """
+        with self.lock:
+            deleted = sum(self._tombstone(doc_id) for doc_id in ids)
+            if deleted:
+                self.dirty = True
+            return deleted
+
+    def _commit(self, retired: Sequence[str] = ()) -> None:
+        """
+        Writes index.json for a new generation, then deletes the segments the previous
+        generation had retired: no reader can still be about to open them.
+
+        Parameters:
+            retired (Sequence[str]): Segments this generation stops using but the previous one used.
+        """
+        used = len(self.doc_ids)
+        self.generation += 1
+        expired, self.retired = self.retired, list(retired)
+        _write_json(self._index_path(), {
+            "generation": self.generation,
+            "next_segment": self.next_segment,
+            "segments": [segment.name for segment in self.segments],
+            "retired": self.retired,
+            "ids": self.doc_ids,
+            "lengths": self.lengths[:used].tolist(),
+        })
+        self.loaded_mtime = self._index_path().stat().st_mtime_ns
+        self.dirty = False
+        for name in expired:
+            _Segment.remove_files(self.directory, name)
+
+    def flush(self) -> None:
+        """
+        Writes buffered postings as a new segment, merges if needed, and commits.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            if self.buffer:
+                name = f"seg-{self.next_segment:06d}"
+                self.next_segment += 1
+                _Segment.write(self.directory, name, {
+                    term: (np.asarray(docs, dtype=np.uint32), np.asarray(tfs, dtype=np.uint16))
+                    for term, (docs, tfs) in self.buffer.items()
+                })
+                self.segments.append(_Segment(self.directory, name))
+                self.buffer = {}
+                self.buffered_docs = 0
+            used = len(self.doc_ids)
+            tombstones = used - self.size
+            if len(self.segments) > self.max_segments or (used and tombstones * 3 > used):
+                self._merge()
+            else:
+                self._commit()
+
+    def _merge(self) -> None:
+        """
+        Rewrites every segment into one, dropping tombstoned postings and renumbering documents.
+        """
+        used = len(self.doc_ids)
+        alive = self.alive[:used]
+        new_numbers = np.cumsum(alive, dtype=np.int64) - 1
+        merged: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        terms = set()
+        for segment in self.segments:
+            terms.update(segment.terms)
+        for term in terms:
+            docs, tfs = self._postings(term)
+            if len(docs):
+                merged[term] = (new_numbers[docs].astype(np.uint32), tfs)
+        name = f"seg-{self.next_segment:06d}"
+        self.next_segment += 1
+        _Segment.write(self.directory, name, merged)
+        old_segments = self.segments
+        self.segments = [_Segment(self.directory, name)]
+        self.doc_ids = [doc_id for doc_id in self.doc_ids if doc_id is not None]
+        self.lengths = self.lengths[:used][alive].copy()
+        self.alive = np.ones(len(self.doc_ids), dtype=bool)
+        self.id_to_doc = {doc_id: docno for docno, doc_id in enumerate(self.doc_ids)}
+        self._commit(retired=[segment.name for segment in old_segments])
+        logging.info(f"Merged {len(old_segments)} lexical segments into {name} ({self.size} chunks)")
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the live postings of a term across all segments and the buffer.
+        """
+        docs, tfs = [], []
+        for segment in self.segments:
+            postings = segment.postings(term)
+            if postings is not None:
+                docs.append(postings[0])
+                tfs.append(postings[1])
+        if term in self.buffer:
+            docs.append(np.asarray(self.buffer[term][0], dtype=np.uint32))
+            tfs.append(np.asarray(self.buffer[term][1], dtype=np.uint16))
+        if not docs:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint16)
+        docs = np.concatenate(docs)
+        tfs = np.concatenate(tfs)
+        live = self.alive[docs]
+        return docs[live], tfs[live]
+
+    def search(self, query: str, top_k: int = 10, ids: Optional[Sequence[str]] = None) -> dict:
+        """
+        Returns the top_k chunks by BM25 score, in Pinecone's result shape (without metadata).
+
+        Parameters:
+            query (str): The search query.
+            top_k (int): Number of results to return.
+            ids (Sequence[str], optional): Restricts the results to these chunk ids, e.g. the
+                chunks matching a metadata filter.
+        """
+        with self.lock:
+            self.refresh()
+            documents = self.size
+            if documents == 0:
+                return {"matches": []}
+            average_length = self.total_length / documents
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+            for term in set(tokenize(query)):
+                docs, tfs = self._postings(term)
+                if not len(docs):
+                    continue
+                idf = math.log(1 + (documents - len(docs) + 0.5) / (len(docs) + 0.5))
+                tfs = tfs.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / average_length)
+                # Each document appears at most once per term, so plain fancy-index addition is safe.
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            if ids is not None:
+                allowed = np.zeros(len(scores), dtype=bool)
+                allowed[[self.id_to_doc[doc_id] for doc_id in ids if doc_id in self.id_to_doc]] = True
+                scores[~allowed] = 0
+            hits = np.flatnonzero(scores)
+            if not len(hits):
+                return {"matches": []}
+            k = min(top_k, len(hits))
+            top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            top = top[np.argsort(-scores[top])]
+            return {"matches": [{"id": self.doc_ids[docno], "score": float(scores[docno])} for docno in top]}
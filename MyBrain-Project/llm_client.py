@@ -2,34 +2,219 @@
 
 from config import Config  # Import Config class
 import asyncio
+import json
 import logging
+import random
+from typing import AsyncIterator, List, Optional
+from embedding_batcher import EmbeddingBatcher
+from embedding_provider import build_context
 
 logging.basicConfig(level=logging.INFO)
 
+# HTTP statuses worth retrying: rate limiting and server-side failures (e.g. model still loading).
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class OllamaError(Exception):
+    """
+    Raised when the Ollama server rejects a request or keeps failing after all retries.
+    """
+
 class LLMClient:
-    def __init__(self, config=None):
+    def __init__(self, config=None, session=None):
+        """
+        Initializes an async client for the Ollama HTTP API at Config.ollama_url.
+
+        One aiohttp session with a keep-alive connection pool of Config.ollama_pool_size
+        connections is shared by every request and created on first use. Concurrent
+        generate_embedding calls are coalesced into batched /api/embed requests of up to
+        Config.ollama_embed_batch_size inputs. Requests time out after
+        Config.ollama_timeout_seconds and transient failures are retried with exponential
+        backoff. Call close() (or use the client as an async context manager) when done.
+
+        Parameters:
+            config (Config, optional): Defaults to Config.load_default().
+            session (aiohttp.ClientSession, optional): A session to use instead of creating one.
+        """
         self.config = config or Config.load_default()  # Use provided or load default
-        # Initialize LLM client or settings based on config
-        logging.info("LLMClient initialized with configuration: %s", self.config)
+        self.base_url = self.config.ollama_url.rstrip("/")
+        self._session = session
+        self._owns_session = session is None
+        self.batcher = EmbeddingBatcher(
+            self.embed_many, self.config.ollama_embed_batch_size, self.config.embedding_batch_wait_ms
+        )
+        self.requests = 0
+        self.retries = 0
+        logging.info(f"LLMClient initialized for {self.base_url} (model '{self.config.ollama_model}', embeddings '{self.config.ollama_embedding_model}')")
+
+    def _get_session(self):
+        """
+        Returns the shared session, creating it and its connection pool on first use.
+        """
+        if self._session is None or self._session.closed:
+            try:
+                import aiohttp
+            except ImportError as e:
+                raise ImportError("The Ollama client requires aiohttp; install it with 'pip install aiohttp'.") from e
+            connector = aiohttp.TCPConnector(
+                limit=self.config.ollama_pool_size, keepalive_timeout=self.config.ollama_keepalive_seconds
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=self.config.ollama_timeout_seconds, connect=self.config.ollama_connect_timeout_seconds
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        """
+        Closes the session and its pooled connections if this client created them.
+        """
+        if self._session is not None and self._owns_session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _backoff(self, attempt: int, error) -> None:
+        delay = self.config.ollama_backoff_seconds * (2 ** attempt) * (1 + random.random())
+        self.retries += 1
+        logging.warning(f"Ollama request failed ({error}), retry {attempt + 1}/{self.config.ollama_max_retries} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        """
+        POSTs a JSON payload and returns the decoded JSON response, retrying transient errors.
+        """
+        import aiohttp
+        session = self._get_session()
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                async with session.post(f"{self.base_url}{path}", json=payload) as response:
+                    if response.status in RETRY_STATUSES:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status, message=await response.text()
+                        )
+                    if response.status >= 400:
+                        raise OllamaError(f"Ollama {path} returned {response.status}: {await response.text()}")
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.config.ollama_max_retries:
+                    raise OllamaError(f"Ollama {path} failed after {attempt + 1} attempts: {e}") from e
+                await self._backoff(attempt, e)
+                attempt += 1
+
+    async def embed_many(self, texts: List[str]) -> List[list]:
+        """
+        Embeds texts with the /api/embed endpoint, sending up to Config.ollama_embed_batch_size
+        inputs per request.
+        """
+        vectors = []
+        batch_size = self.config.ollama_embed_batch_size
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            result = await self._post("/api/embed", {
+                "model": self.config.ollama_embedding_model, "input": batch,
+                "keep_alive": self.config.ollama_keep_alive,
+            })
+            embeddings = result.get("embeddings") or []
+            if len(embeddings) != len(batch):
+                raise OllamaError(f"Ollama returned {len(embeddings)} embeddings for {len(batch)} inputs")
+            vectors.extend(embeddings)
+        return vectors
 
     async def generate_embedding(self, text, metadata):
         """
-        Simulate embedding generation.
+        Generates an embedding for a text and its metadata through Ollama.
+
+        Concurrent calls are batched into a single /api/embed request.
         """
-        logging.info(f"Generating embedding for text: {text}")
-        await asyncio.sleep(1)  # Simulate async operation
-        return [0.1, 0.2, 0.3]  # Dummy embedding data
+        return await self.batcher.submit(build_context(text, metadata))
 
-    def generate_response(self, prompt):
+    async def warm_up(self) -> None:
         """
-        Generate a response using the configured LLM settings.
+        Opens a pooled connection and has Ollama load the generation model into memory.
+
+        A /api/generate request without a prompt only loads the model, so issuing it while
+        retrieval runs takes the model load off the time to first token.
         """
-        logging.info(f"Using model: {self.config.model_name}")
-        logging.info(f"Using device: {self.config.device}")
-        logging.info(f"Sending request to: {self.config.ollama_url}")
-        # Logic to generate response using the configured settings
-        # This is a placeholder for actual implementation
-        return f"Generated response for prompt: {prompt}"
+        await self._post("/api/generate", {"model": self.config.ollama_model, "keep_alive": self.config.ollama_keep_alive})
+
+    async def stream_response(self, prompt: str, **options) -> AsyncIterator[str]:
+        """
+        Streams the generated text for a prompt from /api/generate, one token chunk at a time.
+
+        Connection failures are retried only until the first token arrives, so a retried
+        request never repeats text that was already yielded.
+
+        Parameters:
+            prompt (str): The prompt to complete.
+            **options: Ollama model options (e.g. temperature, num_ctx).
+        """
+        import aiohttp
+        session = self._get_session()
+        payload = {
+            "model": self.config.ollama_model, "prompt": prompt, "stream": True,
+            "keep_alive": self.config.ollama_keep_alive,
+        }
+        if options:
+            payload["options"] = options
+        attempt = 0
+        while True:
+            self.requests += 1
+            received = False
+            try:
+                async with session.post(f"{self.base_url}/api/generate", json=payload) as response:
+                    if response.status in RETRY_STATUSES:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status, message=await response.text()
+                        )
+                    if response.status >= 400:
+                        raise OllamaError(f"Ollama /api/generate returned {response.status}: {await response.text()}")
+                    # The stream is newline-delimited JSON, one object per token chunk.
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+                        message = json.loads(line)
+                        if message.get("error"):
+                            raise OllamaError(f"Ollama /api/generate failed: {message['error']}")
+                        token = message.get("response", "")
+                        if token:
+                            received = True
+                            yield token
+                        if message.get("done"):
+                            return
+                    return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if received or attempt >= self.config.ollama_max_retries:
+                    raise OllamaError(f"Ollama /api/generate failed: {e}") from e
+                await self._backoff(attempt, e)
+                attempt += 1
+
+    async def generate_response(self, prompt, on_token=None, **options) -> str:
+        """
+        Generates a response with the configured Ollama model.
+
+        Parameters:
+            prompt (str): The prompt to complete.
+            on_token (Callable[[str], None], optional): Called with each token chunk as it streams in.
+            **options: Ollama model options (e.g. temperature, num_ctx).
+
+        Returns:
+            str: The full response text.
+        """
+        logging.info(f"Sending prompt to {self.base_url} using model: {self.config.ollama_model}")
+        tokens = []
+        async for token in self.stream_response(prompt, **options):
+            tokens.append(token)
+            if on_token is not None:
+                on_token(token)
+        return "".join(tokens)
 
     async def analyze_code(self, code_snippet, metadata):
         """
@@ -42,14 +227,19 @@ class LLMClient:
         Returns:
             Any: The result of the code analysis (e.g., syntax tree, code completion suggestions, etc.).
         """
-        # Implement your code analysis logic here
-        # This could involve using the LLM, external libraries, or custom logic
         logging.info(f"Analyzing code snippet: {code_snippet[:50]}...")  # Log a preview of the code
-        # ... (your code analysis implementation) ...
-        return "Code analysis result"  # Replace with the actual analysis result
+        metadata_str = ", ".join(f"{k}: {v}" for k, v in (metadata or {}).items())
+        prompt = (
+            f"Briefly explain what the following code does and point out any problems.\n"
+            f"Metadata: {metadata_str}\n\n```\n{code_snippet}\n```"
+        )
+        return await self.generate_response(prompt)
 
 # Example usage (if this file is run directly)
 if __name__ == "__main__":
-    client = LLMClient()
-    response = client.generate_response("Once upon a time")
-    print(response)
+    async def main():
+        async with LLMClient() as client:
+            await client.generate_response("Once upon a time", on_token=lambda token: print(token, end="", flush=True))
+            print()
+
+    asyncio.run(main())
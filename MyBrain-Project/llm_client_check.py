@@ -0,0 +1,118 @@
+# llm_client_check.py
+
+import asyncio
+import json
+import sys
+from config import Config
+from llm_client import LLMClient, OllamaError
+
+STREAMED_TOKENS = ["Once", " upon", " a", " time"]
+
+class StubOllama:
+    def __init__(self, failures: int = 1):
+        """
+        Initializes a local aiohttp server that imitates the Ollama /api/embed and /api/generate endpoints.
+
+        Parameters:
+            failures (int): Number of /api/embed requests answered with 503 before it succeeds.
+        """
+        self.failures = failures
+        self.embed_requests = 0
+        self.runner = None
+        self.url = None
+
+    async def embed(self, request):
+        from aiohttp import web
+        body = await request.json()
+        self.embed_requests += 1
+        if self.failures > 0:
+            self.failures -= 1
+            return web.Response(status=503, text="model is loading")
+        return web.json_response({
+            "model": body["model"], "embeddings": [[float(len(text)), 1.0] for text in body["input"]],
+        })
+
+    async def generate(self, request):
+        from aiohttp import web
+        await request.json()
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for token in STREAMED_TOKENS:
+            await response.write((json.dumps({"response": token, "done": False}) + "\n").encode("utf-8"))
+            await asyncio.sleep(0.01)
+        await response.write((json.dumps({"response": "", "done": True}) + "\n").encode("utf-8"))
+        return response
+
+    async def start(self) -> str:
+        """
+        Starts the server on a free local port and returns its base URL.
+        """
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post("/api/embed", self.embed)
+        app.router.add_post("/api/generate", self.generate)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+def check(name: str, passed: bool, detail: str = "") -> bool:
+    print(f"{'PASS' if passed else 'FAIL'}: {name}" + (f" ({detail})" if detail else ""))
+    return passed
+
+async def run_checks() -> bool:
+    """
+    Runs LLMClient against the stub server: batching of concurrent embeddings, a retried 503,
+    NDJSON streaming, and an OllamaError once retries against an unreachable server run out.
+
+    Returns:
+        bool: True when every check passed.
+    """
+    config = Config.load_default()
+    config.ollama_backoff_seconds = 0.01
+    server = StubOllama(failures=1)
+    config.ollama_url = await server.start()
+    results = []
+    try:
+        async with LLMClient(config) as client:
+            texts = ["x" * i for i in range(70)]
+            vectors = await asyncio.gather(*(client.generate_embedding(text, {"source": "check"}) for text in texts))
+            batches = -(-len(texts) // config.ollama_embed_batch_size)
+            results.append(check(
+                "concurrent embeddings are batched",
+                len(vectors) == len(texts) and server.embed_requests <= batches + 1,
+                f"{len(texts)} texts, {server.embed_requests} requests",
+            ))
+            results.append(check("a 503 is retried", client.retries == 1, f"{client.retries} retries"))
+
+            tokens = []
+            answer = await client.generate_response("Tell me a story", on_token=tokens.append)
+            results.append(check(
+                "responses stream token by token",
+                tokens == STREAMED_TOKENS and answer == "".join(STREAMED_TOKENS), repr(answer),
+            ))
+    finally:
+        await server.stop()
+
+    # The stopped server's port refuses connections, so every attempt fails.
+    async with LLMClient(config) as client:
+        try:
+            await client.embed_many(["unreachable"])
+            results.append(check("connection errors raise OllamaError", False, "no error raised"))
+        except OllamaError as e:
+            results.append(check(
+                "connection errors raise OllamaError", client.retries == config.ollama_max_retries,
+                f"after {client.retries} retries: {str(e)[:60]}",
+            ))
+    return all(results)
+
+# Checks LLMClient against a local stub server; needs aiohttp but no Ollama install.
+if __name__ == "__main__":
+    if not asyncio.run(run_checks()):
+        sys.exit(1)
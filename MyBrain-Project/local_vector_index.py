@@ -0,0 +1,522 @@
+# local_vector_index.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from metadata_filter import MetadataPostings
+
+INITIAL_CAPACITY = 1024
+# Changed rows are written to the side table after this many changes even if flush() is never called.
+AUTO_FLUSH_ROWS = 10000
+# IVF assignments are computed in blocks of this many rows, taking the lock once per block.
+IVF_ASSIGN_BLOCK = 8192
+
+def _write_json(path: Path, data) -> None:
+    """
+    Writes JSON atomically so a crash never leaves a half-written file.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, default=str)
+    os.replace(tmp_path, path)
+
+class LocalVectorIndex:
+    def __init__(self, directory: Path, ann: str = "none", ann_min_vectors: int = 20000, nprobe: int = 8):
+        """
+        Initializes a local vector index stored in one directory.
+
+        Vectors are L2-normalized and kept in a memory-mapped float32 matrix (vectors.f32), with
+        each row's id and metadata in a SQLite side table (rows.sqlite) to which flush() writes
+        only the rows changed since the last flush. Queries compute exact cosine
+        top-k with one matrix-vector product. With ann="ivf" and at least ann_min_vectors rows,
+        an inverted-file index (k-means centroids over the rows) restricts each query to the
+        nprobe closest lists instead. Each list keeps an array of its rows, updated on upsert
+        and delete, so a query only touches the rows it scores. The centroids are trained,
+        and retrained once the corpus doubles, on a background thread; queries search exactly
+        until the first training finishes. Metadata values are indexed in memory (MetadataPostings),
+        so a filtered query scores only the rows that match the filter. Every flush bumps the
+        generation recorded in meta.json, so another process can refresh() to pick it up.
+
+        Parameters:
+            directory (Path): Directory holding the index files; created if missing.
+            ann (str): "none" for exact search only, or "ivf".
+            ann_min_vectors (int): Row count from which the IVF index is used.
+            nprobe (int): Number of IVF lists scanned per query.
+        """
+        if ann not in ("none", "ivf"):
+            raise ValueError(f"Unsupported ANN index: {ann}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ann = ann
+        self.ann_min_vectors = ann_min_vectors
+        self.nprobe = nprobe
+        self.lock = threading.RLock()
+        self.connection: Optional[sqlite3.Connection] = None
+        self.training: Optional[threading.Thread] = None
+        self._reset()
+        self.load()
+
+    def _reset(self) -> None:
+        self.generation = 0
+        self.loaded_mtime: Optional[int] = None
+        self.dimension: Optional[int] = None
+        self.capacity = 0
+        self.matrix: Optional[np.memmap] = None
+        self.ids: List[Optional[str]] = []
+        self.metadata: List[Optional[dict]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.free_rows: List[int] = []
+        self.postings = MetadataPostings()
+        self.alive = np.zeros(0, dtype=bool)
+        self.dirty_rows: set = set()
+        self.centroids: Optional[np.ndarray] = None
+        self.row_list = np.zeros(0, dtype=np.int32)
+        self.row_position = np.zeros(0, dtype=np.int64)
+        self.list_rows: List[np.ndarray] = []
+        self.list_sizes = np.zeros(0, dtype=np.int64)
+        self.trained_rows = 0
+        self.retrain_dirty: Optional[set] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.id_to_row)
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(str(self._path("rows.sqlite")), check_same_thread=False)
+            with self.connection:
+                self.connection.execute("PRAGMA journal_mode=WAL")
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT NOT NULL, metadata TEXT)"
+                )
+        return self.connection
+
+    def load(self) -> None:
+        """
+        Loads an existing index from its directory.
+
+        Indexes written with the older JSON side tables (ids.json, metadata.json) are read
+        from them once and moved to rows.sqlite on the next flush.
+        """
+        meta_path = self._path("meta.json")
+        if not meta_path.exists():
+            return
+        loaded_mtime = meta_path.stat().st_mtime_ns
+        with open(meta_path, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if self._path("ids.json").exists() and not self._path("rows.sqlite").exists():
+            with open(self._path("ids.json"), "r", encoding="utf-8") as file:
+                self.ids = json.load(file)
+            with open(self._path("metadata.json"), "r", encoding="utf-8") as file:
+                self.metadata = json.load(file)
+            self.dirty_rows = {row for row, vector_id in enumerate(self.ids) if vector_id is not None}
+        else:
+            # Rows a concurrent flush added past this meta.json's capacity wait for the next refresh().
+            for row, vector_id, metadata in self._connect().execute(
+                "SELECT row, id, metadata FROM rows WHERE row < ? ORDER BY row", (meta["capacity"],)
+            ):
+                while len(self.ids) < row:
+                    self.ids.append(None)
+                    self.metadata.append(None)
+                self.ids.append(vector_id)
+                self.metadata.append(json.loads(metadata) if metadata is not None else None)
+        self.loaded_mtime = loaded_mtime
+        self.generation = meta.get("generation", 0)
+        self.dimension = meta["dimension"]
+        self.capacity = meta["capacity"]
+        self.matrix = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(self.capacity, self.dimension))
+        self.alive = np.zeros(self.capacity, dtype=bool)
+        self.row_list = np.full(self.capacity, -1, dtype=np.int32)
+        self.row_position = np.full(self.capacity, -1, dtype=np.int64)
+        for row, vector_id in enumerate(self.ids):
+            if vector_id is None:
+                self.free_rows.append(row)
+            else:
+                self.id_to_row[vector_id] = row
+                self.alive[row] = True
+                self.postings.add(row, self.metadata[row])
+        logging.info(f"Loaded local vector index {self.directory} with {self.size} vectors of dimension {self.dimension}")
+
+    def _ensure_capacity(self, rows_needed: int) -> None:
+        """
+        Grows the memory-mapped matrix by doubling until it holds rows_needed rows.
+        """
+        if rows_needed <= self.capacity:
+            return
+        new_capacity = max(self.capacity, INITIAL_CAPACITY)
+        while new_capacity < rows_needed:
+            new_capacity *= 2
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self._path("vectors.f32"), "ab") as file:
+            file.truncate(new_capacity * self.dimension * 4)
+        self.matrix = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(new_capacity, self.dimension))
+        self.alive = np.concatenate([self.alive, np.zeros(new_capacity - self.capacity, dtype=bool)])
+        self.row_list = np.concatenate([self.row_list, np.full(new_capacity - self.capacity, -1, dtype=np.int32)])
+        self.row_position = np.concatenate([self.row_position, np.full(new_capacity - self.capacity, -1, dtype=np.int64)])
+        self.capacity = new_capacity
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, ids: Sequence[str], vectors: Sequence[Sequence[float]], metadata_list: Sequence[dict]) -> None:
+        """
+        Inserts or replaces vectors by id.
+        """
+        if not ids:
+            return
+        array = self._normalize(np.asarray(vectors, dtype=np.float32))
+        with self.lock:
+            if self.dimension is None:
+                self.dimension = array.shape[1]
+            elif array.shape[1] != self.dimension:
+                raise ValueError(f"Vector dimension {array.shape[1]} does not match index dimension {self.dimension}")
+            new_ids = [vector_id for vector_id in dict.fromkeys(ids) if vector_id not in self.id_to_row]
+            self._ensure_capacity(len(self.ids) + max(0, len(new_ids) - len(self.free_rows)))
+            rows = []
+            for vector_id, metadata in zip(ids, metadata_list):
+                row = self.id_to_row.get(vector_id)
+                if row is None:
+                    if self.free_rows:
+                        row = self.free_rows.pop()
+                    else:
+                        row = len(self.ids)
+                        self.ids.append(None)
+                        self.metadata.append(None)
+                    self.id_to_row[vector_id] = row
+                else:
+                    self.postings.remove(row, self.metadata[row])
+                self.ids[row] = vector_id
+                self.metadata[row] = metadata
+                self.postings.add(row, metadata)
+                self.alive[row] = True
+                rows.append(row)
+            row_array = np.asarray(rows)
+            self.matrix[row_array] = array
+            if self.centroids is not None:
+                self._list_rows(row_array, self._assign(array))
+            if self.retrain_dirty is not None:
+                self.retrain_dirty.update(rows)
+            self._changed(rows)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """
+        Deletes vectors by id, returning how many existed.
+        """
+        deleted = []
+        with self.lock:
+            for vector_id in ids:
+                row = self.id_to_row.pop(vector_id, None)
+                if row is None:
+                    continue
+                self.postings.remove(row, self.metadata[row])
+                self._unlist_row(row)
+                self.ids[row] = None
+                self.metadata[row] = None
+                self.alive[row] = False
+                self.free_rows.append(row)
+                deleted.append(row)
+            self._changed(deleted)
+        return len(deleted)
+
+    def update_metadata(self, ids: Sequence[str], metadata_list: Sequence[dict]) -> int:
+        """
+        Replaces the metadata of existing vectors, returning how many existed.
+        """
+        updated = []
+        with self.lock:
+            for vector_id, metadata in zip(ids, metadata_list):
+                row = self.id_to_row.get(vector_id)
+                if row is None:
+                    continue
+                self.postings.remove(row, self.metadata[row])
+                self.metadata[row] = metadata
+                self.postings.add(row, metadata)
+                updated.append(row)
+            self._changed(updated)
+        return len(updated)
+
+    def fetch_metadata(self, ids: Sequence[str]) -> Dict[str, dict]:
+        """
+        Returns the stored metadata of the given ids that exist.
+        """
+        with self.lock:
+            return {vector_id: self.metadata[self.id_to_row[vector_id]] for vector_id in ids if vector_id in self.id_to_row}
+
+    def _changed(self, rows: Sequence[int]) -> None:
+        self.dirty_rows.update(rows)
+        if len(self.dirty_rows) >= AUTO_FLUSH_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Flushes the matrix and writes the rows changed since the last flush to the side table.
+        """
+        with self.lock:
+            if not self.dirty_rows or self.matrix is None:
+                return
+            self.matrix.flush()
+            rows = sorted(self.dirty_rows)
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO rows (row, id, metadata) VALUES (?, ?, ?)",
+                    [
+                        (row, self.ids[row], json.dumps(self.metadata[row], default=str))
+                        for row in rows if self.ids[row] is not None
+                    ]
+                )
+                connection.executemany(
+                    "DELETE FROM rows WHERE row = ?", [(row,) for row in rows if self.ids[row] is None]
+                )
+            self.generation += 1
+            _write_json(
+                self._path("meta.json"),
+                {"dimension": self.dimension, "capacity": self.capacity, "generation": self.generation}
+            )
+            self.loaded_mtime = self._path("meta.json").stat().st_mtime_ns
+            for legacy in ("ids.json", "metadata.json"):
+                if self._path(legacy).exists():
+                    os.remove(self._path(legacy))
+            self.dirty_rows = set()
+
+    def refresh(self) -> None:
+        """
+        Reloads the index if another process flushed a newer generation and this instance
+        has no unflushed changes of its own.
+        """
+        try:
+            mtime = self._path("meta.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.loaded_mtime:
+            return
+        # A running training installs lists for the rows it sampled, so it finishes first.
+        self.wait_for_training()
+        with self.lock:
+            if self.dirty_rows or self.training is not None:
+                return
+            self._reset()
+            self.load()
+
+    def _assign(self, vectors: np.ndarray, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        centroids = self.centroids if centroids is None else centroids
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def _unlist_row(self, row: int) -> None:
+        """
+        Removes a row from its IVF list by moving the list's last row into its place.
+        """
+        list_id = self.row_list[row]
+        if list_id < 0:
+            return
+        position = self.row_position[row]
+        last = self.list_sizes[list_id] - 1
+        rows = self.list_rows[list_id]
+        moved = rows[last]
+        rows[position] = moved
+        self.row_position[moved] = position
+        self.list_sizes[list_id] = last
+        self.row_list[row] = -1
+        self.row_position[row] = -1
+
+    def _list_rows(self, rows: np.ndarray, assignment: np.ndarray) -> None:
+        """
+        Moves rows into the IVF lists they are assigned to, growing a list's array by doubling.
+        """
+        for row, list_id in zip(rows.tolist(), assignment.tolist()):
+            if self.row_list[row] == list_id:
+                continue
+            self._unlist_row(row)
+            size = self.list_sizes[list_id]
+            if size == len(self.list_rows[list_id]):
+                self.list_rows[list_id] = np.concatenate(
+                    [self.list_rows[list_id], np.empty(max(16, size), dtype=np.int64)]
+                )
+            self.list_rows[list_id][size] = row
+            self.row_list[row] = list_id
+            self.row_position[row] = size
+            self.list_sizes[list_id] = size + 1
+
+    def _train_ivf(self) -> None:
+        """
+        Trains IVF centroids with a few rounds of spherical k-means on a sample of the rows.
+
+        Runs on the training thread. The lock is only held to copy the sample, to assign the
+        rows block by block, and to install the new lists; rows written meanwhile are
+        reassigned with the new centroids before they are installed.
+        """
+        try:
+            with self.lock:
+                rows = np.flatnonzero(self.alive)
+                lists = max(1, int(np.sqrt(len(rows))))
+                rng = np.random.default_rng(0)
+                sample = np.array(self.matrix[np.sort(rng.choice(rows, size=min(len(rows), lists * 64), replace=False))])
+                self.retrain_dirty = set()
+            centroids = sample[rng.choice(len(sample), size=lists, replace=False)]
+            for _ in range(10):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                for i in range(lists):
+                    members = sample[assignment == i]
+                    if len(members):
+                        centroids[i] = members.sum(axis=0)
+                centroids = self._normalize(centroids)
+            centroids = centroids.astype(np.float32)
+            assignments = []
+            for start in range(0, len(rows), IVF_ASSIGN_BLOCK):
+                block = rows[start:start + IVF_ASSIGN_BLOCK]
+                with self.lock:
+                    assignments.append(self._assign(np.asarray(self.matrix[block]), centroids))
+            with self.lock:
+                assignment = np.concatenate(assignments) if assignments else np.zeros(0, dtype=np.int32)
+                dirty = np.fromiter(self.retrain_dirty, dtype=np.int64, count=len(self.retrain_dirty))
+                self.retrain_dirty = None
+                live = self.alive[rows]
+                rows, assignment = rows[live], assignment[live]
+                self.centroids = centroids
+                self.row_list[:] = -1
+                self.row_position[:] = -1
+                self.list_rows = [np.empty(0, dtype=np.int64) for _ in range(lists)]
+                self.list_sizes = np.zeros(lists, dtype=np.int64)
+                order = np.argsort(assignment, kind="stable")
+                bounds = np.searchsorted(assignment[order], np.arange(lists + 1))
+                for i in range(lists):
+                    members = rows[order[bounds[i]:bounds[i + 1]]]
+                    self.list_rows[i] = members.astype(np.int64)
+                    self.list_sizes[i] = len(members)
+                    self.row_list[members] = i
+                    self.row_position[members] = np.arange(len(members))
+                dirty = dirty[self.alive[dirty]] if len(dirty) else dirty
+                if len(dirty):
+                    self._list_rows(dirty, self._assign(np.asarray(self.matrix[dirty])))
+                self.trained_rows = len(rows)
+            logging.info(f"Trained IVF index with {lists} lists over {len(rows)} vectors in {self.directory}")
+        except Exception as e:
+            logging.error(f"Training the IVF index in {self.directory} failed: {e}")
+            with self.lock:
+                self.retrain_dirty = None
+        finally:
+            self.training = None
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> None:
+        """
+        Blocks until a running IVF training finishes, e.g. before benchmarking queries.
+        """
+        training = self.training
+        if training is not None:
+            training.join(timeout)
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Returns the rows to score for a query, or None to score every row exactly.
+        """
+        if self.ann != "ivf" or self.size < self.ann_min_vectors:
+            return None
+        # Train, and retrain once the corpus has doubled since the centroids were fitted, off
+        # the query path.
+        if self.training is None and (self.centroids is None or self.size > 2 * self.trained_rows):
+            self.training = threading.Thread(target=self._train_ivf, name="ivf-train", daemon=True)
+            self.training.start()
+        if self.centroids is None:
+            return None
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        return np.sort(np.concatenate([self.list_rows[i][:self.list_sizes[i]] for i in probes]))
+
+    def _filter_rows(self, filter: dict) -> np.ndarray:
+        """
+        Returns the sorted live rows whose metadata matches the filter, from the posting index.
+        """
+        rows = self.postings.rows(filter, lambda: set(self.id_to_row.values()))
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def _top_matches(self, scores: np.ndarray, rows: np.ndarray, top_k: int, include_metadata: bool) -> dict:
+        """
+        Selects the top_k scores with argpartition and formats them in Pinecone's result shape.
+        """
+        k = min(top_k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return {"matches": []}
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        matches = []
+        for i in top:
+            row = int(rows[i])
+            match = {"id": self.ids[row], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            matches.append(match)
+        return {"matches": matches}
+
+    def query(self, vector: Sequence[float], top_k: int = 5, include_metadata: bool = True,
+              filter: Optional[dict] = None) -> dict:
+        """
+        Returns the top_k most similar vectors by cosine similarity, in Pinecone's result shape.
+
+        With a filter, only the rows matching it are scored. The IVF lists are used only when
+        at least ann_min_vectors rows match, so a selective filter is searched exactly.
+        """
+        with self.lock:
+            if self.matrix is None or self.size == 0:
+                return {"matches": []}
+            query = self._normalize(np.asarray(vector, dtype=np.float32))
+            if filter:
+                rows = self._filter_rows(filter)
+                if len(rows) >= self.ann_min_vectors:
+                    candidates = self._candidate_rows(query)
+                    if candidates is not None:
+                        rows = np.intersect1d(rows, candidates, assume_unique=True)
+                if not len(rows):
+                    return {"matches": []}
+                scores = np.asarray(self.matrix[rows]) @ query
+                return self._top_matches(scores, rows, top_k, include_metadata)
+            used = len(self.ids)
+            rows = self._candidate_rows(query)
+            if rows is None:
+                scores = np.asarray(self.matrix[:used]) @ query
+                scores[~self.alive[:used]] = -np.inf
+                rows = np.arange(used)
+            else:
+                scores = np.asarray(self.matrix[rows]) @ query
+            return self._top_matches(scores, rows, top_k, include_metadata)
+
+    def query_many(self, vectors: Sequence[Sequence[float]], top_k: int = 5, include_metadata: bool = True,
+                   filter: Optional[dict] = None) -> List[dict]:
+        """
+        Runs several queries at once; exact search scores them all with one matrix product.
+        """
+        with self.lock:
+            if self.matrix is None or self.size == 0:
+                return [{"matches": []} for _ in vectors]
+            if self.ann == "ivf" and self.size >= self.ann_min_vectors:
+                return [self.query(vector, top_k, include_metadata, filter) for vector in vectors]
+            queries = self._normalize(np.asarray(vectors, dtype=np.float32))
+            if filter:
+                rows = self._filter_rows(filter)
+                if not len(rows):
+                    return [{"matches": []} for _ in vectors]
+                scores = np.asarray(self.matrix[rows]) @ queries.T
+            else:
+                used = len(self.ids)
+                scores = np.asarray(self.matrix[:used]) @ queries.T
+                scores[~self.alive[:used]] = -np.inf
+                rows = np.arange(used)
+            return [self._top_matches(scores[:, i], rows, top_k, include_metadata) for i in range(len(queries))]
+
+    def matching_ids(self, filter: dict) -> List[str]:
+        """
+        Returns the ids of the vectors whose metadata matches the filter.
+        """
+        with self.lock:
+            return [self.ids[row] for row in self._filter_rows(filter)]
@@ -1,22 +1,54 @@
 # main.py
 
+import argparse
 import asyncio
-from pathlib import Path
 from file_processor import DocumentProcessor
 from config import Config
 from scanner import DirectoryScanner
 from utils import setup_logging
+from watcher import WatchService
 
-async def main():
+async def main(watch: bool = False):
     config = Config.load_default()
     config.validate()
     setup_logging(config.log_level, config.log_format, config.log_file)
     document_processor = DocumentProcessor(config)
-    scanner = DirectoryScanner(Path("path/to/directory"))
-    files_to_process = scanner.scan_and_split()
-    for file in files_to_process:
-        result = await document_processor.validate_and_process_file(file)
-        print(result)
+    scanner = DirectoryScanner(config.repo_path, config)
+    queue = asyncio.Queue(maxsize=config.scan_queue_size)
+    watch_service = WatchService(document_processor, scanner, config) if watch else None
+    try:
+        if watch_service is not None:
+            # Listen before the initial scan so edits made while it runs are not missed.
+            await watch_service.start()
+        consumers = [
+            asyncio.create_task(document_processor.consume(queue)) for _ in range(config.ingest_workers)
+        ]
+        scan = await scanner.scan_to_queue(queue, consumers=len(consumers))
+        results = [result for batch in await asyncio.gather(*consumers) for result in batch]
+        for result in results:
+            print(result)
+        if scan.incomplete:
+            print("Scan was incomplete; skipping removal of missing files.")
+        else:
+            document_processor.prune_missing_files(result["file_path"] for result in results)
+        print(f"Upsert throughput: {document_processor.vector_store.throughput_report()}")
+        if document_processor.deduplicator is not None:
+            print(f"Chunk deduplication: {document_processor.deduplicator.report()}")
+        if watch_service is not None:
+            document_processor.save_manifest()
+            print(f"Watching {config.repo_path} for changes; press Ctrl+C to stop.")
+            await watch_service.run()
+    finally:
+        if watch_service is not None:
+            watch_service.stop()
+        document_processor.save_manifest()
+        await document_processor.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Index a notes directory into the vector store.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and reindex files as they change.")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(watch=args.watch))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,152 @@
+# manifest.py
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Version 2 ids chunks by vault-relative path and content hash instead of file stem and position.
+MANIFEST_VERSION = 2
+
+def hash_content(data: bytes) -> str:
+    """
+    Returns the hex SHA-256 digest used to fingerprint file and chunk content.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+class IndexManifest:
+    def __init__(self, manifest_path: Path, model_name: str):
+        """
+        Initializes the manifest that records what has already been indexed.
+
+        Each entry is keyed by file path and stores the file's mtime, size, content hash,
+        the embedding model name and a mapping of chunk id to chunk hash, so later runs
+        can skip unchanged files and re-embed only the chunks that changed. A chunk hash is
+        "<embedding hash>:<metadata hash>", so a chunk that only moved within its file gets
+        a metadata update instead of a new embedding.
+
+        Parameters:
+            manifest_path (Path): Location of the JSON manifest on disk.
+            model_name (str): The embedding model the index is currently built with.
+        """
+        self.manifest_path = Path(manifest_path)
+        self.model_name = model_name
+        self.entries: Dict[str, dict] = {}
+        self.dirty = False
+        self.load()
+
+    def load(self) -> None:
+        """
+        Loads the manifest from disk, discarding it if it was built with a different model.
+        """
+        if not self.manifest_path.exists():
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read manifest {self.manifest_path}: {e}. Starting from an empty manifest.")
+            return
+        if data.get("version") != MANIFEST_VERSION or data.get("model_name") != self.model_name:
+            if data.get("version") != MANIFEST_VERSION:
+                logging.info("Manifest version changed, re-indexing all files.")
+            else:
+                logging.info(f"Embedding model changed from '{data.get('model_name')}' to '{self.model_name}', re-indexing all files.")
+            # Keep the chunk ids so stale vectors can still be deleted, but drop their hashes
+            # so every chunk is re-embedded.
+            self.entries = {
+                path: {"chunks": {chunk_id: None for chunk_id in entry.get("chunks", {})}}
+                for path, entry in data.get("files", {}).items()
+            }
+            self.dirty = True
+            return
+        self.entries = data.get("files", {})
+        logging.info(f"Loaded manifest with {len(self.entries)} files from {self.manifest_path}")
+
+    def save(self) -> None:
+        """
+        Writes the manifest to disk atomically if anything changed since the last save.
+        """
+        if not self.dirty:
+            return
+        data = {"version": MANIFEST_VERSION, "model_name": self.model_name, "files": self.entries}
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        try:
+            if self.manifest_path.parent != Path(""):
+                self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file)
+            os.replace(tmp_path, self.manifest_path)
+            self.dirty = False
+            logging.info(f"Manifest saved with {len(self.entries)} files to {self.manifest_path}")
+        except OSError as e:
+            logging.error(f"Error writing manifest {self.manifest_path}: {e}")
+            raise
+
+    def is_unchanged(self, file_path: Path, mtime: float, size: int, content_hash: Optional[str] = None) -> bool:
+        """
+        Checks whether a file matches its manifest entry.
+
+        A matching mtime and size is trusted without reading the file. When they differ but a
+        content hash is given (e.g. the file was touched but not edited), the hash decides. A
+        file with chunks that have no hash (they failed to embed) is never unchanged.
+        """
+        entry = self.entries.get(str(file_path))
+        if not entry or "content_hash" not in entry:
+            return False
+        if None in entry.get("chunks", {}).values():
+            return False
+        if entry.get("mtime") == mtime and entry.get("size") == size:
+            return True
+        return content_hash is not None and entry["content_hash"] == content_hash
+
+    def get_chunk_hashes(self, file_path: Path) -> Dict[str, Optional[str]]:
+        """
+        Returns the chunk id to chunk hash mapping recorded for a file. The hash is None for
+        chunks that still have to be embedded.
+        """
+        entry = self.entries.get(str(file_path))
+        return dict(entry.get("chunks", {})) if entry else {}
+
+    def update(self, file_path: Path, mtime: float, size: int, content_hash: str,
+               chunks: Dict[str, Optional[str]]) -> None:
+        """
+        Records the indexed state of a file.
+        """
+        self.entries[str(file_path)] = {
+            "mtime": mtime,
+            "size": size,
+            "content_hash": content_hash,
+            "model_name": self.model_name,
+            "chunks": chunks,
+        }
+        self.dirty = True
+
+    def touch(self, file_path: Path, mtime: float, size: int) -> None:
+        """
+        Refreshes the stat fields of an entry whose content hash did not change.
+        """
+        entry = self.entries.get(str(file_path))
+        if entry:
+            entry["mtime"] = mtime
+            entry["size"] = size
+            self.dirty = True
+
+    def remove(self, file_path: Path) -> List[str]:
+        """
+        Removes a file from the manifest and returns the chunk ids it owned.
+        """
+        entry = self.entries.pop(str(file_path), None)
+        if entry is None:
+            return []
+        self.dirty = True
+        return list(entry.get("chunks", {}))
+
+    def missing_files(self, seen_paths: Iterable) -> List[str]:
+        """
+        Returns the manifest paths that were not seen in the latest scan.
+        """
+        seen = {str(path) for path in seen_paths}
+        return [path for path in self.entries if path not in seen]
@@ -0,0 +1,188 @@
+# markdown_chunker.py
+
+import logging
+import re
+from typing import Callable, Generator, Iterable, Iterator, List, Optional, Tuple
+from chunk_record import ChunkRecord, SourceWindow
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+# Split points tried in order when a block is too large, from coarse to fine. Each separator
+# stays at the end of the piece before it, so contiguous pieces concatenate back to the source.
+SPLIT_PATTERNS = {
+    "code": [r"\n"],
+    "table": [r"\n"],
+    "list": [r"\n(?=\s*(?:[-*+]|\d+[.)])\s)", r"\n"],
+    "text": [r"\n", r"(?<=[.!?])\s+", r"\s+"],
+}
+
+Measure = Callable[[List[str]], List[int]]
+
+def measure_chars(texts: List[str]) -> List[int]:
+    """
+    Measures texts by character count.
+    """
+    return [len(text) for text in texts]
+
+def _line_kind(line: str) -> str:
+    stripped = line.lstrip()
+    if stripped.startswith("|"):
+        return "table"
+    if stripped.startswith(">"):
+        return "callout"
+    if LIST_ITEM.match(line):
+        return "list"
+    return "text"
+
+def iter_markdown_blocks(lines: Iterable[str], start_offset: int = 0) -> Generator[Tuple[str, str, int], None, None]:
+    """
+    Splits a markdown line stream into structural blocks.
+
+    Yields:
+        Tuple[str, str, int]: The block kind ("heading", "code", "table", "list", "callout" or
+        "text"), its text and its start offset. Blank lines are not yielded.
+    """
+    offset = start_offset
+    kind: Optional[str] = None
+    block: List[str] = []
+    block_start = offset
+    fence: Optional[str] = None
+    for line in lines:
+        stripped = line.strip()
+        if fence is not None:
+            block.append(line)
+            if stripped.startswith(fence):
+                yield "code", "".join(block), block_start
+                block, kind, fence = [], None, None
+            offset += len(line)
+            continue
+        line_kind = None
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            line_kind = "code"
+        elif HEADING.match(line):
+            line_kind = "heading"
+        elif stripped:
+            line_kind = _line_kind(line)
+            # Indented lines continue a list item.
+            if kind == "list" and line[:1].isspace():
+                line_kind = "list"
+        if block and (line_kind != kind or line_kind in ("heading", "code")):
+            yield kind, "".join(block), block_start
+            block, kind = [], None
+        if line_kind == "code":
+            fence = stripped[:3]
+        if line_kind is not None:
+            if not block:
+                block_start = offset
+            block.append(line)
+            kind = line_kind
+            if line_kind == "heading":
+                yield "heading", line, offset
+                block, kind = [], None
+        offset += len(line)
+    if block:
+        # An unclosed fence is not a code block; treat it as text.
+        yield ("text" if fence is not None else kind), "".join(block), block_start
+
+class MarkdownChunkStream:
+    def __init__(self, lines: Iterable[str], metadata: dict, max_size: int, measure: Measure = measure_chars, start_offset: int = 0):
+        """
+        Chunks markdown along its heading hierarchy: one chunk per section.
+
+        Every chunk record carries the path of headings above it as heading_path.
+        A section larger than max_size (as measured by measure, e.g. a batched token counter)
+        is split between its blocks, and an oversized block recursively on lines, list items,
+        sentences and finally whitespace. Fenced code, tables, lists and callouts are kept
+        whole whenever they fit. Heading-only sections produce no chunk. Each chunk's text is
+        the exact source slice between its start and end offsets.
+
+        Iterate the stream to get the chunks; total is the number of chunks yielded so far.
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be greater than 0.")
+        self.source = SourceWindow(lines, start_offset)
+        self.metadata = metadata
+        self.max_size = max_size
+        self.measure = measure
+        self.start_offset = start_offset
+        self.total = 0
+        self.complete = False
+
+    def _split(self, kind: str, text: str, start: int, size: int, level: int = 0) -> List[Tuple[str, int, int]]:
+        """
+        Recursively splits one block into (text, start, size) pieces that fit max_size.
+        """
+        patterns = SPLIT_PATTERNS.get(kind, SPLIT_PATTERNS["text"])
+        if size <= self.max_size or level >= len(patterns):
+            return [(text, start, size)]
+        pieces, position = [], 0
+        for match in re.finditer(patterns[level], text):
+            if match.end() < len(text):
+                pieces.append((text[position:match.end()], position))
+                position = match.end()
+        pieces.append((text[position:], position))
+        if len(pieces) == 1:
+            return self._split(kind, text, start, size, level + 1)
+        sizes = self.measure([piece for piece, _ in pieces])
+        result = []
+        for (piece, offset), piece_size in zip(pieces, sizes):
+            result.extend(self._split(kind, piece, start + offset, piece_size, level + 1))
+        return result
+
+    def _emit(self, parts: List[Tuple[str, str, int]], heading_path: List[str]) -> Optional[ChunkRecord]:
+        kinds = {kind for kind, _, _ in parts}
+        _, first_text, first_start = parts[0]
+        _, last_text, last_start = parts[-1]
+        start = first_start + len(first_text) - len(first_text.lstrip())
+        end = last_start + len(last_text.rstrip())
+        text = self.source.take(start, end).strip() if end > start else ""
+        if not text:
+            return None
+        self.total += 1
+        return ChunkRecord(
+            text, "code" if kinds == {"code"} else "text", self.metadata,
+            start=start, end=end, heading_path=heading_path,
+        )
+
+    def _section_chunks(self, blocks: List[Tuple[str, str, int]], heading_path: List[str]) -> Iterator[ChunkRecord]:
+        if not any(kind != "heading" for kind, _, _ in blocks):
+            return
+        sizes = self.measure([text for _, text, _ in blocks])
+        if sum(sizes) <= self.max_size:
+            chunk = self._emit(blocks, heading_path)
+            if chunk:
+                yield chunk
+            return
+        current: List[Tuple[str, str, int]] = []
+        current_size = 0
+        for (kind, text, start), size in zip(blocks, sizes):
+            for piece, piece_start, piece_size in self._split(kind, text, start, size):
+                if current and current_size + piece_size > self.max_size:
+                    chunk = self._emit(current, heading_path)
+                    if chunk:
+                        yield chunk
+                    current, current_size = [], 0
+                current.append((kind, piece, piece_start))
+                current_size += piece_size
+        if current:
+            chunk = self._emit(current, heading_path)
+            if chunk:
+                yield chunk
+
+    def __iter__(self) -> Iterator[ChunkRecord]:
+        stack: List[Tuple[int, str]] = []
+        section: List[Tuple[str, str, int]] = []
+        for kind, text, start in iter_markdown_blocks(self.source, self.start_offset):
+            if kind == "heading":
+                yield from self._section_chunks(section, [title for _, title in stack])
+                match = HEADING.match(text)
+                level = len(match.group(1))
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, match.group(2)))
+                section = [(kind, text, start)]
+            else:
+                section.append((kind, text, start))
+        yield from self._section_chunks(section, [title for _, title in stack])
+        self.complete = True
+        logging.info(f"Generated {self.total} section chunks for file.")
@@ -0,0 +1,218 @@
+# metadata_filter.py
+
+import json
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+# Filters use Pinecone's syntax, e.g.
+#   {"tags": "python", "date": {"$gte": "2024-01-01"}, "$or": [{"project": "a"}, {"project": "b"}]}
+# A bare value means $eq; for list-valued fields such as tags, $eq/$in match any element.
+COMPARISON_OPERATORS = {"$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte", "$exists"}
+LOGICAL_OPERATORS = {"$and", "$or"}
+
+class MetadataFilterError(ValueError):
+    """
+    Raised for a malformed filter expression.
+    """
+
+def _is_scalar(value) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+def value_key(value) -> tuple:
+    """
+    Returns a hashable key for a scalar, keeping True distinct from 1 as Pinecone does.
+    """
+    return (isinstance(value, bool), value)
+
+def comparable(left, right) -> bool:
+    """
+    True when a range comparison between the two values is meaningful: both strings
+    (ISO dates compare correctly as strings) or both non-boolean numbers.
+    """
+    if isinstance(left, str) and isinstance(right, str):
+        return True
+    numbers = (int, float)
+    return (isinstance(left, numbers) and not isinstance(left, bool)
+            and isinstance(right, numbers) and not isinstance(right, bool))
+
+RANGE_TESTS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+}
+
+def validate_filter(filter: Optional[dict]) -> None:
+    """
+    Checks a filter expression, so a bad filter fails before any search work is done.
+
+    Raises:
+        MetadataFilterError: If the expression is not a valid filter.
+    """
+    if filter is None:
+        return
+    if not isinstance(filter, dict):
+        raise MetadataFilterError(f"A filter must be a dict, not {type(filter).__name__}")
+    for field, condition in filter.items():
+        if field in LOGICAL_OPERATORS:
+            if not isinstance(condition, list) or not condition:
+                raise MetadataFilterError(f"{field} takes a non-empty list of filters")
+            for clause in condition:
+                validate_filter(clause)
+            continue
+        if field.startswith("$"):
+            raise MetadataFilterError(f"Unsupported filter operator: {field}")
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator not in COMPARISON_OPERATORS:
+                raise MetadataFilterError(f"Unsupported filter operator for '{field}': {operator}")
+            if operator in ("$in", "$nin"):
+                if not isinstance(operand, list) or not all(_is_scalar(item) for item in operand):
+                    raise MetadataFilterError(f"{operator} on '{field}' takes a list of values")
+            elif operator == "$exists":
+                if not isinstance(operand, bool):
+                    raise MetadataFilterError(f"$exists on '{field}' takes true or false")
+            elif not _is_scalar(operand):
+                raise MetadataFilterError(f"{operator} on '{field}' takes a string, number or boolean")
+
+def filter_key(filter: Optional[dict]) -> Optional[str]:
+    """
+    Returns a canonical string for a filter, for use in cache keys.
+    """
+    return None if filter is None else json.dumps(filter, sort_keys=True, default=str)
+
+def _field_values(metadata: dict, field: str) -> Optional[list]:
+    if field not in metadata:
+        return None
+    value = metadata[field]
+    return list(value) if isinstance(value, list) else [value]
+
+def _matches_condition(values: Optional[list], operator: str, operand) -> bool:
+    if operator == "$exists":
+        return (values is not None) == operand
+    if operator == "$eq":
+        return values is not None and value_key(operand) in {value_key(value) for value in values}
+    if operator == "$ne":
+        return not _matches_condition(values, "$eq", operand)
+    if operator == "$in":
+        return values is not None and bool({value_key(item) for item in operand} & {value_key(value) for value in values})
+    if operator == "$nin":
+        return not _matches_condition(values, "$in", operand)
+    test = RANGE_TESTS[operator]
+    return values is not None and any(comparable(value, operand) and test(value, operand) for value in values)
+
+def matches_filter(filter: Optional[dict], metadata: Optional[dict]) -> bool:
+    """
+    Evaluates a filter against one metadata dict.
+
+    Used where no posting index is available, e.g. to post-filter lexical matches from a
+    Pinecone-backed store.
+    """
+    if not filter:
+        return True
+    metadata = metadata or {}
+    for field, condition in filter.items():
+        if field == "$and":
+            if not all(matches_filter(clause, metadata) for clause in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches_filter(clause, metadata) for clause in condition):
+                return False
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        values = _field_values(metadata, field)
+        if not all(_matches_condition(values, operator, operand) for operator, operand in condition.items()):
+            return False
+    return True
+
+class MetadataPostings:
+    def __init__(self):
+        """
+        Initializes an inverted index from metadata field values to row numbers.
+
+        Each field maps every distinct scalar value to the set of rows holding it (each
+        element of a list value is indexed on its own). Equality and $in look the rows up
+        directly; range operators scan the field's distinct values rather than the rows, and
+        negations are taken against the set of live rows.
+        """
+        self.fields: Dict[str, Dict[tuple, Set[int]]] = {}
+        self.values: Dict[tuple, Any] = {}
+
+    def add(self, row: int, metadata: Optional[dict]) -> None:
+        for field, value in (metadata or {}).items():
+            postings = self.fields.setdefault(field, {})
+            for item in (value if isinstance(value, list) else [value]):
+                if not _is_scalar(item):
+                    continue
+                key = value_key(item)
+                self.values.setdefault(key, item)
+                postings.setdefault(key, set()).add(row)
+
+    def remove(self, row: int, metadata: Optional[dict]) -> None:
+        for field, value in (metadata or {}).items():
+            postings = self.fields.get(field)
+            if postings is None:
+                continue
+            for item in (value if isinstance(value, list) else [value]):
+                if not _is_scalar(item):
+                    continue
+                key = value_key(item)
+                rows = postings.get(key)
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del postings[key]
+            if not postings:
+                del self.fields[field]
+
+    def _union(self, postings: Dict[tuple, Set[int]], keys: Iterable[tuple]) -> Set[int]:
+        rows: Set[int] = set()
+        for key in keys:
+            rows |= postings.get(key, set())
+        return rows
+
+    def _condition_rows(self, field: str, operator: str, operand, live: Callable[[], Set[int]]) -> Set[int]:
+        postings = self.fields.get(field, {})
+        if operator == "$exists":
+            present = self._union(postings, postings)
+            return present if operand else live() - present
+        if operator == "$eq":
+            return set(postings.get(value_key(operand), set()))
+        if operator == "$ne":
+            return live() - postings.get(value_key(operand), set())
+        if operator == "$in":
+            return self._union(postings, (value_key(item) for item in operand))
+        if operator == "$nin":
+            return live() - self._union(postings, (value_key(item) for item in operand))
+        test = RANGE_TESTS[operator]
+        keys = [key for key in postings if comparable(self.values[key], operand) and test(self.values[key], operand)]
+        return self._union(postings, keys)
+
+    def rows(self, filter: dict, live: Callable[[], Set[int]]) -> Set[int]:
+        """
+        Returns the live rows whose metadata satisfies the filter.
+
+        Parameters:
+            filter (dict): A validated, non-empty filter expression.
+            live (Callable[[], Set[int]]): Returns all live rows; only called for negations.
+        """
+        result: Optional[Set[int]] = None
+        for field, condition in filter.items():
+            if field == "$and":
+                clauses = [self.rows(clause, live) for clause in condition]
+            elif field == "$or":
+                matched: Set[int] = set()
+                for clause in condition:
+                    matched |= self.rows(clause, live)
+                clauses = [matched]
+            else:
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                clauses = [self._condition_rows(field, operator, operand, live) for operator, operand in condition.items()]
+            for rows in clauses:
+                result = rows if result is None else result & rows
+            if not result:
+                break
+        return result if result is not None else set(live())
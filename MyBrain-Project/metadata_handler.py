@@ -1,38 +1,178 @@
 # metadata_handler.py
 
+import datetime
+import json
 import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 import yaml
 
-def has_yaml_metadata(file_path: Path) -> bool:
+# libyaml's C loader is several times faster; fall back to the pure-Python one without it.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# Front matter larger than this is treated as absent rather than read to the end of the file.
+MAX_FRONT_MATTER_BYTES = 1024 * 1024
+FRONT_MATTER_CACHE_SIZE = 50000
+
+_front_matter_cache: "OrderedDict[tuple, Tuple[Optional[dict], int]]" = OrderedDict()
+_front_matter_lock = threading.Lock()
+
+def _normalize_scalar(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+def normalize_metadata_value(value):
+    """
+    Converts a YAML value into a type vector stores accept: str, number, bool or list of str.
+
+    Dates become ISO strings, lists become lists of strings (None items dropped) and
+    mappings become JSON strings. Returns None for None, which callers drop.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return [str(_normalize_scalar(item)) for item in value if item is not None]
+    if isinstance(value, dict):
+        return json.dumps(value, sort_keys=True, default=_normalize_scalar)
+    return _normalize_scalar(value)
+
+def normalize_metadata(metadata: dict) -> dict:
+    """
+    Normalizes every front matter value into a JSON-safe type, dropping None values.
+    """
+    normalized = {}
+    for key, value in metadata.items():
+        value = normalize_metadata_value(value)
+        if value is not None:
+            normalized[str(key)] = value
+    return normalized
+
+def parse_front_matter(content: str, file_path: Optional[Path] = None) -> Tuple[Optional[dict], int]:
     """
-    Checks if the provided file contains YAML metadata.
+    Parses YAML front matter from already-read content.
+
+    Returns:
+        Tuple[Optional[dict], int]: The metadata (None if absent or invalid) and the character
+        offset where the body starts after the closing delimiter (0 if there is no front matter).
     """
+    stripped = content.lstrip()
+    if not stripped.startswith("---"):
+        return None, 0
+    start = len(content) - len(stripped) + 3
+    closing = content.find("\n---", start)
+    if closing == -1:
+        return None, 0
+    line_end = content.find("\n", closing + 4)
+    body_offset = len(content) if line_end == -1 else line_end + 1
     try:
-        with file_path.open("r", encoding="utf-8") as file:
-            content = file.read()
-            if content.strip().startswith("---"):
-                return True
+        metadata = yaml.load(content[start:closing].strip(), Loader=SafeLoader)
+    except yaml.YAMLError as e:
+        logging.error(f"YAML parsing error in {file_path}: {e}")
+        return None, body_offset
+    return (normalize_metadata(metadata) if isinstance(metadata, dict) else None), body_offset
+
+def _read_front_matter_head(file_path: Path) -> str:
+    """
+    Reads a file line by line only up to and including the closing front matter delimiter.
+
+    Returns an empty string when the file has no front matter, so the body is never read.
+    """
+    lines = []
+    read = 0
+    opened = False
+    with open(file_path, "rb") as file:
+        for line in file:
+            read += len(line)
+            if read > MAX_FRONT_MATTER_BYTES:
+                return ""
+            lines.append(line)
+            if not opened:
+                stripped = line.strip()
+                if not stripped:
+                    continue
+                if not stripped.startswith(b"---"):
+                    return ""
+                opened = True
+            elif line.startswith(b"---"):
+                return b"".join(lines).decode("utf-8")
+    return ""
+
+def read_front_matter(file_path: Path, mtime: Optional[float] = None, size: Optional[int] = None) -> Tuple[Optional[dict], int]:
+    """
+    Parses a file's front matter without reading its body, caching the result.
+
+    Results are cached by (path, mtime, size), so an unchanged file is never parsed twice in
+    a process. mtime and size are taken from os.stat when not given.
+
+    Returns:
+        Tuple[Optional[dict], int]: The normalized metadata (None if absent or invalid) and
+        the character offset where the body starts, as parse_front_matter returns them.
+    """
+    if mtime is None or size is None:
+        stat = Path(file_path).stat()
+        mtime, size = stat.st_mtime, stat.st_size
+    cached = cached_front_matter(file_path, mtime, size)
+    if cached is not None:
+        return cached
+    result = parse_front_matter(_read_front_matter_head(file_path), file_path)
+    cache_front_matter((str(file_path), mtime, size), result)
+    return result
+
+def cached_front_matter(file_path: Path, mtime: Optional[float], size: Optional[int]) -> Optional[Tuple[Optional[dict], int]]:
+    """
+    Returns the cached (metadata, body_offset) for a file version, or None if it is not cached.
+    """
+    if mtime is None or size is None:
+        return None
+    key = (str(file_path), mtime, size)
+    with _front_matter_lock:
+        cached = _front_matter_cache.get(key)
+        if cached is not None:
+            _front_matter_cache.move_to_end(key)
+        return cached
+
+def cache_front_matter(key: tuple, result: Tuple[Optional[dict], int]) -> None:
+    """
+    Stores a parse result under its (path, mtime, size) key, evicting the least recently used.
+    """
+    with _front_matter_lock:
+        _front_matter_cache[key] = result
+        while len(_front_matter_cache) > FRONT_MATTER_CACHE_SIZE:
+            _front_matter_cache.popitem(last=False)
+
+def has_yaml_metadata(file_path) -> bool:
+    """
+    Checks if the provided file (a Path or a ParsedDocument) contains YAML metadata.
+    """
+    try:
+        if isinstance(file_path, Path):
+            with file_path.open("r", encoding="utf-8") as file:
+                # Only the start of the file matters; skip leading blank lines without reading the body.
+                for line in file:
+                    if line.strip():
+                        return line.strip().startswith("---")
+            return False
+        return file_path.has_front_matter
     except Exception as e:
         logging.error(f"Error checking YAML metadata in {file_path}: {e}")
     return False
 
-def extract_metadata(file_path: Path) -> Optional[dict]:
+def extract_metadata(file_path) -> Optional[dict]:
     """
-    Extracts YAML metadata from the provided file.
+    Extracts YAML metadata from the provided file (a Path or a ParsedDocument).
+
+    A ParsedDocument reuses its single read and parse instead of opening the file again; a
+    Path is read only up to the closing front matter delimiter.
     """
     try:
-        with file_path.open("r", encoding="utf-8") as file:
-            content = file.read()
-            if content.strip().startswith("---"):
-                parts = content.split("---", 2)
-                yaml_content = parts[1].strip()
-                metadata = yaml.safe_load(yaml_content)
-                if isinstance(metadata, dict):
-                    return metadata
-    except yaml.YAMLError as e:
-        logging.error(f"YAML parsing error in {file_path}: {e}")
+        if not isinstance(file_path, Path):
+            return file_path.metadata
+        metadata, _ = read_front_matter(file_path)
+        return metadata
     except Exception as e:
         logging.error(f"Error extracting metadata from {file_path}: {e}")
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,74 @@
+# query_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+class TTLCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        """
+        Initializes an in-process LRU cache whose entries also expire after ttl_seconds.
+
+        Parameters:
+            max_entries (int): Maximum number of entries; 0 disables the cache.
+            ttl_seconds (float): Lifetime of an entry in seconds.
+        """
+        if max_entries < 0:
+            raise ValueError("max_entries must be non-negative.")
+        if ttl_seconds <= 0:
+            raise ValueError("ttl_seconds must be greater than 0.")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Returns the cached value for key, or default if it is missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a value, evicting the least recently used entry when full.
+        """
+        if self.max_entries == 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the current size, for sizing the cache.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+            }
@@ -0,0 +1,202 @@
+# rag.py
+
+import asyncio
+import logging
+import re
+import time
+from typing import Callable, List, Optional
+from config import Config
+from chunk_dedup import chunk_text_hash
+from chunk_record import read_chunk_text
+from llm_client import LLMClient
+from search import SearchService, get_search_service
+from token_chunker import TokenCounter
+
+CITATION = re.compile(r"\[(\d+)\]")
+NO_CONTEXT_ANSWER = "I could not find anything in your notes about that."
+
+PROMPT_TEMPLATE = (
+    "Answer the question using only the numbered sources below, which are excerpts from the "
+    "user's notes. Cite the sources you use as [1], [2], ... If the sources do not contain the "
+    "answer, say so.\n\n{sources}\n\nQuestion: {question}\nAnswer:"
+)
+
+class AnswerPipeline:
+    def __init__(self, config: Optional[Config] = None, search_service: Optional[SearchService] = None,
+                 llm_client: Optional[LLMClient] = None):
+        """
+        Initializes a retrieval-augmented question answering pipeline over the indexed notes.
+
+        ask() retrieves chunks with SearchService.retrieve() while the Ollama model is loaded
+        and a pooled connection opened in parallel, packs the best distinct chunks into
+        Config.rag_context_tokens, streams the answer from LLMClient.stream_response() and
+        returns it with citations back to the files and character offsets of the chunks.
+
+        Parameters:
+            config (Config, optional): Defaults to Config.load_default().
+            search_service (SearchService, optional): Defaults to the process-wide service.
+            llm_client (LLMClient, optional): An existing client to share.
+        """
+        self.config = config or Config.load_default()
+        self.search_service = search_service or get_search_service()
+        self.llm_client = llm_client or LLMClient(self.config)
+        self.model_ready = False
+
+    async def _warm_model(self) -> None:
+        if self.model_ready:
+            return
+        try:
+            await self.llm_client.warm_up()
+            self.model_ready = True
+        except Exception as e:
+            # Generation retries on its own; a failed warm-up only loses the overlap.
+            logging.warning(f"Could not warm up Ollama model '{self.config.ollama_model}': {e}")
+
+    def pack(self, matches: list) -> List[dict]:
+        """
+        Turns ranked matches into prompt sources within the context token budget.
+
+        Chunks are taken best first. Chunks whose text was already taken (duplicates across
+        files) or whose span overlaps a taken chunk of the same file (chunk overlap) are
+        skipped, as are chunks that no longer fit; smaller ones further down may still fit.
+        """
+        # The generation model's tokenizer is not available locally, so counts are approximated.
+        token_counter = TokenCounter()
+        sources = []
+        seen_hashes = set()
+        spans = {}
+        used_tokens = 0
+        for match in matches:
+            metadata = match.get('metadata') or {}
+            text = read_chunk_text(metadata)
+            if not text:
+                continue
+            content_hash = chunk_text_hash(text)
+            if content_hash in seen_hashes:
+                continue
+            file_path = metadata.get("file_path")
+            start, end = metadata.get("start"), metadata.get("end")
+            if start is not None and end is not None and any(
+                start < taken_end and taken_start < end for taken_start, taken_end in spans.get(file_path, [])
+            ):
+                continue
+            tokens = token_counter.count(text)
+            if used_tokens + tokens > self.config.rag_context_tokens:
+                continue
+            used_tokens += tokens
+            seen_hashes.add(content_hash)
+            if start is not None and end is not None:
+                spans.setdefault(file_path, []).append((start, end))
+            sources.append({
+                "source": len(sources) + 1,
+                "id": match['id'],
+                "file_path": file_path,
+                "start": start,
+                "end": end,
+                "heading_path": metadata.get("heading_path"),
+                "score": match.get('rerank_score', match['score']),
+                "text": text,
+            })
+        return sources
+
+    @staticmethod
+    def build_prompt(question: str, sources: List[dict]) -> str:
+        blocks = []
+        for source in sources:
+            location = source["file_path"] or source["id"]
+            if source["heading_path"]:
+                location += " > " + " > ".join(source["heading_path"])
+            blocks.append(f"[{source['source']}] {location}\n{source['text']}")
+        return PROMPT_TEMPLATE.format(sources="\n\n".join(blocks), question=question)
+
+    async def ask(self, question: str, top_k: Optional[int] = None, filter: Optional[dict] = None,
+                  mode: Optional[str] = None, rerank: Optional[bool] = None,
+                  on_token: Optional[Callable[[str], None]] = None, **options) -> dict:
+        """
+        Answers a question from the indexed notes.
+
+        Parameters:
+            question (str): The question.
+            top_k (int, optional): Chunks to retrieve; defaults to Config.rag_top_k.
+            filter (dict, optional): A metadata filter for retrieval; see SearchService.search().
+            mode (str, optional): "vector" or "hybrid"; defaults to Config.search_mode.
+            rerank (bool, optional): Rerank retrieved chunks; defaults to Config.rerank.
+            on_token (Callable[[str], None], optional): Called with each answer token as it streams in.
+            **options: Ollama model options (e.g. temperature, num_ctx).
+
+        Returns:
+            dict: {"answer": str, "citations": [...], "timings": {...}}. Each citation has the
+            source number used in the answer, id, file_path, start, end, heading_path, score and
+            whether the answer cites it. timings holds retrieve_ms, pack_ms, first_token_ms and
+            total_ms, measured from the start of the call.
+        """
+        start = time.perf_counter()
+        timings = {}
+        warm_up = asyncio.create_task(self._warm_model())
+        try:
+            matches = await self.search_service.retrieve(
+                question, top_k=top_k or self.config.rag_top_k, mode=mode, filter=filter, rerank=rerank
+            )
+            timings["retrieve_ms"] = (time.perf_counter() - start) * 1000
+            loop = asyncio.get_running_loop()
+            sources = await loop.run_in_executor(None, self.pack, matches)
+            timings["pack_ms"] = (time.perf_counter() - start) * 1000 - timings["retrieve_ms"]
+            if not sources:
+                timings["total_ms"] = (time.perf_counter() - start) * 1000
+                return {"answer": NO_CONTEXT_ANSWER, "citations": [], "timings": timings}
+            prompt = self.build_prompt(question, sources)
+            await warm_up
+        finally:
+            if not warm_up.done():
+                warm_up.cancel()
+
+        tokens = []
+        async for token in self.llm_client.stream_response(prompt, **options):
+            if not tokens:
+                timings["first_token_ms"] = (time.perf_counter() - start) * 1000
+            tokens.append(token)
+            if on_token is not None:
+                on_token(token)
+        answer = "".join(tokens)
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+
+        cited = {int(number) for number in CITATION.findall(answer)}
+        citations = [
+            dict({key: value for key, value in source.items() if key != "text"}, cited=source["source"] in cited)
+            for source in sources
+        ]
+        logging.info(
+            f"Answered from {len(sources)} sources: "
+            + ", ".join(f"{stage} {ms:.1f}ms" for stage, ms in timings.items())
+        )
+        return {"answer": answer, "citations": citations, "timings": timings}
+
+    async def close(self) -> None:
+        """
+        Closes the Ollama client's connections.
+        """
+        await self.llm_client.close()
+
+async def ask(question: str, **kwargs) -> dict:
+    """
+    Answers a question from the indexed notes with a one-off AnswerPipeline; see AnswerPipeline.ask().
+    """
+    pipeline = AnswerPipeline()
+    try:
+        return await pipeline.ask(question, **kwargs)
+    finally:
+        await pipeline.close()
+
+# Example usage (if this file is run directly)
+if __name__ == "__main__":
+    import sys
+
+    async def main():
+        result = await ask(" ".join(sys.argv[1:]) or "What are my notes about?",
+                           on_token=lambda token: print(token, end="", flush=True))
+        print()
+        for citation in result["citations"]:
+            marker = "*" if citation["cited"] else " "
+            print(f"{marker}[{citation['source']}] {citation['file_path']}:{citation['start']}-{citation['end']}")
+
+    asyncio.run(main())
@@ -0,0 +1,168 @@
+# reranker.py
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from config import Config
+from chunk_dedup import chunk_text_hash
+from chunk_record import read_chunk_text
+from query_cache import TTLCache
+
+# Cross-encoder scores are deterministic, so cached pair scores only age out by LRU in practice.
+PAIR_SCORE_TTL_SECONDS = 24 * 3600
+# Weight of the newest batch in the moving average of seconds per scored pair.
+COST_SMOOTHING = 0.3
+# A failed model load is retried after this delay, doubling with each failure up to the cap.
+LOAD_RETRY_SECONDS = 30
+LOAD_RETRY_MAX_SECONDS = 3600
+
+class CrossEncoderReranker:
+    def __init__(self, config: Optional[Config] = None, model=None):
+        """
+        Initializes a second-stage reranker that rescores (query, chunk) pairs with a cross-encoder.
+
+        The model (Config.rerank_model, a small sentence-transformers CrossEncoder) runs on
+        Config.rerank_device in batches of Config.rerank_batch_size on a single scoring thread,
+        so concurrent queries queue instead of oversubscribing the CPU. Pair scores are cached
+        by query and chunk content. Each rerank has a budget of Config.rerank_budget_ms: if the
+        measured cost per pair says the uncached pairs cannot be scored in time, or scoring
+        overruns, the first-stage order is returned unchanged.
+
+        Parameters:
+            config (Config, optional): Defaults to Config.load_default().
+            model (CrossEncoder, optional): An already loaded model to use.
+        """
+        self.config = config or Config.load_default()
+        self.model = model
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self.pair_cache = TTLCache(self.config.rerank_cache_size, PAIR_SCORE_TTL_SECONDS)
+        self.seconds_per_pair: Optional[float] = None
+        self.loading: Optional[asyncio.Future] = None
+        self.load_failures = 0
+        self.retry_at = 0.0
+        self.reranked = 0
+        self.skipped = 0
+
+    def load(self) -> None:
+        """
+        Loads the cross-encoder if it is not loaded yet. Blocking; call it off the event loop.
+        """
+        with self.lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+                logging.info(f"Loading reranker '{self.config.rerank_model}' on {self.config.rerank_device}")
+                self.model = CrossEncoder(self.config.rerank_model, device=self.config.rerank_device)
+
+    def _load_done(self, future: asyncio.Future) -> None:
+        """
+        Logs a failed load and schedules the next attempt with exponential backoff.
+        """
+        error = future.exception() if not future.cancelled() else None
+        if self.model is not None:
+            return
+        self.loading = None
+        if error is None:
+            return
+        self.load_failures += 1
+        delay = min(LOAD_RETRY_MAX_SECONDS, LOAD_RETRY_SECONDS * 2 ** (self.load_failures - 1))
+        self.retry_at = time.monotonic() + delay
+        logging.error(
+            f"Could not load reranker '{self.config.rerank_model}': {error}; retrying in {delay}s "
+            f"(attempt {self.load_failures})"
+        )
+
+    def _score_pairs(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Scores texts against the query in batches, caching each score. Runs on the scoring thread.
+        """
+        start = time.perf_counter()
+        scores = self.model.predict(
+            [(query, text) for text in texts], batch_size=self.config.rerank_batch_size, show_progress_bar=False
+        )
+        scores = [float(score) for score in scores]
+        for text, score in zip(texts, scores):
+            self.pair_cache.put((query, chunk_text_hash(text)), score)
+        per_pair = (time.perf_counter() - start) / len(texts)
+        if self.seconds_per_pair is None:
+            self.seconds_per_pair = per_pair
+        else:
+            self.seconds_per_pair += COST_SMOOTHING * (per_pair - self.seconds_per_pair)
+        return scores
+
+    def _skip(self, matches: list, top_k: int, reason: str) -> list:
+        self.skipped += 1
+        logging.info(f"Skipping rerank: {reason}")
+        return matches[:top_k]
+
+    async def rerank(self, query: str, matches: list, top_k: int = 5) -> list:
+        """
+        Reorders first-stage matches by cross-encoder score and returns the best top_k.
+
+        Parameters:
+            query (str): The search query.
+            matches (list): Candidate matches with metadata, best first.
+            top_k (int): Number of matches to return.
+
+        Returns:
+            list: New match dicts with a "rerank_score" field, or the first top_k matches
+            unchanged when reranking was skipped. Matches whose text cannot be found keep their
+            relative order after the scored ones.
+        """
+        if not matches:
+            return []
+        deadline = time.perf_counter() + self.config.rerank_budget_ms / 1000
+        loop = asyncio.get_running_loop()
+        if self.model is None:
+            # Never make a query wait for the model to load; load it for the next one.
+            if self.loading is None:
+                if time.monotonic() < self.retry_at:
+                    return self._skip(matches, top_k, "model failed to load")
+                self.loading = loop.run_in_executor(self.executor, self.load)
+                self.loading.add_done_callback(self._load_done)
+            return self._skip(matches, top_k, "model is still loading")
+
+        texts = await loop.run_in_executor(None, lambda: [read_chunk_text(match.get('metadata')) for match in matches])
+        scores: List[Optional[float]] = [
+            self.pair_cache.get((query, chunk_text_hash(text))) if text is not None else None for text in texts
+        ]
+        missing = [i for i, (text, score) in enumerate(zip(texts, scores)) if text is not None and score is None]
+        if missing:
+            remaining = deadline - time.perf_counter()
+            if self.seconds_per_pair is not None and self.seconds_per_pair * len(missing) > remaining:
+                return self._skip(matches, top_k, f"{len(missing)} pairs would exceed the {self.config.rerank_budget_ms:.0f}ms budget")
+            future = loop.run_in_executor(self.executor, self._score_pairs, query, [texts[i] for i in missing])
+            try:
+                # Shielded, so an overrun still finishes and fills the cache for the next query.
+                new_scores = await asyncio.wait_for(asyncio.shield(future), timeout=max(remaining, 0))
+            except asyncio.TimeoutError:
+                return self._skip(matches, top_k, f"scoring overran the {self.config.rerank_budget_ms:.0f}ms budget")
+            for i, score in zip(missing, new_scores):
+                scores[i] = score
+
+        self.reranked += 1
+        scored = [dict(match, rerank_score=score) for match, score in zip(matches, scores) if score is not None]
+        scored.sort(key=lambda match: match['rerank_score'], reverse=True)
+        unscored = [match for match, score in zip(matches, scores) if score is None]
+        return (scored + unscored)[:top_k]
+
+    def stats(self) -> dict:
+        """
+        Returns rerank/skip/load failure counters, the measured cost per pair and the pair cache counters.
+        """
+        return {
+            "reranked": self.reranked,
+            "skipped": self.skipped,
+            "load_failures": self.load_failures,
+            "ms_per_pair": round(self.seconds_per_pair * 1000, 3) if self.seconds_per_pair is not None else None,
+            "cache": self.pair_cache.stats(),
+        }
+
+    def close(self) -> None:
+        """
+        Stops the scoring thread.
+        """
+        self.executor.shutdown(wait=False)
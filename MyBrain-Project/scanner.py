@@ -1,38 +1,206 @@
 # scanner.py
 
+import asyncio
+import concurrent.futures
 import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Generator, Tuple
-from metadata_handler import has_yaml_metadata
+from typing import Generator, List, Optional, Tuple
+from config import Config
+from document import ParsedDocument
 
 logging.basicConfig(level=logging.INFO)
 
+PEEK_BYTES = 64
+UTF8_BOM = b"\xef\xbb\xbf"
+# How often a scanning thread blocked on a full queue checks whether it should stop.
+QUEUE_PUT_POLL_SECONDS = 0.5
+
+def peek_front_matter(file_path: str) -> bool:
+    """
+    Detects a leading '---' front matter delimiter by reading only the first few bytes of a file.
+    """
+    try:
+        with open(file_path, "rb") as file:
+            head = file.read(PEEK_BYTES)
+    except OSError as e:
+        logging.error(f"Error checking YAML metadata in {file_path}: {e}")
+        return False
+    if head.startswith(UTF8_BOM):
+        head = head[len(UTF8_BOM):]
+    return head.lstrip().startswith(b"---")
+
+class ScanStatus:
+    def __init__(self):
+        """
+        Records the outcome of one scan: how many files it found, and whether a directory
+        could not be listed, so callers can avoid pruning its files.
+        """
+        self.files = 0
+        self.incomplete = False
+
 class DirectoryScanner:
-    def __init__(self, root_directory: Path):
+    def __init__(self, root_directory: Path, config: Optional[Config] = None):
         """
         Initializes the DirectoryScanner with the root directory to scan.
-        
+
         Parameters:
             root_directory (Path): The root directory path.
+            config (Config, optional): Supplies allowed extensions, ignored folders, worker
+                count and queue size. Defaults to Config.load_default().
+        """
+        self.root_directory = Path(root_directory)
+        self.config = config or Config.load_default()
+        self.allowed_extensions = {
+            ext.strip().lower() for ext in self.config.allowed_extensions if ext.strip()
+        }
+        self.ignore_folders = set(self.config.ignore_folders)
+        self.max_workers = self.config.scan_workers
+
+    def _list_directory(self, directory: str, status: ScanStatus) -> Tuple[List[str], List[str]]:
         """
-        self.root_directory = root_directory
+        Lists one directory with os.scandir, returning its subdirectories and candidate files.
+        """
+        subdirectories, files = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in self.ignore_folders:
+                                subdirectories.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.allowed_extensions:
+                            files.append(entry.path)
+                    except OSError as e:
+                        logging.error(f"Error reading directory entry {entry.path}: {e}")
+        except OSError as e:
+            logging.error(f"Error scanning directory {directory}: {e}")
+            status.incomplete = True
+        return subdirectories, files
+
+    @staticmethod
+    def _inspect_file(file_path: str) -> Optional[ParsedDocument]:
+        """
+        Stats a file and peeks at its first bytes, without reading the rest of it.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            logging.error(f"Error reading file {file_path}: {e}")
+            return None
+        document = ParsedDocument(Path(file_path), mtime=stat.st_mtime, size=stat.st_size)
+        document.front_matter_hint = peek_front_matter(file_path)
+        return document
+
+    def scan_documents(self, status: Optional[ScanStatus] = None) -> Generator[ParsedDocument, None, None]:
+        """
+        Walks the directory tree in parallel and yields matching files as ParsedDocument objects.
+
+        Directory listings and per-file stat/peek calls run on a thread pool, which hides the
+        per-call latency of network-mounted vaults. Folders in Config.ignore_folders are pruned,
+        only Config.allowed_extensions are yielded, and the files themselves are not read here:
+        the processor reads each one exactly once, and only if the manifest says it changed.
+        The number of in-flight calls is capped so memory stays bounded on large trees.
+
+        Parameters:
+            status (ScanStatus, optional): Filled in as the scan runs. Each scan needs its own,
+                so concurrent scans do not overwrite each other's outcome.
+
+        Yields:
+            ParsedDocument: An unread document with mtime, size and front_matter_hint filled in.
+        """
+        max_pending = self.max_workers * 4
+        status = status if status is not None else ScanStatus()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scanner") as executor:
+            pending_directories = [str(self.root_directory)]
+            pending_files: List[str] = []
+            in_flight = set()
+            while pending_directories or pending_files or in_flight:
+                while len(in_flight) < max_pending and (pending_directories or pending_files):
+                    # Files are inspected before more directories are listed so the pending list stays small.
+                    if pending_files:
+                        in_flight.add(executor.submit(self._inspect_file, pending_files.pop()))
+                    else:
+                        in_flight.add(executor.submit(self._list_directory, pending_directories.pop(), status))
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if isinstance(result, tuple):
+                        subdirectories, files = result
+                        pending_directories.extend(subdirectories)
+                        pending_files.extend(files)
+                    elif result is not None:
+                        logging.info(f"File {result.path} has YAML metadata: {result.front_matter_hint}")
+                        status.files += 1
+                        yield result
 
     def scan_and_split(self) -> Generator[Tuple[Path, bool], None, None]:
         """
         Scans the directory for markdown files and yields them with a flag indicating whether they have YAML metadata.
-        
+
         Yields:
             Tuple[Path, bool]: A tuple containing the file path and a boolean indicating YAML metadata presence.
         """
-        for file_path in self.root_directory.glob('**/*.md'):
-            has_yaml = has_yaml_metadata(file_path)
-            yield (file_path, has_yaml)
-            logging.info(f"File {file_path} has YAML metadata: {has_yaml}")
+        for document in self.scan_documents():
+            yield (document.path, document.front_matter_hint)
+
+    async def scan_to_queue(self, queue: asyncio.Queue, consumers: int = 1) -> ScanStatus:
+        """
+        Runs the scan on a background thread and feeds the documents into a bounded queue.
+
+        When the queue is full the scanning thread blocks, so a slow consumer applies
+        backpressure to the walk. One None sentinel per consumer is queued at the end. If
+        this coroutine is cancelled, or the event loop stops, the scanning thread stops too
+        instead of waiting on the queue forever, and no sentinels are queued.
+
+        Parameters:
+            queue (asyncio.Queue): The queue consumed by DocumentProcessor.consume.
+            consumers (int): The number of consumers that need a sentinel.
+
+        Returns:
+            ScanStatus: The number of documents queued, and whether the scan was incomplete.
+        """
+        loop = asyncio.get_running_loop()
+        status = ScanStatus()
+        stop = threading.Event()
+
+        def put(document: ParsedDocument) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(document), loop)
+            while True:
+                try:
+                    future.result(timeout=QUEUE_PUT_POLL_SECONDS)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stop.is_set() or not loop.is_running():
+                        future.cancel()
+                        return False
+
+        def produce() -> None:
+            for document in self.scan_documents(status):
+                if stop.is_set() or not put(document):
+                    logging.info(f"Scan of {self.root_directory} stopped after {status.files} files.")
+                    return
+
+        cancelled = False
+        try:
+            await loop.run_in_executor(None, produce)
+            logging.info(f"Scan of {self.root_directory} queued {status.files} files.")
+            return status
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            stop.set()
+            if not cancelled:
+                for _ in range(consumers):
+                    await queue.put(None)
 
 # Example usage:
 # scanner = DirectoryScanner(Path("path/to/directory"))
-# for file_path, has_yaml in scanner.scan_and_split():
-#     if has_yaml:
+# for document in scanner.scan_documents():
+#     if document.front_matter_hint:
 #         # Process files with YAML metadata
 #     else:
-#         # Process files without YAML metadata
\ No newline at end of file
+#         # Process files without YAML metadata
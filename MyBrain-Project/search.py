@@ -1,14 +1,362 @@
 # search.py
 
+import asyncio
+import functools
+import logging
+import time
+from typing import List, Optional
+from config import Config
 from vector_store import VectorStore
-from embedding_model import EmbeddingModel
+from embedding_provider import EmbeddingProvider, create_embedding_provider
+from query_cache import TTLCache
+from lexical_index import LexicalIndex
+from metadata_filter import filter_key, matches_filter, validate_filter
+from reranker import CrossEncoderReranker
 
-async def search_documents(query: str, top_k: int = 5):
+# When the store cannot list the ids matching a filter, lexical candidates are post-filtered:
+# the search fetches this multiple of top_k, growing by the same factor while too few pass,
+# up to LEXICAL_FILTER_MAX_FACTOR times top_k.
+LEXICAL_FILTER_OVERFETCH = 4
+LEXICAL_FILTER_MAX_FACTOR = 64
+
+class SearchService:
+    def __init__(self, config: Optional[Config] = None, vector_store: Optional[VectorStore] = None,
+                 embedding_provider: Optional[EmbeddingProvider] = None, lexical_index: Optional[LexicalIndex] = None,
+                 reranker: Optional[CrossEncoderReranker] = None):
+        """
+        Initializes a long-lived search service that keeps its model and vector store warm.
+
+        Creating the service once and reusing it avoids reconnecting the vector store and
+        reloading the embedding model on every query. Queries are embedded with the provider
+        selected by Config.embedding_provider, and the first query checks that the index was
+        built with the same provider and dimension. Query embeddings and top-k results
+        are cached in LRU caches with a TTL; results are keyed on the namespace's index version,
+        so any upsert or delete in this process invalidates them, as does a flush by another
+        process into the local index. Pinecone writes by other processes show once cached
+        results expire after Config.result_cache_ttl_seconds. When Config.lexical_index_path
+        is set, hybrid_search() also queries the BM25 index written by the indexer. retrieve()
+        can rerank a larger candidate set with a cross-encoder (Config.rerank).
+
+        Parameters:
+            config (Config, optional): Configuration; defaults to Config.load_default().
+            vector_store (VectorStore, optional): An existing store to share.
+            embedding_provider (EmbeddingProvider, optional): An existing provider to share.
+            lexical_index (LexicalIndex, optional): An existing lexical index to share.
+            reranker (CrossEncoderReranker, optional): An existing reranker to share; one is
+                created on first use otherwise.
+        """
+        self.config = config or Config.load_default()
+        self.vector_store = vector_store or VectorStore(self.config)
+        self.embedding_provider = embedding_provider or create_embedding_provider(self.config)
+        self.embedding_checked = False
+        if lexical_index is None and self.config.lexical_index_path:
+            lexical_index = LexicalIndex(self.config.lexical_index_path)
+        self.lexical_index = lexical_index
+        self.reranker = reranker
+        self.embedding_cache = TTLCache(self.config.query_cache_size, self.config.query_cache_ttl_seconds)
+        self.result_cache = TTLCache(self.config.query_cache_size, self.config.result_cache_ttl_seconds)
+
+    async def warm_up(self) -> None:
+        """
+        Loads the embedding model off the event loop and checks it against the index, so the
+        first query does not pay for either.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.embedding_provider.load)
+        await self.check_embedding()
+        if self.config.rerank:
+            await loop.run_in_executor(None, self.get_reranker().load)
+        logging.info("SearchService warmed up.")
+
+    def get_reranker(self) -> CrossEncoderReranker:
+        """
+        Returns the reranker, creating it (without loading its model) on first use.
+        """
+        if self.reranker is None:
+            self.reranker = CrossEncoderReranker(self.config)
+        return self.reranker
+
+    async def check_embedding(self) -> None:
+        """
+        Verifies once that the index was built with this service's embedding provider and dimension.
+
+        Raises:
+            EmbeddingMismatchError: If queries would be compared against another vector space.
+        """
+        if self.embedding_checked:
+            return
+        dimension = await self.embedding_provider.get_dimension()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, functools.partial(self.vector_store.check_embedding, self.embedding_provider.fingerprint, dimension)
+        )
+        self.embedding_checked = True
+
+    async def search(self, query: str, top_k: int = 5, namespace: str = '', filter: Optional[dict] = None) -> list:
+        """
+        Searches for documents based on a query using vector similarity.
+
+        Parameters:
+            query (str): The search query.
+            top_k (int): Number of results to return.
+            namespace (str): Vector store namespace.
+            filter (dict, optional): A metadata filter in Pinecone's syntax, e.g.
+                {"tags": {"$in": ["python"]}, "date": {"$gte": "2024-01-01"}}. The top_k are
+                taken from the matching chunks only.
+        """
+        validate_filter(filter)
+        result_key = (query, top_k, namespace, await self._index_version(namespace), filter_key(filter))
+        matches = self.result_cache.get(result_key)
+        if matches is not None:
+            return list(matches)
+        await self.check_embedding()
+        query_embedding = await self.embed_query(query)
+        results = await self.vector_store.query_vectors(query_embedding, top_k=top_k, namespace=namespace, filter=filter)
+        self.result_cache.put(result_key, results['matches'])
+        return list(results['matches'])
+
+    async def _dense_candidates(self, query: str, top_k: int, namespace: str, filter: Optional[dict],
+                                timings: dict) -> list:
+        start = time.perf_counter()
+        await self.check_embedding()
+        query_embedding = await self.embed_query(query)
+        embedded = time.perf_counter()
+        results = await self.vector_store.query_vectors(query_embedding, top_k=top_k, namespace=namespace, filter=filter)
+        timings["embed_ms"] = (embedded - start) * 1000
+        timings["vector_ms"] = (time.perf_counter() - embedded) * 1000
+        return results['matches']
+
+    async def _lexical_candidates(self, query: str, top_k: int, namespace: str, filter: Optional[dict],
+                                  timings: dict) -> list:
+        # The lexical index only covers the default namespace the indexer writes to.
+        if self.lexical_index is None or namespace:
+            timings["lexical_ms"] = 0.0
+            return []
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        ids = await self.vector_store.matching_ids(filter, namespace) if filter else None
+        if filter and ids is not None and not ids:
+            matches = []
+        elif filter and ids is None:
+            matches = await self._post_filtered_lexical_candidates(query, top_k, namespace, filter)
+        else:
+            results = await loop.run_in_executor(None, self.lexical_index.search, query, top_k, ids)
+            matches = results['matches']
+        timings["lexical_ms"] = (time.perf_counter() - start) * 1000
+        return matches
+
+    async def _post_filtered_lexical_candidates(self, query: str, top_k: int, namespace: str, filter: dict) -> list:
+        """
+        Filters lexical candidates by their stored metadata, for backends that cannot list the
+        ids matching a filter. Overfetches, and keeps widening the search while fewer than
+        top_k candidates pass, so a selective filter does not starve the lexical stage.
+        """
+        loop = asyncio.get_running_loop()
+        metadata = {}
+        fetch = top_k * LEXICAL_FILTER_OVERFETCH
+        while True:
+            results = await loop.run_in_executor(None, self.lexical_index.search, query, fetch, None)
+            candidates = results['matches']
+            unseen = [match['id'] for match in candidates if match['id'] not in metadata]
+            if unseen:
+                fetched = await self.vector_store.fetch_metadata(unseen, namespace=namespace)
+                metadata.update({chunk_id: fetched.get(chunk_id) for chunk_id in unseen})
+            matches = [
+                dict(match, metadata=metadata[match['id']]) for match in candidates
+                if metadata[match['id']] is not None and matches_filter(filter, metadata[match['id']])
+            ]
+            if len(matches) >= top_k or len(candidates) < fetch or fetch >= top_k * LEXICAL_FILTER_MAX_FACTOR:
+                return matches[:top_k]
+            fetch *= LEXICAL_FILTER_OVERFETCH
+
+    async def _index_version(self, namespace: str) -> tuple:
+        """
+        Picks up vectors another process flushed into the namespace and returns its index version.
+        """
+        # refresh() may reload the index from disk, so it runs off the loop.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.vector_store.refresh, namespace)
+        return self.vector_store.index_version(namespace)
+
+    def _refresh_lexical_index(self) -> int:
+        """
+        Picks up a generation committed by the indexer and returns the current generation.
+        """
+        self.lexical_index.refresh()
+        return self.lexical_index.generation
+
+    async def hybrid_search(self, query: str, top_k: int = 5, namespace: str = '',
+                            filter: Optional[dict] = None) -> dict:
+        """
+        Searches with both the vector index and the BM25 lexical index and fuses the rankings.
+
+        Both stages run concurrently and each returns Config.hybrid_candidates candidates (at
+        least top_k). The lists are combined with reciprocal rank fusion, where a chunk scores
+        the sum of 1 / (Config.hybrid_rrf_k + rank) over the lists it appears in, so exact
+        identifiers that dense embeddings blur still rank well. Metadata for chunks found only
+        lexically is fetched from the vector store.
+
+        Parameters:
+            query (str): The search query.
+            top_k (int): Number of fused results to return.
+            namespace (str): Vector store namespace; the lexical stage only covers the default one.
+            filter (dict, optional): A metadata filter applied to both stages before ranking; see
+                search(). On backends that cannot list the ids matching a filter (Pinecone), the
+                lexical stage filters its candidates' metadata instead, searching up to
+                LEXICAL_FILTER_MAX_FACTOR times top_k candidates deep; matches ranked lower than
+                that lexically are only found by the vector stage.
+
+        Returns:
+            dict: {"matches": [...], "timings": {...}}. Each match has id, score (the fused score),
+            metadata, vector_rank/vector_score and lexical_rank/lexical_score (None when the chunk
+            was not found by that stage). timings holds per-stage milliseconds.
+        """
+        validate_filter(filter)
+        start = time.perf_counter()
+        generation = None
+        if self.lexical_index is not None:
+            # refresh() takes the index lock and may reload it from disk, so it runs off the loop.
+            loop = asyncio.get_running_loop()
+            generation = await loop.run_in_executor(None, self._refresh_lexical_index)
+        result_key = (
+            "hybrid", query, top_k, namespace, await self._index_version(namespace), generation, filter_key(filter)
+        )
+        cached = self.result_cache.get(result_key)
+        if cached is not None:
+            return {"matches": list(cached), "timings": {"total_ms": (time.perf_counter() - start) * 1000}}
+        timings = {}
+        candidates = max(top_k, self.config.hybrid_candidates)
+        dense, lexical = await asyncio.gather(
+            self._dense_candidates(query, candidates, namespace, filter, timings),
+            self._lexical_candidates(query, candidates, namespace, filter, timings),
+        )
+
+        fuse_start = time.perf_counter()
+        rrf_k = self.config.hybrid_rrf_k
+        fused = {}
+        for stage, matches in (("vector", dense), ("lexical", lexical)):
+            for rank, match in enumerate(matches, start=1):
+                entry = fused.setdefault(match['id'], {
+                    "id": match['id'], "score": 0.0, "metadata": match.get('metadata'),
+                    "vector_rank": None, "vector_score": None, "lexical_rank": None, "lexical_score": None,
+                })
+                entry["score"] += 1.0 / (rrf_k + rank)
+                entry[f"{stage}_rank"] = rank
+                entry[f"{stage}_score"] = match['score']
+        matches = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)[:top_k]
+        timings["fuse_ms"] = (time.perf_counter() - fuse_start) * 1000
+
+        fetch_start = time.perf_counter()
+        missing = [match['id'] for match in matches if match['metadata'] is None]
+        if missing:
+            metadata = await self.vector_store.fetch_metadata(missing, namespace=namespace)
+            for match in matches:
+                if match['metadata'] is None:
+                    match['metadata'] = metadata.get(match['id'])
+        timings["fetch_ms"] = (time.perf_counter() - fetch_start) * 1000
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+
+        logging.info(
+            "Hybrid search: " + ", ".join(f"{stage} {ms:.1f}ms" for stage, ms in timings.items())
+            + f" ({len(dense)} vector + {len(lexical)} lexical candidates)"
+        )
+        self.result_cache.put(result_key, matches)
+        return {"matches": list(matches), "timings": timings}
+
+    async def retrieve(self, query: str, top_k: int = 5, mode: Optional[str] = None, namespace: str = '',
+                       filter: Optional[dict] = None, rerank: Optional[bool] = None) -> list:
+        """
+        Runs the configured retrieval pipeline and returns the top_k matches.
+
+        The first stage is search() or hybrid_search(). With reranking, it retrieves
+        Config.rerank_candidates candidates (at least top_k) and the cross-encoder reorders them
+        within its latency budget.
+
+        Parameters:
+            query (str): The search query.
+            top_k (int): Number of results to return.
+            mode (str, optional): "vector" or "hybrid"; defaults to Config.search_mode.
+            namespace (str): Vector store namespace.
+            filter (dict, optional): A metadata filter; see search().
+            rerank (bool, optional): Whether to rerank; defaults to Config.rerank.
+        """
+        rerank = self.config.rerank if rerank is None else rerank
+        candidates = max(top_k, self.config.rerank_candidates) if rerank else top_k
+        if (mode or self.config.search_mode) == "hybrid":
+            matches = (await self.hybrid_search(query, top_k=candidates, namespace=namespace, filter=filter))['matches']
+        else:
+            matches = await self.search(query, top_k=candidates, namespace=namespace, filter=filter)
+        if not rerank:
+            return matches
+        return await self.get_reranker().rerank(query, matches, top_k)
+
+    async def embed_query(self, query: str) -> list:
+        """
+        Embeds a query, reusing a cached embedding when the same query was seen recently.
+        """
+        query_embedding = self.embedding_cache.get(query)
+        if query_embedding is None:
+            query_embedding = await self.embedding_provider.generate_embedding(query, {})
+            self.embedding_cache.put(query, query_embedding)
+        return query_embedding
+
+    async def search_many(self, queries: List[str], top_k: int = 5, namespace: str = '',
+                          filter: Optional[dict] = None) -> List[list]:
+        """
+        Searches several queries at once: one batched encode call and one batched index lookup
+        for the queries that are not already cached. The filter, if any, applies to every query.
+        """
+        validate_filter(filter)
+        version = await self._index_version(namespace)
+        key = filter_key(filter)
+        results: List[Optional[list]] = [self.result_cache.get((query, top_k, namespace, version, key)) for query in queries]
+        missing = [i for i, matches in enumerate(results) if matches is None]
+        if missing:
+            await self.check_embedding()
+            embeddings = [self.embedding_cache.get(queries[i]) for i in missing]
+            to_embed = [i for i, embedding in zip(missing, embeddings) if embedding is None]
+            if to_embed:
+                new_embeddings = await self.embedding_provider.generate_embeddings([queries[i] for i in to_embed], {})
+                for i, embedding in zip(to_embed, new_embeddings):
+                    self.embedding_cache.put(queries[i], embedding)
+                by_index = dict(zip(to_embed, new_embeddings))
+                embeddings = [embedding if embedding is not None else by_index[i] for i, embedding in zip(missing, embeddings)]
+            lookups = await self.vector_store.query_many(embeddings, top_k=top_k, namespace=namespace, filter=filter)
+            for i, lookup in zip(missing, lookups):
+                results[i] = lookup['matches']
+                self.result_cache.put((queries[i], top_k, namespace, version, key), lookup['matches'])
+        return [list(matches) for matches in results]
+
+    def cache_stats(self) -> dict:
+        """
+        Returns hit/miss counters for the query embedding and result caches.
+        """
+        stats = {"embeddings": self.embedding_cache.stats(), "results": self.result_cache.stats()}
+        if self.reranker is not None:
+            stats["rerank"] = self.reranker.stats()
+        return stats
+
+_default_service: Optional[SearchService] = None
+
+def get_search_service() -> SearchService:
     """
-    Searches for documents based on a query using vector similarity.
+    Returns the process-wide SearchService, creating it on first use.
+    """
+    global _default_service
+    if _default_service is None:
+        _default_service = SearchService()
+    return _default_service
+
+async def search_documents(query: str, top_k: int = 5, mode: Optional[str] = None, filter: Optional[dict] = None,
+                           rerank: Optional[bool] = None):
+    """
+    Searches for documents based on a query.
+
+    Parameters:
+        query (str): The search query.
+        top_k (int): Number of results to return.
+        mode (str, optional): "vector" or "hybrid"; defaults to Config.search_mode.
+        filter (dict, optional): A metadata filter over front matter fields, e.g. {"tags": "python"}.
+        rerank (bool, optional): Rerank with the cross-encoder; defaults to Config.rerank.
     """
-    vector_store = VectorStore()
-    embedding_model = EmbeddingModel()
-    query_embedding = await embedding_model.generate_embedding(query, {})
-    results = await vector_store.query_vectors(query_embedding, top_k=top_k)
-    return results['matches']
\ No newline at end of file
+    return await get_search_service().retrieve(query, top_k=top_k, mode=mode, filter=filter, rerank=rerank)
@@ -0,0 +1,227 @@
+# token_chunker.py
+
+import hashlib
+import logging
+import math
+import re
+from collections import OrderedDict
+from typing import Generator, Iterable, Iterator, List, Optional, Tuple
+from chunk_record import ChunkRecord, SourceWindow
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+APPROXIMATE_TOKEN = re.compile(r"\w+|[^\w\s]")
+# Number of blocks whose token counts are computed with one tokenizer call.
+BLOCK_BATCH = 64
+
+class TokenCounter:
+    def __init__(self, tokenizer=None, cache_size: int = 100000):
+        """
+        Initializes a token counter with a bounded LRU cache of counts.
+
+        With a Hugging Face tokenizer (e.g. SentenceTransformer.tokenizer) texts are counted in
+        batched tokenizer calls; without one, counts are approximated from words and punctuation.
+
+        Parameters:
+            tokenizer: The embedding model's tokenizer, or None to approximate.
+            cache_size (int): Maximum number of cached counts.
+        """
+        self.tokenizer = tokenizer
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[bytes, int]" = OrderedDict()
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _count_uncached(self, texts: List[str]) -> List[int]:
+        if self.tokenizer is None:
+            return [math.ceil(len(APPROXIMATE_TOKEN.findall(text)) * 1.3) for text in texts]
+        encoded = self.tokenizer(
+            texts, add_special_tokens=False, return_attention_mask=False, return_token_type_ids=False
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """
+        Counts the tokens of several texts, tokenizing only the ones not in the cache.
+        """
+        keys = [self._key(text) for text in texts]
+        counts: List[Optional[int]] = []
+        for key in keys:
+            count = self.cache.get(key)
+            if count is not None:
+                self.cache.move_to_end(key)
+            counts.append(count)
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            for i, count in zip(missing, self._count_uncached([texts[i] for i in missing])):
+                counts[i] = count
+                self.cache[keys[i]] = count
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return counts
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+def iter_blocks(lines: Iterable[str], start_offset: int = 0) -> Generator[Tuple[str, str, int], None, None]:
+    """
+    Groups a line stream into paragraphs and fenced code blocks.
+
+    Yields:
+        Tuple[str, str, int]: The block type ("text" or "code"), its text and its start offset.
+    """
+    offset = start_offset
+    paragraph: List[str] = []
+    paragraph_start = offset
+    code: Optional[List[str]] = None
+    code_start = offset
+    for line in lines:
+        stripped = line.strip()
+        if code is not None:
+            code.append(line)
+            if stripped.startswith("```"):
+                yield "code", "".join(code), code_start
+                code = None
+        elif stripped.startswith("```"):
+            if paragraph:
+                yield "text", "".join(paragraph), paragraph_start
+                paragraph = []
+            code = [line]
+            code_start = offset
+        elif not stripped:
+            if paragraph:
+                yield "text", "".join(paragraph), paragraph_start
+                paragraph = []
+        else:
+            if not paragraph:
+                paragraph_start = offset
+            paragraph.append(line)
+        offset += len(line)
+    if paragraph:
+        yield "text", "".join(paragraph), paragraph_start
+    if code is not None:
+        # An unclosed fence is not a code block; treat it as text.
+        yield "text", "".join(code), code_start
+
+class TokenChunkStream:
+    def __init__(self, lines: Iterable[str], metadata: dict, counter: TokenCounter, max_tokens: int, start_offset: int = 0):
+        """
+        Packs paragraphs and sentences into chunks of at most max_tokens model tokens.
+
+        Blocks are counted in batches of BLOCK_BATCH with one tokenizer call. Paragraphs that
+        do not fit a chunk on their own are split into sentences, and sentences into word runs,
+        so no chunk is truncated by the model's maximum sequence length. Code blocks are never
+        mixed with text; an oversized block is split on line boundaries. Each chunk's text is
+        the exact source slice between its start and end offsets, so read_chunk_text() returns
+        what was embedded.
+
+        Iterate the stream to get the chunks; total is the number of chunks yielded so far.
+        """
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be greater than 0.")
+        self.source = SourceWindow(lines, start_offset)
+        self.metadata = metadata
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.start_offset = start_offset
+        self.total = 0
+        self.complete = False
+
+    def _split(self, chunk_type: str, text: str, start: int, tokens: int) -> List[Tuple[str, int, int]]:
+        """
+        Splits an oversized unit into pieces that each fit max_tokens.
+
+        Returns:
+            List of (text, start, tokens) units, each an exact slice of the source.
+        """
+        if tokens <= self.max_tokens:
+            return [(text, start, tokens)]
+        if chunk_type == "code":
+            pieces = [(match.group(), match.start()) for match in re.finditer(r"[^\n]*\n|[^\n]+$", text)]
+        else:
+            pieces, position = [], 0
+            for match in SENTENCE_END.finditer(text):
+                pieces.append((text[position:match.start()], position))
+                position = match.end()
+            pieces.append((text[position:], position))
+            if len(pieces) == 1:
+                # A single over-long sentence: cut it into word runs sized by its token density.
+                words = [match.span() for match in re.finditer(r"\S+", text)]
+                parts = math.ceil(tokens / self.max_tokens) + 1
+                per_part = max(1, math.ceil(len(words) / parts))
+                pieces = [
+                    (text[words[i][0]:words[min(i + per_part, len(words)) - 1][1]], words[i][0])
+                    for i in range(0, len(words), per_part)
+                ]
+        if len(pieces) == 1:
+            # Nothing left to split on; keep it whole and let the model truncate.
+            return [(text, start, tokens)]
+        counts = self.counter.count_many([piece for piece, _ in pieces])
+        units = []
+        for (piece, position), count in zip(pieces, counts):
+            units.extend(self._split(chunk_type, piece, start + position, count))
+        return units
+
+    def _emit(self, chunk_type: str, units: List[Tuple[str, int, int]]) -> Optional[ChunkRecord]:
+        first, last = units[0], units[-1]
+        start = first[1] + len(first[0]) - len(first[0].lstrip())
+        end = last[1] + len(last[0].rstrip())
+        text = self.source.take(start, end).strip() if end > start else ""
+        if not text:
+            return None
+        self.total += 1
+        return ChunkRecord(text, chunk_type, self.metadata, start=start, end=end, tokens=sum(unit[2] for unit in units))
+
+    def _pack(self, blocks: List[Tuple[str, str, int]], current: List, current_tokens: int) -> Iterator:
+        counts = self.counter.count_many([text for _, text, _ in blocks])
+        for (chunk_type, text, start), tokens in zip(blocks, counts):
+            units = self._split(chunk_type, text, start, tokens)
+            if chunk_type == "code":
+                if current:
+                    yield self._emit("text", current)
+                    current, current_tokens = [], 0
+                code_units, code_tokens = [], 0
+                for unit in units:
+                    if code_units and code_tokens + unit[2] > self.max_tokens:
+                        yield self._emit("code", code_units)
+                        code_units, code_tokens = [], 0
+                    code_units.append(unit)
+                    code_tokens += unit[2]
+                if code_units:
+                    yield self._emit("code", code_units)
+                continue
+            for unit in units:
+                if current and current_tokens + unit[2] > self.max_tokens:
+                    yield self._emit("text", current)
+                    current, current_tokens = [], 0
+                current.append(unit)
+                current_tokens += unit[2]
+        # The open chunk is handed back so packing continues across block batches.
+        yield current, current_tokens
+
+    def __iter__(self) -> Iterator[ChunkRecord]:
+        current: List = []
+        current_tokens = 0
+        blocks: List[Tuple[str, str, int]] = []
+
+        def pack():
+            nonlocal current, current_tokens
+            for item in self._pack(blocks, current, current_tokens):
+                if isinstance(item, tuple):
+                    current, current_tokens = item
+                elif item:
+                    yield item
+
+        for block in iter_blocks(self.source, self.start_offset):
+            blocks.append(block)
+            if len(blocks) >= BLOCK_BATCH:
+                yield from pack()
+                blocks = []
+        yield from pack()
+        if current:
+            chunk = self._emit("text", current)
+            if chunk:
+                yield chunk
+        self.complete = True
+        logging.info(f"Generated {self.total} token-bounded chunks for file.")
@@ -1,32 +1,411 @@
 # vector_store.py
 
-import pinecone
+import asyncio
+import functools
+import json
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+class PineconeBackend:
+    def __init__(self, config: Config):
+        """
+        Initializes the Pinecone backend. The client is imported here so the local backend
+        works without pinecone installed.
+        """
+        import pinecone
+        pinecone.init(api_key=config.pinecone_api_key, environment=config.pinecone_environment)
+        # pool_threads sizes the client's connection pool to match parallel batch submission.
+        self.index = pinecone.Index(config.pinecone_index_name, pool_threads=config.upsert_workers)
+
+    def upsert(self, ids, vectors, metadata_list, namespace=''):
+        self.index.upsert(vectors=list(zip(ids, vectors, metadata_list)), namespace=namespace)
+
+    def delete(self, ids, namespace=''):
+        self.index.delete(ids=list(ids), namespace=namespace)
+
+    def query(self, vector, top_k=5, namespace='', filter=None):
+        # Pinecone evaluates the filter server-side with its own metadata index.
+        options = {"filter": filter} if filter else {}
+        return self.index.query(vector=vector, top_k=top_k, namespace=namespace, include_metadata=True, **options)
+
+    def query_many(self, vectors, top_k=5, namespace='', filter=None):
+        return [self.query(vector, top_k=top_k, namespace=namespace, filter=filter) for vector in vectors]
+
+    def update_metadata(self, ids, metadata_list, namespace=''):
+        for vector_id, metadata in zip(ids, metadata_list):
+            self.index.update(id=vector_id, set_metadata=metadata, namespace=namespace)
+
+    def fetch_metadata(self, ids, namespace=''):
+        vectors = self.index.fetch(ids=list(ids), namespace=namespace)["vectors"]
+        return {vector_id: vector.get("metadata") for vector_id, vector in vectors.items()}
+
+    def matching_ids(self, filter, namespace=''):
+        """
+        Pinecone cannot list the ids matching a filter; callers filter the metadata themselves.
+        """
+        return None
+
+    def embedding_signature(self) -> Optional[dict]:
+        """
+        Pinecone records only the index dimension; the provider cannot be checked.
+        """
+        dimension = self.index.describe_index_stats().get("dimension")
+        return {"dimension": dimension} if dimension else None
+
+    def set_embedding_signature(self, signature: dict) -> None:
+        pass
+
+    def refresh(self, namespace=''):
+        pass
+
+    def generation(self, namespace=''):
+        """
+        Pinecone exposes no write counter, so writes by other processes are only seen once
+        cached results expire (Config.result_cache_ttl_seconds).
+        """
+        return None
+
+    def flush(self):
+        pass
+
+class LocalBackend:
+    def __init__(self, config: Config):
+        """
+        Initializes the local backend: one LocalVectorIndex directory per namespace under
+        Config.local_index_path.
+        """
+        self.config = config
+        self.namespaces: Dict[str, "LocalVectorIndex"] = {}
+        self.lock = threading.Lock()
+
+    def _namespace(self, namespace: str):
+        from local_vector_index import LocalVectorIndex
+        with self.lock:
+            if namespace not in self.namespaces:
+                self.namespaces[namespace] = LocalVectorIndex(
+                    self.config.local_index_path / (namespace or "_default"),
+                    ann=self.config.local_ann,
+                    ann_min_vectors=self.config.local_ann_min_vectors,
+                    nprobe=self.config.local_ann_nprobe,
+                )
+            return self.namespaces[namespace]
+
+    def upsert(self, ids, vectors, metadata_list, namespace=''):
+        self._namespace(namespace).upsert(ids, vectors, metadata_list)
+
+    def delete(self, ids, namespace=''):
+        self._namespace(namespace).delete(ids)
+
+    def query(self, vector, top_k=5, namespace='', filter=None):
+        return self._namespace(namespace).query(vector, top_k=top_k, filter=filter)
+
+    def query_many(self, vectors, top_k=5, namespace='', filter=None):
+        return self._namespace(namespace).query_many(vectors, top_k=top_k, filter=filter)
+
+    def update_metadata(self, ids, metadata_list, namespace=''):
+        self._namespace(namespace).update_metadata(ids, metadata_list)
+
+    def fetch_metadata(self, ids, namespace=''):
+        return self._namespace(namespace).fetch_metadata(ids)
+
+    def matching_ids(self, filter, namespace=''):
+        return self._namespace(namespace).matching_ids(filter)
+
+    def _signature_path(self):
+        return self.config.local_index_path / "embedding.json"
+
+    def embedding_signature(self) -> Optional[dict]:
+        """
+        Returns the embedding provider and dimension recorded when the index was first written.
+        """
+        try:
+            with open(self._signature_path(), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def set_embedding_signature(self, signature: dict) -> None:
+        self.config.local_index_path.mkdir(parents=True, exist_ok=True)
+        with open(self._signature_path(), "w", encoding="utf-8") as file:
+            json.dump(signature, file)
+
+    def refresh(self, namespace=''):
+        self._namespace(namespace).refresh()
+
+    def generation(self, namespace=''):
+        """
+        Returns the namespace's generation as of its last flush or refresh, recorded in its meta.json.
+        """
+        return self._namespace(namespace).generation
+
+    def flush(self):
+        for index in list(self.namespaces.values()):
+            index.flush()
+
+BACKENDS = {"pinecone": PineconeBackend, "local": LocalBackend}
+
+class EmbeddingMismatchError(ValueError):
+    """
+    Raised when the index was built with a different embedding provider or dimension.
+    """
+
+# Errors that retrying cannot fix, such as a dimension mismatch.
+PERMANENT_ERRORS = (ValueError, TypeError, KeyError)
+
+def estimate_vector_bytes(vector_id, vector, metadata) -> int:
+    """
+    Roughly estimates the serialized request size of one vector, as JSON.
+    """
+    return len(vector_id) + len(vector) * 12 + len(json.dumps(metadata, default=str)) + 32
+
+def split_batches(ids, vectors, metadata_list, max_vectors: int, max_bytes: int) -> List[tuple]:
+    """
+    Splits parallel id/vector/metadata lists into batches under both the count and byte limits.
+    """
+    batches = []
+    start = 0
+    size = 0
+    for i, (vector_id, vector, metadata) in enumerate(zip(ids, vectors, metadata_list)):
+        item_bytes = estimate_vector_bytes(vector_id, vector, metadata)
+        if i > start and (i - start >= max_vectors or size + item_bytes > max_bytes):
+            batches.append((ids[start:i], vectors[start:i], metadata_list[start:i]))
+            start, size = i, 0
+        size += item_bytes
+    if start < len(ids):
+        batches.append((ids[start:], vectors[start:], metadata_list[start:]))
+    return batches
+
 class VectorStore:
-    def __init__(self):
+    # Write counters per namespace, shared by every VectorStore in the process so that caches
+    # keyed on index_version() are invalidated by any writer in it, e.g. DocumentProcessor.
+    # Writers in other processes are seen through the backend's persisted generation.
+    _namespace_versions: Dict[str, int] = {}
+    _versions_lock = threading.Lock()
+
+    def __init__(self, config: Optional[Config] = None):
+        """
+        Initializes the VectorStore with the backend selected by Config.vector_backend:
+        Pinecone, or a local memory-mapped index (the default when no Pinecone key is set).
+        """
+        self.config = config or Config.load_default()
+        self.backend = BACKENDS[self.config.vector_backend](self.config)
+        self.executor = ThreadPoolExecutor(max_workers=self.config.upsert_workers, thread_name_prefix="upsert")
+        self.stats_lock = threading.Lock()
+        self.upserted_vectors = 0
+        self.upsert_batches = 0
+        self.upsert_retries = 0
+        self.first_upsert_start: Optional[float] = None
+        self.last_upsert_end: Optional[float] = None
+        logging.info(f"VectorStore using '{self.config.vector_backend}' backend")
+
+    def _with_retries(self, func, *args, **kwargs):
+        """
+        Calls func, retrying transient errors with exponential backoff and jitter.
+        """
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except PERMANENT_ERRORS:
+                raise
+            except Exception as e:
+                if attempt >= self.config.upsert_max_retries:
+                    raise
+                delay = self.config.upsert_backoff_seconds * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                with self.stats_lock:
+                    self.upsert_retries += 1
+                logging.warning(f"Vector store call failed ({e}), retry {attempt}/{self.config.upsert_max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def upsert_vectors(self, vectors, ids, metadata_list, namespace=''):
         """
-        Initializes the VectorStore with Pinecone configuration.
+        Upserts vectors with their metadata into the index.
+
+        The vectors are split into batches of at most Config.upsert_batch_size vectors and
+        Config.upsert_max_bytes estimated request bytes, which are submitted in parallel on a
+        pool of Config.upsert_workers threads, each retried on transient errors.
+        """
+        if not vectors:
+            return
+        start = time.perf_counter()
+        batches = split_batches(
+            list(ids), list(vectors), list(metadata_list),
+            self.config.upsert_batch_size, self.config.upsert_max_bytes
+        )
+        futures = [
+            self.executor.submit(self._with_retries, self.backend.upsert, *batch, namespace=namespace)
+            for batch in batches
+        ]
+        for future in futures:
+            future.result()
+        end = time.perf_counter()
+        with self.stats_lock:
+            self.upserted_vectors += len(vectors)
+            self.upsert_batches += len(batches)
+            if self.first_upsert_start is None:
+                self.first_upsert_start = start
+            self.last_upsert_end = end
+        self._bump_version(namespace)
+        logging.info(f"Successfully upserted {len(vectors)} vectors in {len(batches)} batches")
+
+    def delete_vectors(self, ids, namespace=''):
         """
-        self.config = Config.load_default()
-        pinecone.init(api_key=self.config.pinecone_api_key, environment=self.config.pinecone_environment)
-        self.index = pinecone.Index(self.config.pinecone_index_name)
+        Deletes vectors by id from the index.
+        """
+        if not ids:
+            return
+        ids = list(ids)
+        batch_size = self.config.upsert_batch_size
+        for start in range(0, len(ids), batch_size):
+            self._with_retries(self.backend.delete, ids[start:start + batch_size], namespace=namespace)
+        self._bump_version(namespace)
+        logging.info(f"Successfully deleted {len(ids)} vectors")
 
-    def upsert_vectors(self, vectors, ids, metadata_list):
+    def update_metadata(self, ids, metadata_list, namespace=''):
         """
-        Upserts vectors with their metadata into the Pinecone index.
+        Replaces the metadata of existing vectors without re-sending the vectors, e.g. when a
+        chunk only moved within its file.
         """
-        vec_list = list(zip(ids, vectors, metadata_list))
-        self.index.upsert(vectors=vec_list, namespace='')
-        logging.info(f"Successfully upserted {len(vectors)} vectors")
+        if not ids:
+            return
+        ids, metadata_list = list(ids), list(metadata_list)
+        batch_size = self.config.upsert_batch_size
+        for start in range(0, len(ids), batch_size):
+            self._with_retries(
+                self.backend.update_metadata, ids[start:start + batch_size], metadata_list[start:start + batch_size],
+                namespace=namespace
+            )
+        self._bump_version(namespace)
+        logging.info(f"Successfully updated metadata of {len(ids)} vectors")
 
-    async def query_vectors(self, query_vector, top_k=5, namespace=''):
+    def check_embedding(self, fingerprint: str, dimension: int, writer: bool = False) -> None:
         """
-        Queries the Pinecone index for vectors similar to the query vector.
+        Verifies that vectors from the given embedding provider belong in this index.
+
+        An index with no recorded signature adopts this one. A different dimension is always
+        an error. A different provider of the same dimension is an error for readers; a writer
+        (the indexer, whose manifest already re-embeds every file after a model change) takes
+        the index over and re-records the signature.
+
+        Raises:
+            EmbeddingMismatchError: If the index and the provider are incompatible.
         """
-        results = await self.index.query(vector=query_vector, top_k=top_k, namespace=namespace)
+        signature = {"provider": fingerprint, "dimension": dimension}
+        stored = self.backend.embedding_signature()
+        if stored is None:
+            self.backend.set_embedding_signature(signature)
+            return
+        if stored.get("dimension") not in (None, dimension):
+            raise EmbeddingMismatchError(
+                f"Index holds {stored['dimension']}-dimensional vectors but '{fingerprint}' produces {dimension}; "
+                f"rebuild the index or switch back to the provider that built it."
+            )
+        if stored.get("provider") not in (None, fingerprint):
+            if not writer:
+                raise EmbeddingMismatchError(
+                    f"Index was built with '{stored['provider']}' but queries use '{fingerprint}'."
+                )
+            logging.warning(f"Re-indexing with '{fingerprint}' over vectors from '{stored['provider']}'.")
+            self.backend.set_embedding_signature(signature)
+
+    @classmethod
+    def _bump_version(cls, namespace: str) -> None:
+        with cls._versions_lock:
+            cls._namespace_versions[namespace] = cls._namespace_versions.get(namespace, 0) + 1
+
+    def index_version(self, namespace: str = '') -> tuple:
+        """
+        Returns a key that changes whenever vectors in the namespace are written in this
+        process, or, with the local backend, flushed by another process and picked up by
+        refresh(). Pinecone has no such generation, so other writers are only seen once
+        cached results expire.
+        """
+        with self._versions_lock:
+            written = self._namespace_versions.get(namespace, 0)
+        return written, self.backend.generation(namespace)
+
+    def refresh(self, namespace: str = '') -> None:
+        """
+        Reloads the namespace if another process flushed newer vectors into it (local backend
+        only). May read the index from disk, so async callers run it in an executor.
+        """
+        self.backend.refresh(namespace)
+
+    def throughput_report(self) -> dict:
+        """
+        Summarizes upsert throughput for this run, from the first upsert to the last.
+        """
+        with self.stats_lock:
+            elapsed = 0.0
+            if self.first_upsert_start is not None:
+                elapsed = self.last_upsert_end - self.first_upsert_start
+            return {
+                "vectors": self.upserted_vectors,
+                "batches": self.upsert_batches,
+                "retries": self.upsert_retries,
+                "seconds": round(elapsed, 3),
+                "vectors_per_second": round(self.upserted_vectors / elapsed, 1) if elapsed > 0 else 0.0,
+            }
+
+    async def query_vectors(self, query_vector, top_k=5, namespace='', filter=None):
+        """
+        Queries the index for vectors similar to the query vector.
+
+        The backend clients are blocking, so the call runs on the default executor. A filter
+        (Pinecone's metadata filter syntax, see metadata_filter.py) restricts the search to
+        matching vectors before the top_k are taken.
+        """
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            None, functools.partial(self.backend.query, query_vector, top_k=top_k, namespace=namespace, filter=filter)
+        )
         logging.info(f"Successfully queried vectors, found {len(results['matches'])} matches")
-        return results
\ No newline at end of file
+        return results
+
+    async def query_many(self, query_vectors, top_k=5, namespace='', filter=None):
+        """
+        Queries the index with several vectors in one executor call.
+        """
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            None, functools.partial(
+                self.backend.query_many, query_vectors, top_k=top_k, namespace=namespace, filter=filter
+            )
+        )
+        logging.info(f"Successfully ran {len(results)} queries")
+        return results
+
+    async def fetch_metadata(self, ids, namespace=''):
+        """
+        Returns {id: metadata} for the given vector ids, e.g. for matches found by another index.
+        """
+        if not ids:
+            return {}
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.backend.fetch_metadata, list(ids), namespace=namespace)
+        )
+
+    async def matching_ids(self, filter, namespace=''):
+        """
+        Returns the ids of the vectors matching a metadata filter, or None if the backend
+        cannot enumerate them (Pinecone).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.backend.matching_ids, filter, namespace=namespace)
+        )
+
+    def flush(self):
+        """
+        Persists any buffered writes (a no-op for Pinecone).
+        """
+        self.backend.flush()
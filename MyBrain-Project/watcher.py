@@ -0,0 +1,382 @@
+# watcher.py
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from config import Config
+from scanner import DirectoryScanner, ScanStatus
+
+# inotify constants from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+# A path that keeps changing is still processed after this many debounce intervals.
+MAX_DEBOUNCE_INTERVALS = 10
+
+# Called with a changed path and whether it is a directory.
+ChangeCallback = Callable[[str, bool], None]
+
+class InotifyWatcher:
+    def __init__(self, scanner: DirectoryScanner, on_change: ChangeCallback, on_overflow: Callable[[], None]):
+        """
+        Watches a directory tree with Linux inotify, called through ctypes so no extra package is needed.
+
+        Every directory that the scanner would descend into gets a watch, and directories
+        created later are watched as they appear. The inotify descriptor is read on the event
+        loop with add_reader, so events cost no polling and no thread.
+
+        Raises:
+            OSError: If inotify is unavailable or the watch limit is reached; the caller falls
+                back to polling.
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.scanner = scanner
+        self.on_change = on_change
+        self.on_overflow = on_overflow
+        self.fd = -1
+        self.watches: Dict[int, str] = {}
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(error, f"inotify_add_watch failed for {directory}: {os.strerror(error)}")
+        self.watches[wd] = directory
+
+    def _watch_tree(self, directory: str, report_files: bool) -> None:
+        """
+        Watches a directory and its subdirectories; with report_files, also reports the files
+        already inside, which may have been written before the watch existed.
+        """
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            self._add_watch(current)
+            subdirectories, files = self.scanner._list_directory(current)
+            pending.extend(subdirectories)
+            if report_files:
+                for file_path in files:
+                    self.on_change(file_path, False)
+
+    def start(self) -> None:
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1 failed: {os.strerror(error)}")
+        try:
+            self._watch_tree(str(self.scanner.root_directory), report_files=False)
+        except OSError:
+            self.stop()
+            raise
+        asyncio.get_running_loop().add_reader(self.fd, self._read_events)
+        logging.info(f"Watching {len(self.watches)} directories under {self.scanner.root_directory} with inotify")
+
+    def _read_events(self) -> None:
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                self._handle(wd, mask, os.fsdecode(name))
+
+    def _handle(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            logging.warning("inotify event queue overflowed; rescanning")
+            self.on_overflow()
+            return
+        directory = self.watches.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            del self.watches[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # The parent directory's event reports the removal.
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if name in self.scanner.ignore_folders:
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._watch_tree(path, report_files=True)
+                except OSError as e:
+                    logging.error(f"Could not watch new directory {path}: {e}")
+                    self.on_overflow()
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.on_change(path, True)
+            return
+        self.on_change(path, False)
+
+    def stop(self) -> None:
+        if self.fd >= 0:
+            try:
+                asyncio.get_running_loop().remove_reader(self.fd)
+            except RuntimeError:
+                pass
+            os.close(self.fd)
+            self.fd = -1
+        self.watches.clear()
+
+class PollingWatcher:
+    def __init__(self, scanner: DirectoryScanner, on_change: ChangeCallback, interval: float = 1.0):
+        """
+        Watches a directory tree by rescanning it every interval seconds and comparing the
+        (mtime, size) of every file against the previous scan. Works on any platform and
+        filesystem, including network mounts that do not deliver inotify events.
+        """
+        self.scanner = scanner
+        self.on_change = on_change
+        self.interval = interval
+        self.snapshot: Dict[str, Tuple[float, int]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def _scan(self) -> Tuple[Dict[str, Tuple[float, int]], bool]:
+        status = ScanStatus()
+        snapshot = {
+            str(document.path): (document.mtime, document.size) for document in self.scanner.scan_documents(status)
+        }
+        return snapshot, status.incomplete
+
+    async def _poll(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            snapshot, incomplete = await loop.run_in_executor(None, self._scan)
+            for path, signature in snapshot.items():
+                if self.snapshot.get(path) != signature:
+                    self.on_change(path, False)
+            if not incomplete:
+                for path in self.snapshot.keys() - snapshot.keys():
+                    self.on_change(path, False)
+            self.snapshot = snapshot
+
+    async def start_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.snapshot, _ = await loop.run_in_executor(None, self._scan)
+        self.task = asyncio.create_task(self._poll())
+        logging.info(f"Watching {len(self.snapshot)} files under {self.scanner.root_directory} by polling every {self.interval}s")
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+class WatchService:
+    def __init__(self, processor, scanner: DirectoryScanner, config: Optional[Config] = None):
+        """
+        Keeps the index up to date while notes are edited, until cancelled.
+
+        File events (inotify where available, otherwise polling, per Config.watch_backend)
+        mark paths as pending. Each path waits Config.watch_debounce_ms after its last event,
+        so a burst of saves collapses into one reindex; repeated events for a path only move
+        its deadline, up to a cap so a constantly rewritten file is still picked up. Due
+        paths are reindexed through the processor, whose manifest skips files whose content
+        did not change, or removed from the index if they no longer exist. The vector store,
+        lexical index and manifest are saved at most every Config.watch_save_interval_seconds.
+
+        Parameters:
+            processor (DocumentProcessor): Indexes and removes files.
+            scanner (DirectoryScanner): Supplies the root, extensions and ignored folders.
+            config (Config, optional): Defaults to Config.load_default().
+        """
+        self.processor = processor
+        self.scanner = scanner
+        self.config = config or Config.load_default()
+        self.root = str(scanner.root_directory)
+        self.debounce = self.config.watch_debounce_ms / 1000
+        self.pending: Dict[str, float] = {}
+        self.first_event: Dict[str, float] = {}
+        self.wakeup = asyncio.Event()
+        self.watcher = None
+        self.last_save = time.monotonic()
+        self.unsaved = False
+        self.processed = 0
+        self.rescan: Optional[asyncio.Task] = None
+        self.rescan_again = False
+
+    def _wanted(self, path: str) -> bool:
+        if os.path.splitext(path)[1].lower() not in self.scanner.allowed_extensions:
+            return False
+        relative = os.path.relpath(path, self.root)
+        return not any(part in self.scanner.ignore_folders for part in Path(relative).parts[:-1])
+
+    def _mark(self, path: str) -> None:
+        now = time.monotonic()
+        first = self.first_event.setdefault(path, now)
+        self.pending[path] = min(now + self.debounce, first + self.debounce * MAX_DEBOUNCE_INTERVALS)
+        self.wakeup.set()
+
+    def on_change(self, path: str, is_dir: bool = False) -> None:
+        """
+        Records an event for a file, or for every indexed file under a removed directory.
+        """
+        if is_dir:
+            prefix = path.rstrip(os.sep) + os.sep
+            for indexed in list(self.processor.manifest.entries):
+                if indexed.startswith(prefix):
+                    self._mark(indexed)
+        elif self._wanted(path):
+            self._mark(path)
+
+    def on_overflow(self) -> None:
+        """
+        Events were lost: re-check every file on disk and every file in the manifest.
+
+        The directory walk runs in the background; overflows while it runs are coalesced into
+        one more walk after it, so a burst of overflows does not start a walk each.
+        """
+        if self.rescan is not None:
+            self.rescan_again = True
+            return
+        self.rescan = asyncio.ensure_future(self._rescan())
+
+    async def _rescan(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self.rescan_again = False
+                paths = await loop.run_in_executor(
+                    None, lambda: [str(document.path) for document in self.scanner.scan_documents()]
+                )
+                for path in paths + list(self.processor.manifest.entries):
+                    self._mark(path)
+                if not self.rescan_again:
+                    break
+        except Exception as e:
+            logging.error(f"Rescan after an inotify overflow failed: {e}")
+        finally:
+            self.rescan = None
+
+    async def start(self) -> None:
+        """
+        Starts listening for events. Call it before any initial scan so no edit is missed.
+        """
+        backend = self.config.watch_backend
+        if backend in ("auto", "inotify"):
+            try:
+                watcher = InotifyWatcher(self.scanner, self.on_change, self.on_overflow)
+                watcher.start()
+                self.watcher = watcher
+                return
+            except OSError as e:
+                if backend == "inotify":
+                    raise
+                logging.warning(f"inotify unavailable ({e}); falling back to polling")
+        watcher = PollingWatcher(self.scanner, self.on_change, self.config.watch_poll_seconds)
+        await watcher.start_async()
+        self.watcher = watcher
+
+    async def _process(self, path: str) -> dict:
+        if os.path.isfile(path):
+            return await self.processor.validate_and_process_file(Path(path))
+        if path in self.processor.manifest.entries:
+            loop = asyncio.get_running_loop()
+            deleted = await loop.run_in_executor(None, self.processor.remove_file, path)
+            return {"status": "removed", "file_path": path, "chunks_deleted": deleted}
+        return {"status": "skipped", "file_path": path}
+
+    async def process_due(self) -> list:
+        """
+        Reindexes or removes every pending path whose debounce deadline has passed.
+        """
+        now = time.monotonic()
+        due = [path for path, deadline in self.pending.items() if deadline <= now]
+        if not due:
+            return []
+        started = {path: self.first_event.pop(path) for path in due}
+        for path in due:
+            del self.pending[path]
+        semaphore = asyncio.Semaphore(self.config.ingest_workers)
+
+        async def process(path: str) -> dict:
+            async with semaphore:
+                return await self._process(path)
+
+        results = await asyncio.gather(*(process(path) for path in due))
+        for result in results:
+            latency = time.monotonic() - started[result["file_path"]]
+            logging.info(f"Watch: {result['status']} {result['file_path']} {latency * 1000:.0f}ms after its first event")
+            if result["status"] != "skipped":
+                self.unsaved = True
+        self.processed += len(results)
+        if self.unsaved and time.monotonic() - self.last_save >= self.config.watch_save_interval_seconds:
+            await self.save()
+        return results
+
+    async def save(self) -> None:
+        """
+        Persists the vector store, lexical index and manifest, off the event loop, if anything
+        changed since the last save.
+        """
+        if self.unsaved:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.processor.save_manifest)
+            self.unsaved = False
+        self.last_save = time.monotonic()
+
+    async def run(self) -> None:
+        """
+        Processes events until cancelled, then stops the watcher and saves.
+        """
+        if self.watcher is None:
+            await self.start()
+        try:
+            while True:
+                await self.process_due()
+                if self.pending:
+                    timeout = max(0.0, min(self.pending.values()) - time.monotonic())
+                elif self.unsaved:
+                    timeout = max(0.0, self.last_save + self.config.watch_save_interval_seconds - time.monotonic())
+                else:
+                    timeout = None
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    if not self.pending and self.unsaved:
+                        await self.save()
+        finally:
+            self.stop()
+            await self.save()
+
+    def stop(self) -> None:
+        if self.rescan is not None:
+            self.rescan.cancel()
+            self.rescan = None
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None